@@ -0,0 +1,69 @@
+"""
+Agent that generates several document sections with a single completion.
+The model answers with a JSON object holding one key per template slot, so the project context and the
+per-request overhead are paid once instead of once per section.
+"""
+import json
+from app.utils import ai_clients
+from app.models.request_models import DocumentRequest
+
+# What each template slot should contain, phrased for the combined prompt.
+SECTION_INSTRUCTIONS = {
+    "header_content": (
+        "An introductory section for the pre-application review document summarizing the project name, "
+        "type, location and meeting date, as a short paragraph wrapped in a <p> tag."
+    ),
+    "zoning_content": (
+        "A 'Zoning' section with two subsections: the zoning classification and requirements for this project, "
+        "and any special zoning considerations or exceptions. Format each subsection as an HTML "
+        "<div class=\"subsection\"> with a <h4 class=\"subsection-title\"> followed by a paragraph."
+    ),
+    "commercial_standards_content": (
+        "A brief summary of key commercial development standards (e.g., building codes, occupancy requirements) "
+        "as a short HTML paragraph."
+    ),
+    "general_standards_content": (
+        "A 'General Standards' section with two subsections on general development standards (for example, "
+        "building height restrictions and parking requirements). Format each subsection as an HTML "
+        "<div class=\"subsection\"> with a <h4 class=\"subsection-title\"> and a brief explanation."
+    ),
+}
+
+async def generate_sections(request: DocumentRequest, slots: list[str]) -> dict[str, str]:
+    """
+    Generate the requested sections with one JSON-mode completion.
+    :param request: The document request context (project info).
+    :param slots: Template slots to generate (must be keys of SECTION_INSTRUCTIONS).
+    :return: Mapping of slot to HTML content for every key the model returned as a non-empty string.
+             Missing or invalid keys are left out so the caller can fall back to per-section agents.
+    """
+    slots = [slot for slot in slots if slot in SECTION_INSTRUCTIONS]
+    if not slots:
+        return {}
+    location = request.location or "the specified location"
+    meeting_date = request.meeting_date.strftime("%B %d, %Y")
+    # System prompt combining the roles of the individual agents.
+    system_prompt = (
+        "You are a highly skilled report writer with expertise in urban planning and building codes. "
+        "You write sections of pre-application review documents and answer with a single JSON object."
+    )
+    # One instruction per requested key; every value must be an HTML fragment string.
+    keys = "\n".join(f'- "{slot}": {SECTION_INSTRUCTIONS[slot]}' for slot in slots)
+    user_prompt = (
+        f"The project is a {request.project_type} project named '{request.project_name}', located at {location}. "
+        f"The pre-application meeting took place on {meeting_date}.\n"
+        "Return a JSON object with exactly these keys, each holding an HTML fragment string:\n"
+        f"{keys}"
+    )
+    raw = await ai_clients.generate_content(system_prompt, user_prompt, response_format={"type": "json_object"})
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        slot: data[slot].strip()
+        for slot in slots
+        if isinstance(data.get(slot), str) and data[slot].strip()
+    }
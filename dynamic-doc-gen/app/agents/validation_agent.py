@@ -2,7 +2,34 @@
 Agent responsible for post-processing and validating the assembled HTML document.
 Ensures the AI-generated content adheres to expected format and is safe.
 """
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlparse
 from bs4 import BeautifulSoup
+from app.utils import metrics
+
+# Tags kept by the streaming sanitizer; any other tag is dropped but its text content is kept.
+ALLOWED_TAGS = frozenset({
+    "a", "abbr", "b", "blockquote", "br", "caption", "code", "dd", "div", "dl", "dt", "em",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "li", "ol", "p", "pre", "section", "small",
+    "span", "strong", "sub", "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+})
+# Tags removed together with everything inside them.
+DROPPED_CONTENT_TAGS = frozenset({
+    "script", "style", "iframe", "object", "embed", "template", "noscript", "svg", "math",
+})
+# Tags that never have content or a closing tag.
+VOID_TAGS = frozenset({"br", "hr", "img", "wbr"})
+# Attributes kept on allowed tags (inline styles and event handlers are always removed).
+ALLOWED_ATTRIBUTES = frozenset({"class", "id", "title", "href", "colspan", "rowspan", "abbr", "scope"})
+# URL schemes accepted in href attributes (an empty scheme means a relative link or fragment).
+ALLOWED_URL_SCHEMES = frozenset({"", "http", "https", "mailto"})
+
+# Validation modes: "stream" is the single-pass tokenizer, "reference" the BeautifulSoup implementation.
+VALIDATION_MODE = os.getenv("VALIDATION_MODE", "stream")
 
 def validate_document(html_doc: str) -> str:
     """
@@ -40,3 +67,203 @@ def validate_document(html_doc: str) -> str:
         # Reattach DOCTYPE if it was originally present but got removed during parsing.
         cleaned_html = "<!DOCTYPE html>\n" + cleaned_html
     return cleaned_html
+
+def _validate_section_reference(html_fragment: str) -> str:
+    """
+    Reference implementation of validate_section built on a full BeautifulSoup tree.
+    Kept for equivalence testing of the streaming sanitizer.
+    """
+    soup = BeautifulSoup(html_fragment, "html.parser")
+    # Remove any script tags for security.
+    for script in soup.find_all("script"):
+        script.decompose()
+    # The fragment is the content of an AI section, so every element loses its inline style.
+    for elem in soup.find_all():
+        if elem.has_attr("style"):
+            del elem["style"]
+    # Ensure each subsection has a title.
+    for subsection in soup.find_all("div", class_="subsection"):
+        if not subsection.find("h4", class_="subsection-title"):
+            new_title = soup.new_tag("h4", **{"class": "subsection-title"})
+            new_title.string = "Subsection"
+            subsection.insert(0, new_title)
+    return str(soup)
+
+def _format_attribute(name: str, value: str) -> str:
+    """
+    Serialize one attribute the way BeautifulSoup does (minimal escaping, quote choice by content).
+    """
+    value = value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    if '"' in value:
+        if "'" not in value:
+            return f" {name}='{value}'"
+        value = value.replace('"', "&quot;")
+    return f' {name}="{value}"'
+
+class _SectionSanitizer(HTMLParser):
+    """
+    Single-pass sanitizer: tokenizes the fragment and writes allowed output as it goes.
+    Missing subsection titles are filled into a reserved slot right after the subsection's opening tag
+    once its closing tag shows no title was present, so no tree is ever built.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: list[str] = []
+        # Stack of open allowed tags: (tag name, index of the title slot in out or None).
+        self.open_tags: list[tuple[str, int | None]] = []
+        # Title slots of the subsections currently open, mapped to whether a title was seen.
+        self.subsection_titles: dict[int, bool] = {}
+        # Depth of nested tags whose content is being dropped (e.g., inside <script>).
+        self.drop_depth = 0
+        self.drop_tag: str | None = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.drop_depth:
+            if tag == self.drop_tag:
+                self.drop_depth += 1
+            return
+        if tag in DROPPED_CONTENT_TAGS:
+            self.drop_depth, self.drop_tag = 1, tag
+            return
+        if tag not in ALLOWED_TAGS:
+            # Unwrap unknown tags: their children are still processed.
+            return
+        kept = []
+        classes: list[str] = []
+        for name, value in attrs:
+            if name not in ALLOWED_ATTRIBUTES:
+                continue
+            value = value or ""
+            if name == "class":
+                classes = value.split()
+                value = " ".join(classes)
+            elif name == "href" and urlparse(value.strip()).scheme.lower() not in ALLOWED_URL_SCHEMES:
+                continue
+            kept.append(_format_attribute(name, value))
+        if tag == "h4" and "subsection-title" in classes:
+            # A title anywhere inside a subsection satisfies it (and every enclosing subsection).
+            for slot in self.subsection_titles:
+                self.subsection_titles[slot] = True
+        if tag in VOID_TAGS:
+            self.out.append(f"<{tag}{''.join(kept)}/>")
+            return
+        self.out.append(f"<{tag}{''.join(kept)}>")
+        title_slot = None
+        if tag == "div" and "subsection" in classes:
+            # Reserve a slot for a title that may have to be inserted later.
+            title_slot = len(self.out)
+            self.out.append("")
+            self.subsection_titles[title_slot] = False
+        self.open_tags.append((tag, title_slot))
+
+    def handle_startendtag(self, tag, attrs):
+        # A self-closing tag has no content, so a dropped one needs no further handling.
+        if self.drop_depth or tag in DROPPED_CONTENT_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag in ALLOWED_TAGS and tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.drop_depth:
+            if tag == self.drop_tag:
+                self.drop_depth -= 1
+            return
+        if not any(open_tag == tag for open_tag, _ in self.open_tags):
+            # Stray closing tag (or closing an unwrapped tag): drop it.
+            return
+        # Close implicitly everything opened after the matching tag.
+        while self.open_tags:
+            open_tag, title_slot = self.open_tags.pop()
+            self._close(open_tag, title_slot)
+            if open_tag == tag:
+                break
+
+    def _close(self, tag: str, title_slot: int | None):
+        if title_slot is not None and not self.subsection_titles.pop(title_slot):
+            self.out[title_slot] = '<h4 class="subsection-title">Subsection</h4>'
+        self.out.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if not self.drop_depth:
+            self.out.append(escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        # Close any elements left open at the end of the fragment.
+        while self.open_tags:
+            self._close(*self.open_tags.pop())
+
+    # Comments, doctype declarations and processing instructions are dropped (handlers not overridden).
+
+def sanitize_section(html_fragment: str) -> str:
+    """
+    Sanitize an AI-generated section in one streaming pass over its tokens.
+    Only allow-listed tags and attributes are kept, script-like tags are removed with their content,
+    inline styles are stripped and subsections without a title get a default one.
+    """
+    parser = _SectionSanitizer()
+    parser.feed(html_fragment)
+    parser.close()
+    return "".join(parser.out)
+
+def validate_section(html_fragment: str, mode: str | None = None) -> str:
+    """
+    Validate and sanitize a single AI-generated section before it is inserted into the template.
+    Applies the same rules as validate_document, treating the whole fragment as dynamic content,
+    so the static template never has to be parsed.
+    :param html_fragment: The HTML content produced by one agent.
+    :param mode: "stream" (default, see sanitize_section) or "reference" (BeautifulSoup implementation).
+    :return: A sanitized HTML fragment.
+    """
+    if (mode or VALIDATION_MODE) == "reference":
+        return _validate_section_reference(html_fragment)
+    return sanitize_section(html_fragment)
+
+def validate_sections(sections: dict[str, str], mode: str | None = None) -> dict[str, str]:
+    """
+    Validate several sections at once (one worker round-trip per document).
+    """
+    return {slot: validate_section(content, mode) for slot, content in sections.items()}
+
+# Worker pool used to keep CPU-bound validation off the event loop.
+_executor: Executor | None = None
+
+def _get_executor() -> Executor | None:
+    """
+    Create the validation worker pool on first use, as configured by the environment.
+    - VALIDATION_EXECUTOR: "thread" (default), "process" or "inline" (run on the event loop).
+    - VALIDATION_WORKERS: number of workers (defaults to the CPU count).
+    """
+    global _executor
+    kind = os.getenv("VALIDATION_EXECUTOR", "thread")
+    if kind == "inline":
+        return None
+    if _executor is None:
+        workers = int(os.getenv("VALIDATION_WORKERS", "0")) or os.cpu_count() or 1
+        if kind == "process":
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="validation")
+    return _executor
+
+async def validate_sections_async(sections: dict[str, str], mode: str | None = None) -> dict[str, str]:
+    """
+    Validate sections in the worker pool so a large document does not stall other requests.
+    """
+    executor = _get_executor()
+    with metrics.span("validation"):
+        if executor is None:
+            return validate_sections(sections, mode)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, validate_sections, sections, mode)
+
+def shutdown_executor() -> None:
+    """
+    Shut down the validation worker pool (called at application shutdown).
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
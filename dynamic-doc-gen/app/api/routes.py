@@ -1,54 +1,416 @@
 """
 API routes for document generation and retrieval.
 """
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 import asyncio
+import os
 import uuid
-from app.models.request_models import DocumentRequest
-from app.services import orchestrator
+from app.models.request_models import DocumentRequest, DocumentUpdate
+from app.services import batch, generation_profiles, notifications, orchestrator, streaming
+from app.services.generation_stats import generation_stats
+from app.services.job_queue import FAILED, create_job_queue
+from app.services.result_store import create_result_store
+from app.services.scheduler import JobScheduler, QueueFullError
+from app.services.section_store import section_store
+from app.utils import metrics
 router = APIRouter()
 
-# In-memory store for results of document generation tasks.
-# Keys are document IDs (UUID), values are the final HTML content or None if not ready.
-results_store: dict[str, str | None] = {}
+# Store for results of document generation tasks (bounded, compressed; backend chosen by environment).
+# Keys are document IDs (UUID); entries are pending until the final HTML content is stored.
+results_store = create_result_store()
+
+# Admission control: bounded queue and a fixed number of concurrent generations.
+scheduler = JobScheduler.from_env()
+
+# With JOB_BACKEND=queue, documents are queued in a durable SQLite queue and generated by separate
+# worker processes (python -m app.worker) instead of the in-process scheduler.
+job_queue = create_job_queue()
+
+# Documents currently being generated, keyed by request hash and orchestration mode (orchestrator.flight_key),
+# so duplicate submissions share one document.
+inflight_documents: dict[str, str] = {}
+
+# Longest accepted ?wait= for GET /document, and how often a waiting request re-checks the shared store when
+# documents are generated by worker processes (which cannot wake waiters in this process).
+LONG_POLL_MAX = float(os.getenv("LONG_POLL_MAX", "60"))
+LONG_POLL_INTERVAL = float(os.getenv("LONG_POLL_INTERVAL", "0.5"))
+
+# Scheduler and store state exposed at GET /metrics.
+metrics.registry.gauge("docgen_queue_length", "Documents waiting in the scheduler queue", lambda: _jobs().queue_length)
+metrics.registry.gauge("docgen_running_documents", "Documents being generated", lambda: _jobs().running_count)
+metrics.registry.gauge("docgen_inflight_documents", "Distinct requests being generated", lambda: len(inflight_documents))
+
+def _jobs():
+    """
+    Return whichever of the durable queue and the in-process scheduler runs the documents.
+    """
+    return job_queue if job_queue is not None else scheduler
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check an If-None-Match header against the document's entity tag.
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Weak comparison is allowed for If-None-Match.
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def _accepts_gzip(accept_encoding: str | None) -> bool:
+    """
+    Check whether the client accepts gzip-encoded responses.
+    """
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            # "gzip;q=0" explicitly refuses the encoding.
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+async def _check_callback(request: DocumentRequest) -> None:
+    """
+    Reject a request whose callback_url must not receive webhooks (see notifications.check_callback_url) with 422.
+    """
+    if request.callback_url:
+        try:
+            await notifications.check_callback_url(request.callback_url)
+        except notifications.CallbackURLError as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
 
 @router.post("/generate")
-async def generate_document(request: DocumentRequest):
+async def generate_document(request: DocumentRequest, priority: int = Query(0, ge=-10, le=10),
+                            coalesce: bool = Query(True)):
     """
     Initiate the document generation process.
-    Launches an asynchronous background task to generate the document sections.
-    Returns a document ID that can be used to retrieve the final document.
+    Queues the generation with the scheduler, which runs a bounded number of documents at a time.
+    Returns a document ID that can be used to retrieve the final document, and the request hash.
+    A request identical to one still being generated returns that document's ID (coalesced=true)
+    unless coalesce=false is passed.
+    If the queue is full, responds with 429 and a Retry-After header.
     """
+    await _check_callback(request)
+    # Fix the orchestration mode now, so worker processes use it too and only requests of the same mode coalesce.
+    request = orchestrator.resolve_mode(request)
+    request_hash = request.request_hash()
+    flight_key = orchestrator.flight_key(request)
+    existing = None
+    if coalesce and job_queue is None:
+        existing = inflight_documents.get(flight_key)
+    elif coalesce and not request.callback_url:
+        # Worker processes only know the callback of the request they run, so callbacks are not coalesced.
+        existing = job_queue.find_active(request_hash, request.generation_mode)
+    if existing is not None and existing in results_store:
+        # Share the document that is already being generated for the same request.
+        notifications.subscribe(existing, request.callback_url)
+        return {"document_id": existing, "request_hash": request_hash,
+                "queue_position": _jobs().position(existing), "coalesced": True}
     # Generate a unique document identifier.
     doc_id = str(uuid.uuid4())
-    # Initialize the result as None (pending).
-    results_store[doc_id] = None
+    # Register the document as pending.
+    results_store.create(doc_id)
+    # Remember the request so the document can later be regenerated incrementally (PATCH /document/{doc_id}).
+    section_store.save_request(doc_id, request)
+    if job_queue is not None:
+        # Hand the request to the worker processes through the durable queue.
+        try:
+            position = job_queue.submit(doc_id, request, priority=priority)
+        except QueueFullError as exc:
+            results_store.delete(doc_id)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many documents queued, retry later",
+                headers={"Retry-After": str(exc.retry_after)},
+            )
+        return {"document_id": doc_id, "request_hash": request_hash, "queue_position": position, "coalesced": False}
     # Define a coroutine to run the orchestrator and store result.
     async def run_and_store():
-        # Run the orchestrator to get the final document HTML.
-        html_doc = await orchestrator.generate_document(request)
-        # Store the result in the in-memory dictionary.
-        results_store[doc_id] = html_doc
-    # Schedule the background generation task without blocking the request.
-    asyncio.create_task(run_and_store())
+        try:
+            # Run the orchestrator to get the final document HTML (stage timings are tagged with doc_id).
+            with metrics.document_context(doc_id):
+                html_doc = await orchestrator.generate_document(request)
+            # Store the result in the result store.
+            results_store.put(doc_id, html_doc)
+            notifications.document_finished(doc_id, request_hash)
+        except Exception as exc:
+            # Record the failure so clients waiting for the document get an answer.
+            error = str(exc) or type(exc).__name__
+            results_store.fail(doc_id, error)
+            notifications.document_finished(doc_id, request_hash, "failed", error)
+            raise
+        finally:
+            if inflight_documents.get(flight_key) == doc_id:
+                del inflight_documents[flight_key]
+    if coalesce:
+        inflight_documents[flight_key] = doc_id
+    # Queue the background generation without blocking the request.
+    try:
+        position = scheduler.submit(doc_id, run_and_store, priority=priority)
+    except QueueFullError as exc:
+        results_store.delete(doc_id)
+        if inflight_documents.get(flight_key) == doc_id:
+            del inflight_documents[flight_key]
+        raise HTTPException(
+            status_code=429,
+            detail="Too many documents queued, retry later",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    notifications.subscribe(doc_id, request.callback_url)
     # Respond immediately with the document ID for later retrieval.
-    return {"document_id": doc_id}
+    return {"document_id": doc_id, "request_hash": request_hash, "queue_position": position, "coalesced": False}
+
+@router.post("/generate/batch")
+async def generate_batch(http_request: Request, priority: int = Query(0, ge=-10, le=10)):
+    """
+    Generate many documents in one request.
+    The body is JSONL (one DocumentRequest per line) or CSV with a header row (Content-Type: text/csv).
+    Sections that depend only on the project type are generated once per distinct type and shared.
+    Every document goes through the same admission control as POST /generate; if the queue is full when the batch
+    arrives, responds with 429 and a Retry-After header.
+    Responds with NDJSON: one line per document as it finishes (document_id, status and section statuses), then a
+    summary line with throughput and failure counts. Finished documents are available via GET /document/{doc_id}.
+    """
+    body = await http_request.body()
+    try:
+        entries = batch.parse_batch(body, http_request.headers.get("content-type"))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Batch body must be UTF-8 encoded")
+    except batch.BatchTooLargeError as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    # Records whose callback_url must not receive webhooks are reported as invalid.
+    for index, entry in enumerate(entries):
+        if isinstance(entry, DocumentRequest) and entry.callback_url:
+            try:
+                await notifications.check_callback_url(entry.callback_url)
+            except notifications.CallbackURLError as exc:
+                entries[index] = f"Invalid request: {exc}"
+    jobs = _jobs()
+    if jobs.queue_length >= jobs.max_queue:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many documents queued, retry later",
+            headers={"Retry-After": str(jobs.retry_after())},
+        )
+    chunks = batch.run_batch(entries, results_store, scheduler, job_queue, priority=priority)
+    return StreamingResponse(chunks, media_type="application/x-ndjson")
+
+@router.post("/generate/stream")
+async def stream_document(request: DocumentRequest, format: str = Query("html", pattern="^(html|sse)$"),
+                          priority: int = Query(0, ge=-10, le=10)):
+    """
+    Generate a document and stream it to the client while the agents are still running.
+    - format=html: chunked HTML in document order, starting with the static header.
+    - format=sse: Server-Sent Events with the template shell followed by each section as it completes.
+    The generation is queued with the scheduler like POST /generate (streams are always generated in this process),
+    so the stream starts once a slot is free; if the queue is full, responds with 429 and a Retry-After header.
+    The finished document is also stored and can be fetched later via GET /document/{doc_id}.
+    """
+    await _check_callback(request)
+    doc_id = str(uuid.uuid4())
+    results_store.create(doc_id)
+    section_store.save_request(doc_id, request)
+    def store(html_doc: str):
+        results_store.put(doc_id, html_doc)
+        notifications.document_finished(doc_id, request.request_hash())
+    if format == "sse":
+        chunks = streaming.stream_events(request, doc_id, store)
+        media_type = "text/event-stream"
+    else:
+        chunks = streaming.stream_html(request, store)
+        media_type = "text/html"
+    async def generate():
+        # Stage timings are tagged with doc_id.
+        with metrics.document_context(doc_id):
+            async for chunk in chunks:
+                yield chunk
+    try:
+        scheduled = streaming.run_scheduled(scheduler, doc_id, generate(), priority=priority)
+    except QueueFullError as exc:
+        results_store.delete(doc_id)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many documents queued, retry later",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    notifications.subscribe(doc_id, request.callback_url)
+    async def body():
+        try:
+            async for chunk in scheduled:
+                yield chunk
+        finally:
+            # If the client went away before the end, the document will never complete.
+            entry = results_store.get(doc_id)
+            if entry is not None and not entry.ready:
+                results_store.delete(doc_id)
+    headers = {"X-Document-ID": doc_id, "Cache-Control": "no-cache"}
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+def _status(doc_id: str, entry) -> dict:
+    """
+    Describe where a document is in its lifecycle.
+    """
+    if entry.ready:
+        status = {"document_id": doc_id, "status": "ready", "queue_position": None}
+        # Whether each section was generated fresh or filled by a fallback.
+        sections = section_store.load_document_statuses(doc_id)
+        if sections:
+            status["sections"] = sections
+        return status
+    if entry.failed:
+        return {"document_id": doc_id, "status": "failed", "queue_position": None, "error": entry.error}
+    # PATCH regenerations run on the in-process scheduler even when documents are generated by worker processes.
+    position = scheduler.position(doc_id)
+    if position is None and job_queue is not None:
+        if job_queue.status(doc_id) == FAILED:
+            return {"document_id": doc_id, "status": "failed", "queue_position": None,
+                    "error": job_queue.error(doc_id)}
+        position = job_queue.position(doc_id)
+    # Pending documents are either waiting in the scheduler queue or being generated.
+    status = "queued" if position else "running"
+    return {"document_id": doc_id, "status": status, "queue_position": position or None}
+
+async def _wait_for_document(doc_id: str, entry, timeout: float):
+    """
+    Block until the document is ready, has failed or the timeout expires, and return its latest entry.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not entry.ready and _status(doc_id, entry)["status"] != "failed":
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        # Waiters on the same document share one completion event.
+        step = min(remaining, LONG_POLL_INTERVAL) if job_queue is not None else remaining
+        await notifications.completion_events.wait(doc_id, step)
+        entry = results_store.get(doc_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Document ID not found")
+    return entry
+
+@router.get("/document/{doc_id}/status")
+async def get_document_status(doc_id: str, timings: bool = Query(False)):
+    """
+    Report the state of a document: queued (with its queue position), running, ready (with the status of
+    each section: fresh, fallback or failed) or failed.
+    With timings=true, also return the duration of every stage recorded so far
+    (queue wait, agents, LLM requests, validation, template rendering).
+    """
+    entry = results_store.get(doc_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Document ID not found")
+    status = _status(doc_id, entry)
+    if timings:
+        status["timings"] = metrics.document_timings(doc_id)
+    return status
 
 @router.get("/document/{doc_id}", response_class=HTMLResponse)
-async def get_document(doc_id: str):
+async def get_document(doc_id: str, http_request: Request, wait: float = Query(0, ge=0)):
     """
     Retrieve the generated document by ID.
     If the document is not ready yet, returns a 202 status or a message indicating it's pending.
+    If its generation failed, returns 500 with the error.
+    With wait=N, a pending document is waited for up to N seconds (at most LONG_POLL_MAX) before answering,
+    so clients can long-poll instead of polling repeatedly.
     If the ID is not found, returns 404.
+    Supports conditional requests (ETag / If-None-Match) and serves the stored gzip bytes directly
+    to clients that accept gzip.
     """
+    entry = results_store.get(doc_id)
     # Check if the provided ID exists in our store.
-    if doc_id not in results_store:
+    if entry is None:
         raise HTTPException(status_code=404, detail="Document ID not found")
+    if not entry.ready and wait > 0:
+        entry = await _wait_for_document(doc_id, entry, min(wait, LONG_POLL_MAX))
     # Check if the document is still being generated.
-    if results_store[doc_id] is None:
-        # If not ready, return a 202 Accepted status with a message.
+    if not entry.ready:
+        status = _status(doc_id, entry)
+        if status["status"] == "failed":
+            # Generation ended without a document: retrying the GET will not help.
+            return JSONResponse(status_code=500, content={"detail": "Document generation failed", **status})
+        # If not ready, return a 202 Accepted status with a message and the queue state.
         # (Client can retry after some time.)
-        raise HTTPException(status_code=202, detail="Document generation in progress")
+        return JSONResponse(status_code=202, content={"detail": "Document generation in progress", **status})
+    headers = {"ETag": entry.etag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    # The client already has this version: nothing to send.
+    if _etag_matches(http_request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    # Send the stored compressed bytes as-is when the client can decode them.
+    if _accepts_gzip(http_request.headers.get("accept-encoding")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=entry.compressed, media_type="text/html; charset=utf-8", headers=headers)
     # If we have the HTML content ready, return it as an HTMLResponse.
-    return HTMLResponse(content=results_store[doc_id], status_code=200)
+    return HTMLResponse(content=entry.html, status_code=200, headers=headers)
+
+@router.patch("/document/{doc_id}", status_code=202)
+async def update_document(doc_id: str, update: DocumentUpdate, priority: int = Query(0, ge=-10, le=10)):
+    """
+    Change request fields of a finished (or failed) document and regenerate it incrementally.
+    Only the agents of the sections whose request fields changed run again; the other sections are reused from the
+    previous generation, re-validated and re-assembled. The document keeps its ID (and gets a new ETag).
+    The regeneration is queued with the scheduler like POST /generate and the document is pending until it is done,
+    so the response (202) lists which sections are reused and which are regenerated, and the document is fetched
+    with GET /document/{doc_id} (e.g., with ?wait=). A PATCH of a document that is still being generated or
+    regenerated gets 409; if the queue is full, responds with 429 and a Retry-After header.
+    """
+    entry = results_store.get(doc_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Document ID not found")
+    if not entry.ready and not entry.failed:
+        raise HTTPException(status_code=409, detail="Document generation in progress")
+    base = section_store.load_request(doc_id)
+    if base is None:
+        raise HTTPException(status_code=404, detail="The request of this document is no longer available")
+    try:
+        request = DocumentRequest(**{**base.model_dump(), **update.model_dump(exclude_unset=True)})
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    reused, regenerated = orchestrator.plan_regeneration(base, request)
+    request_hash = request.request_hash()
+    async def regenerate_and_store():
+        try:
+            with metrics.document_context(doc_id):
+                html_doc = await orchestrator.regenerate_document(request, reused)
+            results_store.put(doc_id, html_doc)
+            section_store.save_request(doc_id, request)
+            notifications.document_finished(doc_id, request_hash)
+        except Exception as exc:
+            error = str(exc) or type(exc).__name__
+            results_store.fail(doc_id, error)
+            notifications.document_finished(doc_id, request_hash, "failed", error)
+            raise
+    # Regenerations run in this process (they reuse sections from its section store), whatever JOB_BACKEND is.
+    try:
+        position = scheduler.submit(doc_id, regenerate_and_store, priority=priority)
+    except QueueFullError as exc:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many documents queued, retry later",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    # Pending until the regeneration finishes, which also rejects concurrent PATCHes of the document.
+    results_store.create(doc_id)
+    return {"document_id": doc_id, "request_hash": request_hash, "queue_position": position,
+            "reused": list(reused), "regenerated": regenerated}
+
+@router.get("/stats/generation")
+async def get_generation_stats():
+    """
+    Per orchestration mode: documents generated, LLM calls and tokens, and p50/p99 generation latency.
+    """
+    return generation_stats.summary()
+
+@router.get("/stats/profiles")
+async def get_profile_stats():
+    """
+    Per generation profile: its model, max_tokens and temperature, the sections using it, LLM calls and tokens,
+    p50/p95/p99 section latency, and the share of sections within the profile's latency SLO.
+    """
+    return {"latency_slo_seconds": generation_profiles.PROFILE_LATENCY_SLO,
+            "profiles": generation_profiles.profile_stats.summary()}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Stage latency histograms, LLM call and token counters, and queue gauges in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
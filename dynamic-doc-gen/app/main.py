@@ -1,14 +1,50 @@
 """
 Entry point of the FastAPI application. Defines the application instance and includes API routers.
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api import routes
+from app.agents import validation_agent
+from app.services import notifications
+from app.services.result_store import MemoryResultStore
+from app.services.section_store import section_store
+from app.utils import ai_clients
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application lifecycle: create the shared LLM client, start the job scheduler,
+    and release shared resources on shutdown.
+    """
+    if routes.job_queue is not None and isinstance(routes.results_store, MemoryResultStore):
+        # Worker processes could not hand their documents back to this process.
+        raise RuntimeError("JOB_BACKEND=queue requires a shared result store: set RESULT_STORE_BACKEND=sqlite")
+    if routes.job_queue is not None and not section_store.shared:
+        # Requests and sections saved by other processes would be missing for PATCH and GET /status.
+        raise RuntimeError("JOB_BACKEND=queue requires a shared section store: set SECTION_STORE_PATH")
+    ai_clients.init_client()
+    routes.scheduler.start()
+    yield
+    # Stop the scheduler workers; queued documents are dropped with them.
+    await routes.scheduler.stop()
+    routes.inflight_documents.clear()
+    # Drop webhook deliveries that are still retrying.
+    await notifications.shutdown()
+    # Close the pooled LLM connections.
+    await ai_clients.close_client()
+    # Stop the validation worker pool.
+    validation_agent.shutdown_executor()
+    # Flush and close the result store (e.g., the SQLite connection).
+    routes.results_store.close()
+    if routes.job_queue is not None:
+        routes.job_queue.close()
 
 # Create FastAPI application
 app = FastAPI(
     title="Dynamic Document Generation API",
     description="An API for generating documents with dynamic content using multiple AI agents.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Include API routes from the routes module.
@@ -1,8 +1,14 @@
 """
 Pydantic models for request payloads.
 """
+import hashlib
+import json
 from pydantic import BaseModel, Field
 from datetime import date
+from typing import Literal
+
+# Fields that determine the generated content (and therefore the request hash).
+CONTENT_FIELDS = ("project_name", "project_type", "location", "meeting_date")
 
 class DocumentRequest(BaseModel):
     """
@@ -12,6 +18,15 @@ class DocumentRequest(BaseModel):
     project_type: str = Field("Commercial", description="Type of the project (e.g., Commercial or Residential)")
     location: str | None = Field(None, description="Location of the project")
     meeting_date: date = Field(default_factory=date.today, description="Meeting date for the review")
+    generation_mode: Literal["fanout", "consolidated"] | None = Field(
+        None, description="Orchestration mode: one completion per section (fanout) or a single JSON completion "
+                          "(consolidated); defaults to the GENERATION_MODE setting"
+    )
+    callback_url: str | None = Field(
+        None, pattern=r"^https?://",
+        description="URL that receives a POST when the document is ready or has failed (must resolve to a public "
+                    "address, or be in WEBHOOK_ALLOWED_HOSTS)"
+    )
 
     class Config:
         schema_extra = {
@@ -22,3 +37,29 @@ class DocumentRequest(BaseModel):
                 "meeting_date": "2025-04-27"
             }
         }
+
+    def request_hash(self) -> str:
+        """
+        Canonical hash of the fields that determine the document content.
+        Two requests with the same hash produce the same document, so callers can use it to deduplicate.
+        """
+        payload = {name: getattr(self, name) for name in CONTENT_FIELDS}
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class DocumentUpdate(BaseModel):
+    """
+    Schema for PATCH /document/{doc_id}: the request fields to change (omitted fields keep their value).
+    """
+    project_name: str | None = Field(None, description="New name of the project")
+    project_type: str | None = Field(None, description="New type of the project")
+    location: str | None = Field(None, description="New location of the project")
+    meeting_date: date | None = Field(None, description="New meeting date")
+    generation_mode: Literal["fanout", "consolidated"] | None = Field(None, description="Orchestration mode")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "meeting_date": "2025-05-15"
+            }
+        }
@@ -0,0 +1,205 @@
+"""
+Bulk document generation.
+A batch is planned as a whole: sections that depend only on the project type are generated once per distinct
+type and shared, every document is admitted through the same scheduler (or durable job queue) as POST /generate,
+and results are streamed back as NDJSON lines as each document finishes.
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import time
+import uuid
+from typing import AsyncIterator, Callable
+from app.models.request_models import DocumentRequest
+from app.services import notifications, orchestrator
+from app.services.job_queue import FAILED, SQLiteJobQueue
+from app.services.result_store import ResultStore
+from app.services.scheduler import JobScheduler, QueueFullError
+from app.services.section_store import section_store
+from app.utils import metrics
+
+# Maximum number of documents accepted in one batch.
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "1000"))
+
+# Number of documents of a batch queued or generated at the same time. Every document also goes through the
+# scheduler (or the durable job queue), so SCHEDULER_MAX_CONCURRENT bounds all batches and /generate jobs together.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Seconds between checks for documents generated by worker processes (JOB_BACKEND=queue).
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "0.5"))
+
+class BatchTooLargeError(Exception):
+    """
+    Raised when a batch exceeds BATCH_MAX_DOCUMENTS.
+    """
+
+def parse_batch(body: bytes, content_type: str | None) -> list[DocumentRequest | str]:
+    """
+    Parse a JSONL or CSV batch body.
+    CSV input needs a header row naming the DocumentRequest fields; empty cells use the field defaults.
+    :return: One entry per input record: the parsed request, or an error message for invalid records.
+    :raises BatchTooLargeError: If the batch has more than BATCH_MAX_DOCUMENTS records.
+    """
+    text = body.decode("utf-8-sig")
+    if "csv" in (content_type or "").lower():
+        records = [
+            {name: value for name, value in row.items() if name and value not in (None, "")}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    else:
+        records = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as exc:
+                records.append(f"Invalid JSON: {exc}")
+    if len(records) > BATCH_MAX_DOCUMENTS:
+        raise BatchTooLargeError(f"Batch has {len(records)} documents, the limit is {BATCH_MAX_DOCUMENTS}")
+    parsed: list[DocumentRequest | str] = []
+    for record in records:
+        if isinstance(record, str):
+            parsed.append(record)
+            continue
+        try:
+            parsed.append(DocumentRequest(**record))
+        except (TypeError, ValueError) as exc:
+            # Pydantic validation errors are ValueErrors; non-object JSON lines raise TypeError.
+            parsed.append(f"Invalid request: {exc}")
+    return parsed
+
+def _line(data: dict) -> str:
+    return json.dumps(data) + "\n"
+
+async def _admit(submit: Callable[[], int]) -> None:
+    """
+    Submit a job, waiting for room while the queue is full.
+    Documents of a batch already accepted are not rejected; they wait their turn like any other job.
+    """
+    while True:
+        try:
+            submit()
+            return
+        except QueueFullError as exc:
+            await asyncio.sleep(exc.retry_after)
+
+async def _wait_for_worker(doc_id: str, store: ResultStore, job_queue: SQLiteJobQueue) -> str:
+    """
+    Wait until a worker process has finished a queued document.
+    :return: The document HTML.
+    :raises RuntimeError: If the document failed.
+    """
+    while True:
+        entry = store.get(doc_id)
+        if entry is not None and entry.ready:
+            return entry.html
+        if entry is not None and entry.failed:
+            raise RuntimeError(entry.error)
+        if job_queue.status(doc_id) == FAILED:
+            raise RuntimeError(job_queue.error(doc_id))
+        await notifications.completion_events.wait(doc_id, BATCH_POLL_INTERVAL)
+
+async def run_batch(entries: list[DocumentRequest | str], store: ResultStore, scheduler: JobScheduler,
+                    job_queue: SQLiteJobQueue | None = None, concurrency: int | None = None,
+                    priority: int = 0) -> AsyncIterator[str]:
+    """
+    Generate every document of a batch and yield one NDJSON line per document as it finishes,
+    followed by a summary line with throughput and failure counts.
+    Every document is admitted like a POST /generate job: through the in-process scheduler, or through the durable
+    job queue when one is given (worker processes then generate the documents, without the shared sections).
+    :param entries: Output of parse_batch.
+    :param store: Result store the documents are written to (retrievable via GET /document/{doc_id}).
+    :param scheduler: Scheduler that runs the documents in this process.
+    :param job_queue: Durable queue of the worker processes (JOB_BACKEND=queue).
+    :param concurrency: Documents of the batch queued or generated at the same time (defaults to BATCH_CONCURRENCY).
+    :param priority: Scheduling priority of the batch's documents.
+    """
+    started = time.monotonic()
+    counts = {"documents": len(entries), "succeeded": 0, "failed": 0, "invalid": 0}
+    # Report records that could not be parsed right away.
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            counts["invalid"] += 1
+            yield _line({"index": index, "status": "invalid", "error": entry})
+    requests = [(index, entry) for index, entry in enumerate(entries) if isinstance(entry, DocumentRequest)]
+    project_types = {request.project_type for _, request in requests}
+    # Plan: one shared generation of the project-type sections per distinct project type.
+    shared: dict[str, asyncio.Task] = {}
+    if job_queue is None:
+        for _, request in requests:
+            if request.project_type not in shared:
+                shared[request.project_type] = asyncio.create_task(
+                    orchestrator.generate_project_type_sections(request)
+                )
+    # Bounds the documents of this batch in the queue, so one batch cannot fill it.
+    semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+
+    async def generate_here(doc_id: str, request: DocumentRequest) -> str:
+        precomputed = await shared[request.project_type]
+        finished = asyncio.get_running_loop().create_future()
+
+        async def job() -> None:
+            # The batch stopped waiting for this document (e.g., the client disconnected).
+            if finished.cancelled():
+                return
+            try:
+                with metrics.document_context(doc_id):
+                    html_doc = await orchestrator.generate_document(request, precomputed=precomputed)
+            except Exception as exc:
+                if not finished.cancelled():
+                    finished.set_exception(exc)
+                return
+            if not finished.cancelled():
+                finished.set_result(html_doc)
+
+        await _admit(lambda: scheduler.submit(doc_id, job, priority=priority))
+        return await finished
+
+    async def generate(index: int, request: DocumentRequest) -> dict:
+        # Worker processes generate in the mode this process would have used.
+        request = orchestrator.resolve_mode(request)
+        doc_id = str(uuid.uuid4())
+        store.create(doc_id)
+        section_store.save_request(doc_id, request)
+        try:
+            async with semaphore:
+                if job_queue is not None:
+                    # The worker stores the document and sends its notifications.
+                    await _admit(lambda: job_queue.submit(doc_id, request, priority=priority))
+                    await _wait_for_worker(doc_id, store, job_queue)
+                else:
+                    html_doc = await generate_here(doc_id, request)
+        except Exception as exc:
+            error = str(exc) or type(exc).__name__
+            if job_queue is None:
+                store.fail(doc_id, error)
+                notifications.document_finished(doc_id, request.request_hash(), "failed", error, request.callback_url)
+            return {"index": index, "document_id": doc_id, "status": "failed", "error": error}
+        if job_queue is None:
+            store.put(doc_id, html_doc)
+            notifications.document_finished(doc_id, request.request_hash(), callback_url=request.callback_url)
+        return {"index": index, "document_id": doc_id, "status": "ready", "request_hash": request.request_hash(),
+                "sections": section_store.load_document_statuses(doc_id)}
+
+    pending = {asyncio.create_task(generate(index, request)) for index, request in requests}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                counts["succeeded" if result["status"] == "ready" else "failed"] += 1
+                yield _line(result)
+    finally:
+        # Stop outstanding work if the client disconnects.
+        for task in list(pending) + list(shared.values()):
+            task.cancel()
+    elapsed = time.monotonic() - started
+    yield _line({"summary": {
+        **counts,
+        "distinct_project_types": len(project_types),
+        "elapsed_seconds": round(elapsed, 3),
+        "documents_per_second": round(counts["succeeded"] / elapsed, 3) if elapsed > 0 else None,
+    }})
@@ -0,0 +1,215 @@
+"""
+Per-section generation profiles: the model, output budget (max_tokens) and temperature a section is generated with.
+A one-paragraph introduction does not need the model and output length of a multi-subsection section, so each
+section gets its own profile. Sources, later ones overriding earlier ones:
+1. DEFAULT_PROFILES: output budgets sized to what each section is asked for (the model defaults to OPENAI_MODEL).
+2. GENERATION_PROFILES_PATH: a JSON file with named "profiles", the profile of each section ("sections") and
+   per-template assignments ("templates"); an assignment is a profile name or inline settings:
+       {"profiles": {"fast": {"model": "gpt-4o-mini", "max_tokens": 300, "latency_slo": 4}},
+        "sections": {"header_content": "fast", "zoning_content": {"max_tokens": 700}},
+        "templates": {"brief_document": {"general_standards_content": "fast"}}}
+3. SECTION_MODEL_<SLOT>, SECTION_MAX_TOKENS_<SLOT> and SECTION_TEMPERATURE_<SLOT> environment variables.
+Realized latency and token usage are recorded per profile and compared with its latency SLO (GET /stats/profiles).
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterator
+from app.services.generation_stats import GenerationStats
+from app.utils import ai_clients, metrics
+
+# Settings a profile may define.
+PROFILE_SETTINGS = ("model", "max_tokens", "temperature", "latency_slo")
+
+# Target p95 latency in seconds of one section, for profiles that do not set latency_slo.
+PROFILE_LATENCY_SLO = float(os.getenv("PROFILE_LATENCY_SLO", "10"))
+
+# Built-in output budgets per section (and for the consolidated single-call mode).
+DEFAULT_PROFILES = {
+    "header_content": {"max_tokens": 300},
+    "zoning_content": {"max_tokens": 1000},
+    "commercial_standards_content": {"max_tokens": 400},
+    "general_standards_content": {"max_tokens": 1000},
+    "consolidated": {"max_tokens": 3000},
+}
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """
+    Resolved generation settings of a section. Unset values fall back to the client defaults.
+    """
+    name: str
+    model: str | None = None
+    max_tokens: int | None = None
+    temperature: float | None = None
+    # Target p95 latency of one section in seconds (None uses PROFILE_LATENCY_SLO).
+    latency_slo: float | None = None
+
+    @property
+    def params(self) -> dict:
+        """
+        The generation parameters passed to the API.
+        """
+        params = {}
+        if self.max_tokens is not None:
+            params["max_tokens"] = self.max_tokens
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        return params
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the settings that shape the generated content (not the name or latency SLO), so stored sections
+        generated under other settings are not reused.
+        """
+        return json.dumps([self.model or ai_clients.OPENAI_MODEL, self.max_tokens, self.temperature])
+
+    @contextmanager
+    def applied(self) -> Iterator[None]:
+        """
+        Generate the completions requested inside the with-block (including tasks it starts) with this profile.
+        """
+        with ai_clients.use_params(**self.params):
+            if self.model:
+                with ai_clients.use_model(self.model):
+                    yield
+            else:
+                yield
+
+def _check_settings(settings: dict, where: str) -> dict:
+    unknown = set(settings) - set(PROFILE_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown profile setting(s) in {where}: {', '.join(sorted(unknown))}")
+    return settings
+
+class ProfileConfig:
+    """
+    Profile assignments loaded from a configuration file (see the module docstring for the format).
+    """
+
+    def __init__(self, config: dict | None = None):
+        """
+        :raises ValueError: If the configuration uses unknown settings or refers to undefined profiles.
+        """
+        config = config or {}
+        self.profiles = {
+            name: _check_settings(settings, f"profile {name}") for name, settings in config.get("profiles", {}).items()
+        }
+        self.sections = config.get("sections", {})
+        self.templates = config.get("templates", {})
+        for where, assignments in [("sections", self.sections)] + [
+            (f"template {template}", assignments) for template, assignments in self.templates.items()
+        ]:
+            for slot, assigned in assignments.items():
+                if isinstance(assigned, str):
+                    if assigned not in self.profiles:
+                        raise ValueError(f"Undefined profile {assigned!r} assigned to {slot} in {where}")
+                else:
+                    _check_settings(assigned, f"{where}, {slot}")
+
+    @classmethod
+    def from_env(cls) -> "ProfileConfig":
+        """
+        Load the file named by GENERATION_PROFILES_PATH (no file: only the defaults and environment variables).
+        """
+        path = os.getenv("GENERATION_PROFILES_PATH", "")
+        if not path:
+            return cls()
+        with open(path, encoding="utf-8") as file:
+            return cls(json.load(file))
+
+    def resolve(self, slot: str, template: str) -> GenerationProfile:
+        """
+        Return the profile a section is generated with in a template.
+        A section using a named profile reports under that name; a section with its own settings (inline in the
+        file or from environment variables) reports under its slot name.
+        """
+        name, settings = slot, dict(DEFAULT_PROFILES.get(slot, {}))
+        for assigned in (self.sections.get(slot), self.templates.get(template, {}).get(slot)):
+            if isinstance(assigned, str):
+                name, settings = assigned, dict(self.profiles[assigned])
+            elif assigned:
+                name, settings = slot, {**settings, **assigned}
+        suffix = slot.upper()
+        overrides = {
+            "model": os.getenv(f"SECTION_MODEL_{suffix}"),
+            "max_tokens": os.getenv(f"SECTION_MAX_TOKENS_{suffix}"),
+            "temperature": os.getenv(f"SECTION_TEMPERATURE_{suffix}"),
+        }
+        overrides = {key: value for key, value in overrides.items() if value}
+        if overrides:
+            name, settings = slot, {**settings, **overrides}
+        return GenerationProfile(
+            name=name,
+            model=settings.get("model") or None,
+            max_tokens=int(settings["max_tokens"]) if settings.get("max_tokens") is not None else None,
+            temperature=float(settings["temperature"]) if settings.get("temperature") is not None else None,
+            latency_slo=float(settings["latency_slo"]) if settings.get("latency_slo") is not None else None,
+        )
+
+class ProfileStats:
+    """
+    Realized latency and token usage per generation profile.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._stats = GenerationStats(window, unit="generation")
+        self._profiles: dict[str, GenerationProfile] = {}
+        self._sections: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, profile: GenerationProfile, section: str, seconds: float, usage) -> None:
+        """
+        Record one section generated with a profile.
+        :param seconds: Time until the section was available (including fallbacks).
+        :param usage: The ai_clients.UsageTotals of the section.
+        """
+        with self._lock:
+            self._profiles[profile.name] = profile
+            self._sections.setdefault(profile.name, set()).add(section)
+        self._stats.record(profile.name, seconds, usage)
+        metrics.profile_duration.observe(seconds, profile=profile.name, model=profile.model or ai_clients.OPENAI_MODEL)
+        metrics.profile_tokens.inc(usage.prompt_tokens, profile=profile.name, kind="prompt")
+        metrics.profile_tokens.inc(usage.completion_tokens, profile=profile.name, kind="completion")
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Return, per profile, its settings, the sections using it, usage and latency percentiles, and how the
+        p95 latency compares with the profile's SLO.
+        """
+        result = {}
+        for name, stats in self._stats.summary().items():
+            with self._lock:
+                profile = self._profiles[name]
+                sections = sorted(self._sections[name])
+            slo = profile.latency_slo or PROFILE_LATENCY_SLO
+            settings = {key: value for key, value in asdict(profile).items() if key not in ("name", "latency_slo")}
+            settings["model"] = settings["model"] or ai_clients.OPENAI_MODEL
+            result[name] = {
+                **settings,
+                "sections": sections,
+                **stats,
+                "latency_slo_seconds": slo,
+                "within_slo": round(self._stats.share_within(name, slo), 4),
+                "meets_slo": stats["latency_p95_seconds"] <= slo,
+            }
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+            self._sections.clear()
+        self._stats.reset()
+
+# Process-wide configuration and statistics.
+profile_config = ProfileConfig.from_env()
+profile_stats = ProfileStats()
+
+def resolve(slot: str, template: str) -> GenerationProfile:
+    """
+    Return the profile a section is generated with in a template (see ProfileConfig.resolve).
+    """
+    return profile_config.resolve(slot, template)
@@ -0,0 +1,84 @@
+"""
+Generation statistics (latency percentiles and LLM usage) used to compare orchestration modes
+and section generation profiles.
+"""
+import threading
+from collections import deque
+
+class GenerationStats:
+    """
+    Rolling record of generations, grouped by a key (the orchestration mode, or a generation profile).
+    """
+
+    def __init__(self, window: int = 1000, unit: str = "document"):
+        """
+        :param window: Number of most recent latencies kept per key for the percentiles.
+        :param unit: What one recorded generation is, used in the summary's field names.
+        """
+        self.window = window
+        self.unit = unit
+        self._latencies: dict[str, deque[float]] = {}
+        self._totals: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, mode: str, seconds: float, usage) -> None:
+        """
+        Record one generation.
+        :param mode: Orchestration mode (e.g., "fanout" or "consolidated") or another grouping key.
+        :param seconds: Wall-clock generation time.
+        :param usage: The ai_clients.UsageTotals of the generation.
+        """
+        with self._lock:
+            self._latencies.setdefault(mode, deque(maxlen=self.window)).append(seconds)
+            totals = self._totals.setdefault(mode, {
+                self.unit + "s": 0, "llm_calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            totals[self.unit + "s"] += 1
+            totals["llm_calls"] += usage.calls
+            totals["cached_calls"] += usage.cached_calls
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Return per-key totals, average tokens and calls per generation, and p50/p95/p99 latency.
+        """
+        with self._lock:
+            result = {}
+            for mode, totals in self._totals.items():
+                ordered = sorted(self._latencies[mode])
+                count = totals[self.unit + "s"]
+                tokens = totals["prompt_tokens"] + totals["completion_tokens"]
+                result[mode] = {
+                    **totals,
+                    f"llm_calls_per_{self.unit}": round(totals["llm_calls"] / count, 3),
+                    f"tokens_per_{self.unit}": round(tokens / count, 1),
+                    f"completion_tokens_per_{self.unit}": round(totals["completion_tokens"] / count, 1),
+                    "latency_p50_seconds": round(_percentile(ordered, 0.50), 4),
+                    "latency_p95_seconds": round(_percentile(ordered, 0.95), 4),
+                    "latency_p99_seconds": round(_percentile(ordered, 0.99), 4),
+                }
+            return result
+
+    def share_within(self, mode: str, seconds: float) -> float | None:
+        """
+        Return the fraction of the recent latencies of a key that were at most `seconds` (None if none recorded).
+        """
+        with self._lock:
+            latencies = self._latencies.get(mode)
+            if not latencies:
+                return None
+            return sum(1 for latency in latencies if latency <= seconds) / len(latencies)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latencies.clear()
+            self._totals.clear()
+
+def _percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# Process-wide statistics.
+generation_stats = GenerationStats()
@@ -0,0 +1,297 @@
+"""
+Durable job queue for out-of-process document generation.
+The API enqueues document requests into a local SQLite database and worker processes (app/worker.py) claim
+and run them, so jobs survive API restarts and every API process sees the same queue.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from app.models.request_models import DocumentRequest
+from app.services.scheduler import QUEUED, QueueFullError, RUNNING
+
+# Additional job states (QUEUED and RUNNING are shared with the in-process scheduler).
+DONE = "done"
+FAILED = "failed"
+
+# Error of jobs that failed because their worker stopped renewing the lease max_attempts times.
+LEASE_EXPIRED = "Worker lease expired"
+
+@dataclass
+class ClaimedJob:
+    """
+    A job handed to a worker.
+    """
+    job_id: str
+    request: DocumentRequest
+    enqueued_at: float
+    attempts: int
+    # Identifier of the claiming worker; only it may renew the lease or finish the job.
+    worker: str
+
+class SQLiteJobQueue:
+    """
+    Priority job queue stored in SQLite.
+    Claims are atomic, so any number of worker processes can drain the same queue. A running job's worker renews
+    its lease while it works; a job whose worker disappears is handed out again once its lease expires, and the
+    original worker can then no longer finish it.
+    """
+
+    def __init__(self, path: str, max_queue: int = 100, lease_seconds: float = 600.0, max_attempts: int = 3):
+        """
+        :param path: Filesystem path of the SQLite database (created if missing).
+        :param max_queue: Maximum number of queued jobs; further submissions are rejected.
+        :param lease_seconds: Seconds a claimed job may go without a lease renewal before it is considered abandoned.
+        :param max_attempts: Claims of a job before an abandoned job is marked failed instead of re-queued.
+        """
+        self.path = path
+        self.max_queue = max_queue
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT UNIQUE NOT NULL, request TEXT NOT NULL, "
+            "request_hash TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, error TEXT, "
+            "enqueued_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, seq)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_hash ON jobs (request_hash, status)")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SQLiteJobQueue":
+        """
+        Build a queue from JOB_QUEUE_PATH (default data/jobs.sqlite), SCHEDULER_MAX_QUEUE (default 100),
+        JOB_LEASE_SECONDS (default 600) and JOB_MAX_ATTEMPTS (default 3).
+        """
+        return cls(
+            os.getenv("JOB_QUEUE_PATH", "data/jobs.sqlite"),
+            max_queue=int(os.getenv("SCHEDULER_MAX_QUEUE", "100")),
+            lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "600")),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        )
+
+    def submit(self, job_id: str, request: DocumentRequest, priority: int = 0) -> int:
+        """
+        Queue a document request.
+        :return: The job's 1-based position in the queue.
+        :raises QueueFullError: If the queue is at capacity.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                (queued,) = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()
+                if queued >= self.max_queue:
+                    raise QueueFullError(self._retry_after(queued))
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, request, request_hash, priority, status, enqueued_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, request.model_dump_json(), request.request_hash(), priority, QUEUED, time.time()),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.position(job_id)
+
+    def claim(self, worker: str) -> ClaimedJob | None:
+        """
+        Atomically take the highest-priority queued job.
+        :param worker: Identifier of the claiming worker (needed to renew the lease and finish the job).
+        :return: The claimed job, or None if the queue is empty.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id, request, enqueued_at, attempts FROM jobs WHERE status = ? "
+                    "ORDER BY priority DESC, seq LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, started_at = ?, attempts = attempts + 1 "
+                        "WHERE job_id = ?",
+                        (RUNNING, worker, time.time(), row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, request, enqueued_at, attempts = row
+        return ClaimedJob(job_id, DocumentRequest.model_validate_json(request), enqueued_at, attempts + 1, worker)
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """
+        Extend the lease of a running job.
+        :return: False if the worker no longer holds the job (its lease expired and the job was handed out again).
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET started_at = ? WHERE job_id = ? AND status = ? AND worker = ?",
+                (time.time(), job_id, RUNNING, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str | None = None) -> bool:
+        """
+        Mark a claimed job as done.
+        :param worker: Only finish the job if this worker still holds it.
+        :return: False if the job was not updated (the worker lost its lease).
+        """
+        return self._finish(job_id, DONE, None, worker)
+
+    def fail(self, job_id: str, error: str, worker: str | None = None) -> bool:
+        """
+        Mark a claimed job as failed with an error message.
+        :param worker: Only finish the job if this worker still holds it.
+        :return: False if the job was not updated (the worker lost its lease).
+        """
+        return self._finish(job_id, FAILED, error, worker)
+
+    def _finish(self, job_id: str, status: str, error: str | None, worker: str | None) -> bool:
+        query = "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?"
+        params: tuple = (status, error, time.time(), job_id)
+        if worker is not None:
+            query += " AND status = ? AND worker = ?"
+            params += (RUNNING, worker)
+        with self._lock:
+            return self._conn.execute(query, params).rowcount == 1
+
+    def requeue_stale(self) -> tuple[int, list[tuple[str, DocumentRequest]]]:
+        """
+        Hand jobs whose lease was not renewed in time (e.g., their worker process died) back to the queue,
+        or mark them failed once they used up max_attempts.
+        :return: (number of jobs re-queued, (job ID, request) of every job marked failed). The caller records the
+                 failures in the result store and notifies their callbacks.
+        """
+        cutoff = time.time() - self.lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = self._conn.execute(
+                    "SELECT job_id, request FROM jobs WHERE status = ? AND started_at <= ? AND attempts >= ?",
+                    (RUNNING, cutoff, self.max_attempts),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                    [(FAILED, LEASE_EXPIRED, time.time(), job_id) for job_id, _ in failed],
+                )
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, started_at = NULL WHERE status = ? AND started_at <= ?",
+                    (QUEUED, RUNNING, cutoff),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount, [(job_id, DocumentRequest.model_validate_json(request)) for job_id, request in failed]
+
+    def purge(self, older_than: float) -> None:
+        """
+        Delete finished jobs that ended more than older_than seconds ago.
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at <= ?",
+                (DONE, FAILED, time.time() - older_than),
+            )
+
+    def find_active(self, request_hash: str, generation_mode: str | None = None) -> str | None:
+        """
+        Return the ID of a queued or running job for the same request, if any (used to coalesce submissions).
+        :param generation_mode: Orchestration mode the job must have been queued with (as set in its request).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE request_hash = ? AND status IN (?, ?) "
+                "AND json_extract(request, '$.generation_mode') IS ? ORDER BY seq LIMIT 1",
+                (request_hash, QUEUED, RUNNING, generation_mode),
+            ).fetchone()
+        return row[0] if row else None
+
+    def position(self, job_id: str) -> int | None:
+        """
+        Return the job's 1-based position in the queue, 0 if it is running, or None if it is unknown or finished.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT status, priority, seq FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or row[0] not in (QUEUED, RUNNING):
+                return None
+            if row[0] == RUNNING:
+                return 0
+            (ahead,) = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND (priority > ? OR (priority = ? AND seq < ?))",
+                (QUEUED, row[1], row[1], row[2]),
+            ).fetchone()
+        return ahead + 1
+
+    def status(self, job_id: str) -> str | None:
+        """
+        Return QUEUED, RUNNING, DONE, FAILED or None if the job is unknown.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def error(self, job_id: str) -> str | None:
+        """
+        Return the error message of a failed job.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT error FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def queue_length(self) -> int:
+        return self._count(QUEUED)
+
+    @property
+    def running_count(self) -> int:
+        return self._count(RUNNING)
+
+    def _count(self, status: str) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()
+        return count
+
+    def retry_after(self) -> int:
+        """
+        Estimate how many seconds it takes until the queue has room again.
+        """
+        with self._lock:
+            return self._retry_after(self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0])
+
+    def _retry_after(self, queued: int) -> int:
+        # Average run time of the most recent jobs (the workers live in other processes, so ask the database).
+        (average,) = self._conn.execute(
+            "SELECT AVG(finished_at - started_at) FROM "
+            "(SELECT finished_at, started_at FROM jobs WHERE status = ? ORDER BY seq DESC LIMIT 50)",
+            (DONE,),
+        ).fetchone()
+        # Running jobs approximate the number of worker slots.
+        (running,) = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()
+        return max(1, math.ceil((average or 1.0) * queued / max(1, running)))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def create_job_queue() -> SQLiteJobQueue | None:
+    """
+    Return the durable queue when JOB_BACKEND=queue, or None when documents are generated in the API process
+    (JOB_BACKEND=inprocess, the default).
+    """
+    if os.getenv("JOB_BACKEND", "inprocess") == "queue":
+        return SQLiteJobQueue.from_env()
+    return None
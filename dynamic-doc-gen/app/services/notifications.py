@@ -0,0 +1,191 @@
+"""
+Completion notifications for generated documents.
+- Long-polling: requests waiting for the same document share one asyncio.Event that is set when the document
+  finishes, so a waiting client costs no work until then.
+- Webhooks: when a request carries a callback_url, a completion POST is sent to it, retried with backoff.
+  Callback URLs must point to public addresses (or to WEBHOOK_ALLOWED_HOSTS), so a caller cannot make the
+  service send requests to internal hosts.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import random
+import socket
+from urllib.parse import urlsplit
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Delivery attempts per webhook, timeout of one attempt, and base delay of the exponential backoff (seconds).
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_BACKOFF = float(os.getenv("WEBHOOK_BACKOFF", "1.0"))
+
+# Comma-separated hosts callback URLs may point to; an entry starting with "." also allows its subdomains.
+# When set, only these hosts receive webhooks (whatever their address); when empty, any host whose addresses are
+# all public does.
+WEBHOOK_ALLOWED_HOSTS = tuple(
+    host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+)
+
+class CallbackURLError(ValueError):
+    """
+    Raised when a callback URL points to a host webhooks may not be sent to.
+    """
+
+def _host_allowed(host: str) -> bool:
+    return any(
+        host == allowed or (allowed.startswith(".") and (host.endswith(allowed) or host == allowed[1:]))
+        for allowed in WEBHOOK_ALLOWED_HOSTS
+    )
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+async def check_callback_url(url: str) -> None:
+    """
+    Make sure webhooks may be sent to a callback URL: its host must be in WEBHOOK_ALLOWED_HOSTS when that is set,
+    and otherwise resolve only to public addresses (not loopback, private, link-local or otherwise reserved).
+    :raises CallbackURLError: If the URL must not be called.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError as exc:
+        raise CallbackURLError(f"Invalid callback URL: {exc}")
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise CallbackURLError("Callback URL must be an absolute http(s) URL")
+    if WEBHOOK_ALLOWED_HOSTS:
+        if not _host_allowed(host):
+            raise CallbackURLError(f"Callback host {host} is not in WEBHOOK_ALLOWED_HOSTS")
+        return
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        raise CallbackURLError(f"Callback host {host} cannot be resolved")
+    if not addresses or not all(_is_public(address[4][0]) for address in addresses):
+        raise CallbackURLError(f"Callback host {host} does not resolve to a public address")
+
+class CompletionEvents:
+    """
+    One lazily created event per awaited document, shared by all of its waiters.
+    """
+
+    def __init__(self):
+        self._events: dict[str, asyncio.Event] = {}
+        self._waiters: dict[str, int] = {}
+
+    async def wait(self, doc_id: str, timeout: float) -> bool:
+        """
+        Wait until notify(doc_id) is called or the timeout expires.
+        :return: True if the document finished while waiting.
+        """
+        event = self._events.get(doc_id)
+        if event is None:
+            event = self._events[doc_id] = asyncio.Event()
+        self._waiters[doc_id] = self._waiters.get(doc_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters[doc_id] -= 1
+            if not self._waiters[doc_id]:
+                # The last waiter cleans up, so documents nobody waits for hold no event.
+                del self._waiters[doc_id]
+                if self._events.get(doc_id) is event:
+                    del self._events[doc_id]
+
+    def notify(self, doc_id: str) -> None:
+        """
+        Wake every request waiting for the document.
+        """
+        event = self._events.pop(doc_id, None)
+        if event is not None:
+            event.set()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+# Process-wide completion events.
+completion_events = CompletionEvents()
+
+# Callback URLs per document still being generated, and delivery tasks still running.
+_callbacks: dict[str, list[str]] = {}
+_deliveries: set[asyncio.Task] = set()
+
+def subscribe(doc_id: str, callback_url: str | None) -> None:
+    """
+    Register a URL to be notified when the document finishes (ignored if callback_url is None).
+    """
+    if callback_url and callback_url not in _callbacks.setdefault(doc_id, []):
+        _callbacks[doc_id].append(callback_url)
+
+def document_finished(doc_id: str, request_hash: str, status: str = "ready", error: str | None = None,
+                      callback_url: str | None = None) -> None:
+    """
+    Wake long-polling requests for the document and send the completion webhooks.
+    :param status: "ready" or "failed".
+    :param callback_url: Additional URL to notify (e.g., the request's callback_url in a worker process).
+    """
+    completion_events.notify(doc_id)
+    urls = _callbacks.pop(doc_id, [])
+    if callback_url and callback_url not in urls:
+        urls.append(callback_url)
+    payload = {"document_id": doc_id, "status": status, "request_hash": request_hash}
+    if error is not None:
+        payload["error"] = error
+    for url in urls:
+        task = asyncio.ensure_future(deliver_webhook(url, payload))
+        _deliveries.add(task)
+        task.add_done_callback(_deliveries.discard)
+
+async def deliver_webhook(url: str, payload: dict, max_attempts: int | None = None) -> bool:
+    """
+    POST payload as JSON to url, retrying connection errors, timeouts and non-2xx answers with jittered
+    exponential backoff (other 4xx answers are not retried).
+    URLs rejected by check_callback_url are not called (the host is checked again here, since its DNS answer
+    may have changed since the request was accepted). Redirects are not followed.
+    :return: True if the receiver accepted the notification.
+    """
+    try:
+        await check_callback_url(url)
+    except CallbackURLError as exc:
+        logger.warning("Not sending webhook for document %s: %s", payload.get("document_id"), exc)
+        return False
+    # At least one attempt, even if WEBHOOK_MAX_ATTEMPTS is set to 0 or less.
+    max_attempts = max(1, max_attempts or WEBHOOK_MAX_ATTEMPTS)
+    async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
+        for attempt in range(1, max_attempts + 1):
+            try:
+                response = await client.post(url, json=payload)
+                if response.is_success:
+                    return True
+                problem = f"HTTP {response.status_code}"
+                # Other client errors will not go away by retrying.
+                if response.status_code < 500 and response.status_code not in (408, 429):
+                    break
+            except httpx.HTTPError as exc:
+                problem = type(exc).__name__
+            if attempt < max_attempts:
+                delay = WEBHOOK_BACKOFF * 2 ** (attempt - 1)
+                await asyncio.sleep(random.uniform(0, delay))
+    logger.warning("Giving up webhook for document %s to %s after %d attempt(s) (%s)",
+                   payload.get("document_id"), url, attempt, problem)
+    return False
+
+async def shutdown() -> None:
+    """
+    Cancel pending webhook deliveries (called at application shutdown).
+    """
+    for task in list(_deliveries):
+        task.cancel()
+    await asyncio.gather(*_deliveries, return_exceptions=True)
+    _deliveries.clear()
+    _callbacks.clear()
@@ -1,60 +1,311 @@
 """
 Orchestrator service that coordinates the multi-agent document generation.
 Handles concurrent agent execution and final assembly of the HTML document.
+Which agents run is decided by the slots of the document template and the section registry
+(app/services/section_registry.py); the agents run as a dependency graph with maximum parallelism.
+Every agent runs under the deadline and fallback policy of its section (app/services/section_policy.py) and with
+the generation profile (model, max_tokens, temperature) of its section (app/services/generation_profiles.py).
 """
 import asyncio
-from pathlib import Path
-from app.agents import header_agent, zoning_agent, standards_agent, validation_agent
-from app.models.request_models import DocumentRequest
+import html
+import logging
+import os
+import time
+from typing import AsyncIterator, Collection
+from app.agents import consolidated_agent, validation_agent
+from app.models.request_models import CONTENT_FIELDS, DocumentRequest
+from app.services import generation_profiles, section_policy
+from app.services.generation_stats import generation_stats
+from app.services.section_registry import SectionPlan, SectionSpec, registry
+from app.services.section_store import section_store
+from app.utils import ai_clients, metrics
+from app.utils.singleflight import SingleFlight
+from app.utils.template_engine import CompiledTemplate, get_template
 
-async def generate_document(request: DocumentRequest) -> str:
+logger = logging.getLogger(__name__)
+
+# Concurrent generations of identical requests share one orchestration.
+document_flights = SingleFlight()
+
+# Default orchestration mode: "fanout" (one completion per section) or "consolidated" (one JSON completion).
+GENERATION_MODE = os.getenv("GENERATION_MODE", "fanout")
+
+# Template documents are rendered with (a file name in app/templates without the .html suffix).
+DOCUMENT_TEMPLATE = os.getenv("DOCUMENT_TEMPLATE", "base_document")
+
+def resolve_mode(request: DocumentRequest) -> DocumentRequest:
     """
-    Orchestrate the generation of the document by invoking multiple agents asynchronously.
-    This gathers content from header, zoning, and standards agents, then assembles them into the HTML template.
-    Finally, runs validation/sanitization on the assembled HTML.
+    Return the request with its orchestration mode filled in (GENERATION_MODE when the request does not set one).
+    """
+    if request.generation_mode:
+        return request
+    return request.model_copy(update={"generation_mode": GENERATION_MODE})
+
+def flight_key(request: DocumentRequest) -> str:
+    """
+    Key under which concurrent generations are shared: the request hash and the resolved orchestration mode,
+    since the two modes generate different documents (and are counted separately in the generation stats).
+    """
+    return f"{request.generation_mode or GENERATION_MODE}:{request.request_hash()}"
+
+def _section_slots(template: CompiledTemplate) -> list[str]:
+    """
+    Return the template's slots that are filled by a registered section, in document order.
+    """
+    return [slot for slot in dict.fromkeys(template.slots) if slot in registry]
+
+def _launch_agents(request: DocumentRequest, plan: SectionPlan, available: dict[str, str]) -> dict[str, asyncio.Task]:
+    """
+    Start one task per section of the plan; each task waits only for the sections it depends on.
+    :param available: Content of the sections that need no agent (static or precomputed).
+    :return: Mapping of template slot name to the running agent task.
+    """
+    tasks: dict[str, asyncio.Task] = {}
+    # The plan lists dependencies first, so their tasks already exist.
+    for spec in plan.agents:
+        dependencies = {slot: tasks[slot] for slot in spec.depends_on if slot in tasks}
+        tasks[spec.slot] = asyncio.create_task(_run_agent(spec, request, dependencies, available))
+    return tasks
+
+async def _run_agent(spec: SectionSpec, request: DocumentRequest, dependencies: dict[str, asyncio.Task],
+                     available: dict[str, str]) -> str:
+    """
+    Wait for the sections an agent depends on, then run it with its section's generation profile,
+    under its section's deadline and fallbacks.
+    """
+    inputs = {slot: available[slot] for slot in spec.depends_on if slot in available}
+    for slot, task in dependencies.items():
+        inputs[slot] = await task
+    profile = generation_profiles.resolve(spec.slot, DOCUMENT_TEMPLATE)
+    started = time.monotonic()
+    with profile.applied(), ai_clients.track_usage() as usage:
+        content = await section_policy.run_section(
+            spec.slot, request, lambda: spec.agent(request, inputs), registry.inputs(spec.slot), profile.fingerprint
+        )
+    generation_profiles.profile_stats.record(profile, spec.slot, time.monotonic() - started, usage)
+    return content
+
+def _section_profiles() -> dict[str, str]:
+    """
+    Return the fingerprint of the generation profile of every registered section.
+    """
+    return {spec.slot: generation_profiles.resolve(spec.slot, DOCUMENT_TEMPLATE).fingerprint for spec in registry}
+
+def _request_fields(request: DocumentRequest) -> dict[str, str]:
+    """
+    Return the template placeholders that come straight from the request, HTML-escaped.
+    The validator only sees the agent sections, so user input must never reach the document unescaped.
+    """
+    fields = {
+        "project_name": request.project_name,
+        "project_type": request.project_type,
+        "location": request.location or "Not specified",
+        # Format meeting date as a readable string.
+        "meeting_date": request.meeting_date.strftime("%B %d, %Y"),
+    }
+    return {name: html.escape(value) for name, value in fields.items()}
+
+def prepare_template(request: DocumentRequest, template_name: str | None = None) -> CompiledTemplate:
+    """
+    Render the request fields into the compiled template.
+    :return: A compiled template whose remaining slots are the dynamic (agent-generated) sections.
+    """
+    return get_template(template_name or DOCUMENT_TEMPLATE).partial(_request_fields(request))
+
+async def stream_sections(request: DocumentRequest) -> AsyncIterator[tuple[str, str]]:
+    """
+    Run the agents concurrently and yield each section as soon as it is ready.
+    Each section is validated on its own before it is yielded. Once all are yielded, the sections and their statuses
+    are kept in the section store.
+    :return: Async iterator of (slot name, validated HTML) pairs in completion order.
+    """
+    wanted = _section_slots(get_template(DOCUMENT_TEMPLATE))
+    plan = registry.plan(request, wanted)
+    sections: dict[str, str] = {}
+    with section_policy.track_statuses() as statuses:
+        # Sections that need no AI call are available right away.
+        for slot in wanted:
+            if slot in plan.static:
+                sections[slot] = plan.static[slot]
+                yield slot, plan.static[slot]
+        tasks = _launch_agents(request, plan, plan.static)
+        # Sections only needed as input of other sections are not sent.
+        slot_by_task = {task: slot for slot, task in tasks.items() if slot in wanted}
+        pending = set(slot_by_task)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    slot = slot_by_task[task]
+                    validated = await validation_agent.validate_sections_async({slot: task.result()})
+                    sections[slot] = validated[slot]
+                    yield slot, validated[slot]
+        finally:
+            # If the consumer stops early (e.g., client disconnected), do not leave agents running.
+            for task in tasks.values():
+                task.cancel()
+        # Keep the sections and their statuses like generated documents, for GET /status and PATCH.
+        statuses = {slot: statuses.get(slot, section_policy.FRESH) for slot in sections}
+        profiles = _section_profiles()
+        section_store.save_sections(request, sections, statuses, {slot: profiles.get(slot, "") for slot in sections})
+        _save_document_statuses(statuses)
+
+async def generate_sections(request: DocumentRequest, slots: Collection[str] | None = None,
+                            precomputed: dict[str, str] | None = None) -> dict[str, str]:
     """
+    Run the agents for the given slots concurrently and return their validated sections.
+    :param slots: Restrict generation to these template slots (default: all of them).
+    :param precomputed: Sections already available; they are not generated again but can feed dependent agents.
+    """
+    precomputed = precomputed or {}
+    wanted = [
+        slot for slot in _section_slots(get_template(DOCUMENT_TEMPLATE))
+        if (slots is None or slot in slots) and slot not in precomputed
+    ]
+    plan = registry.plan(request, wanted, precomputed)
     # Launch agents concurrently using asyncio tasks.
-    header_task = asyncio.create_task(header_agent.generate_header(request))
-    zoning_task = asyncio.create_task(zoning_agent.generate_zoning(request))
-    # Decide whether to generate commercial standards section based on project_type.
-    commercial_task = None
-    if request.project_type.lower() == "commercial":
-        commercial_task = asyncio.create_task(standards_agent.generate_standards(request, "commercial"))
-    # General standards are generated for all project types (assuming general standards apply universally).
-    general_task = asyncio.create_task(standards_agent.generate_standards(request, "general"))
-    # Gather tasks (include commercial task if applicable).
-    tasks = [header_task, zoning_task, general_task]
-    if commercial_task:
-        tasks.append(commercial_task)
+    tasks = _launch_agents(request, plan, {**precomputed, **plan.static})
     # Run all tasks concurrently and wait for results.
-    results = await asyncio.gather(*tasks)
-    # Unpack results in the same order.
-    header_content = results[0]
-    zoning_content = results[1]
-    if commercial_task:
-        general_content = results[2]
-        commercial_content = results[3]
-    else:
-        general_content = results[2]
-        # If project is not commercial, define a default message for commercial standards.
-        commercial_content = "<p>No commercial-specific standards applicable.</p>"
-    # Load the HTML template from file.
-    template_path = Path(__file__).resolve().parent.parent / "templates" / "base_document.html"
-    template_str = template_path.read_text(encoding="utf-8")
-    # Fill in the template placeholders with static and dynamic content.
-    # Static fields from request
-    filled = template_str
-    filled = filled.replace("{{project_name}}", request.project_name)
-    filled = filled.replace("{{project_type}}", request.project_type)
-    filled = filled.replace("{{location}}", request.location or "Not specified")
-    # Format meeting date as a readable string.
-    meeting_date_str = request.meeting_date.strftime("%B %d, %Y")
-    filled = filled.replace("{{meeting_date}}", meeting_date_str)
-    # Dynamic content fields from agents.
-    filled = filled.replace("{{header_content}}", header_content)
-    filled = filled.replace("{{zoning_content}}", zoning_content)
-    filled = filled.replace("{{commercial_standards_content}}", commercial_content)
-    filled = filled.replace("{{general_standards_content}}", general_content)
-    # Validate and sanitize the assembled HTML.
-    final_doc = validation_agent.validate_document(filled)
+    results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+    # Validate and sanitize the AI-generated sections in the worker pool.
+    sections = await validation_agent.validate_sections_async(
+        {slot: content for slot, content in results.items() if slot in wanted}
+    )
+    for slot, content in plan.static.items():
+        if slot in wanted:
+            sections[slot] = content
+    return sections
+
+async def generate_project_type_sections(request: DocumentRequest) -> dict[str, str]:
+    """
+    Generate the sections that depend only on request.project_type (the standards sections).
+    The result can be passed as precomputed to generate_document for any request of the same project type.
+    Sections that fell back are left out, so every document retries them with its own agent.
+    """
+    with section_policy.track_statuses() as statuses:
+        sections = await generate_sections(request, registry.determined_by(("project_type",)))
+    return {
+        slot: content for slot, content in sections.items()
+        if statuses.get(slot, section_policy.FRESH) == section_policy.FRESH
+    }
+
+async def generate_document(request: DocumentRequest, precomputed: dict[str, str] | None = None) -> str:
+    """
+    Generate the document for a request.
+    Concurrent calls for requests with the same request_hash() and orchestration mode share a single orchestration.
+    :param precomputed: Already validated sections (e.g., shared standards sections) that need no agent call.
+    """
+    final_doc, statuses = await document_flights.do(
+        flight_key(request), lambda: _generate_document(request, precomputed)
+    )
+    # Every document sharing the orchestration gets its section statuses.
+    _save_document_statuses(statuses)
     return final_doc
+
+def _save_document_statuses(statuses: dict[str, str]) -> None:
+    """
+    Keep the section statuses under the ID of the document being generated (set with metrics.document_context).
+    """
+    doc_id = metrics.current_document_id.get()
+    if doc_id is not None:
+        section_store.save_document_statuses(doc_id, statuses)
+
+async def _generate_document(request: DocumentRequest,
+                             precomputed: dict[str, str] | None = None) -> tuple[str, dict[str, str]]:
+    """
+    Orchestrate the generation of the document by invoking multiple agents asynchronously.
+    This gathers content from the agents of the template's sections, validates each section on its own,
+    then assembles them into the HTML template (the static template itself is never re-parsed).
+    Sections whose agent misses its deadline or fails are filled by their fallbacks; the status of every
+    section is kept in the section store.
+    :return: (document HTML, status of each section).
+    """
+    mode = request.generation_mode or GENERATION_MODE
+    started = time.monotonic()
+    with metrics.span("document", mode=mode), ai_clients.track_usage() as usage, \
+            section_policy.track_statuses() as statuses:
+        precomputed = precomputed or {}
+        # The generation profile of every section (precomputed ones were generated with the current profiles).
+        profiles = _section_profiles()
+        if mode == "consolidated":
+            sections, combined = await _generate_consolidated(request, precomputed)
+            consolidated_profile = generation_profiles.resolve("consolidated", DOCUMENT_TEMPLATE).fingerprint
+            profiles.update((slot, consolidated_profile) for slot in combined)
+        else:
+            # Only the agents whose sections were not provided run.
+            sections = await generate_sections(request, precomputed=precomputed)
+        sections.update(precomputed)
+        # Static and precomputed sections count as fresh.
+        statuses = {slot: statuses.get(slot, section_policy.FRESH) for slot in sections}
+        # Keep the sections so a later change of the request (or of the profiles) can reuse the unaffected ones.
+        section_store.save_sections(request, sections, statuses, {slot: profiles.get(slot, "") for slot in sections})
+        # Fill the precompiled template with the request fields and agent content in a single pass.
+        with metrics.span("template_render"):
+            final_doc = get_template(DOCUMENT_TEMPLATE).render({**_request_fields(request), **sections})
+    generation_stats.record(mode, time.monotonic() - started, usage)
+    return final_doc, statuses
+
+def plan_regeneration(base: DocumentRequest, request: DocumentRequest) -> tuple[dict[str, str], list[str]]:
+    """
+    Work out the incremental regeneration of a document for a changed request: the sections of the earlier
+    generation of base whose request fields did not change (directly or through the sections they depend on) are
+    reused, except sections that were filled by a fallback or generated with another generation profile.
+    :param base: The request the document was previously generated from.
+    :param request: The changed request.
+    :return: (reusable sections, not yet re-validated; slots whose agents have to run).
+    """
+    changed = {name for name in CONTENT_FIELDS if getattr(base, name) != getattr(request, name)}
+    previous = section_store.load_sections(base)
+    previous_statuses = section_store.load_statuses(base)
+    previous_profiles = section_store.load_profiles(base)
+    reused = {
+        slot: content for slot, content in previous.items()
+        if not changed.intersection(registry.inputs(slot))
+        and previous_statuses.get(slot, section_policy.FRESH) == section_policy.FRESH
+        and previous_profiles.get(slot) == generation_profiles.resolve(slot, DOCUMENT_TEMPLATE).fingerprint
+    }
+    plan = registry.plan(request, _section_slots(get_template(DOCUMENT_TEMPLATE)), reused)
+    return reused, [spec.slot for spec in plan.agents]
+
+async def regenerate_document(request: DocumentRequest, reused: dict[str, str]) -> str:
+    """
+    Generate the document for a changed request, re-running only the agents of the sections not reused.
+    The reused sections (see plan_regeneration) are validated again and re-assembled with the new ones.
+    """
+    reused = await validation_agent.validate_sections_async(reused)
+    return await generate_document(request, precomputed=reused)
+
+async def _generate_consolidated(request: DocumentRequest,
+                                 precomputed: dict[str, str]) -> tuple[dict[str, str], list[str]]:
+    """
+    Generate all agent sections with one structured completion, falling back to the per-section agents
+    for any slot the completion did not provide (or that is empty after validation).
+    Sections that depend on other sections need their input first, so they always use their own agent.
+    The combined call runs under the deadline of the "consolidated" section (SECTION_DEADLINE_CONSOLIDATED).
+    :return: (sections, slots filled by the combined call).
+    """
+    template_slots = _section_slots(get_template(DOCUMENT_TEMPLATE))
+    plan = registry.plan(request, template_slots, precomputed)
+    wanted = [spec.slot for spec in plan.agents if spec.slot in template_slots and not spec.depends_on]
+    profile = generation_profiles.resolve("consolidated", DOCUMENT_TEMPLATE)
+    started = time.monotonic()
+    try:
+        with metrics.span("agent", section="consolidated"), profile.applied(), ai_clients.track_usage() as usage:
+            generated = await asyncio.wait_for(
+                consolidated_agent.generate_sections(request, wanted),
+                section_policy.get_policy("consolidated").deadline,
+            )
+    except Exception:
+        # A failed combined call is not fatal: every section falls back to its own agent.
+        logger.exception("Consolidated generation failed, falling back to per-section agents")
+        generated = {}
+    generation_profiles.profile_stats.record(profile, "consolidated", time.monotonic() - started, usage)
+    sections = await validation_agent.validate_sections_async(generated)
+    sections = {slot: content for slot, content in sections.items() if content.strip()}
+    for slot, content in sections.items():
+        section_policy.record_status(slot, section_policy.FRESH)
+        section_store.save_section(slot, request, registry.inputs(slot), content, profile.fingerprint)
+    combined = list(sections)
+    # Slots the combined call did not fill (including static ones) go through the per-section path.
+    sections.update(await generate_sections(request, precomputed={**precomputed, **sections}))
+    return sections, combined
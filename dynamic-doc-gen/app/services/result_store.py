@@ -0,0 +1,281 @@
+"""
+Storage for generated documents.
+Documents are kept gzip-compressed together with an ETag so they can be served to clients as-is.
+Two backends are provided: a bounded in-memory store (LRU, TTL and byte-size eviction) and a local SQLite store.
+"""
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# Document states.
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+@dataclass
+class StoredDocument:
+    """
+    A document entry as kept by a result store.
+    """
+    status: str
+    # Gzip-compressed HTML (None unless the document is ready).
+    compressed: bytes | None = None
+    # Strong entity tag of the HTML content (quoted, ready for the ETag header).
+    etag: str | None = None
+    updated_at: float = 0.0
+    # Why generation failed (failed documents only).
+    error: str | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == READY
+
+    @property
+    def failed(self) -> bool:
+        return self.status == FAILED
+
+    @property
+    def html(self) -> str:
+        """
+        The decompressed HTML content.
+        """
+        return gzip.decompress(self.compressed).decode("utf-8") if self.compressed is not None else ""
+
+def compress_document(html_doc: str, level: int = 6) -> tuple[bytes, str]:
+    """
+    Compress a document and compute its entity tag.
+    :return: (gzip bytes, quoted ETag).
+    """
+    raw = html_doc.encode("utf-8")
+    etag = '"' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+    # mtime=0 keeps the compressed bytes deterministic for identical documents.
+    return gzip.compress(raw, compresslevel=level, mtime=0), etag
+
+class ResultStore(ABC):
+    """
+    Interface of a document result store.
+    """
+
+    @abstractmethod
+    def create(self, doc_id: str) -> None:
+        """
+        Register a new document as pending.
+        """
+
+    @abstractmethod
+    def put(self, doc_id: str, html_doc: str) -> None:
+        """
+        Store the finished HTML document.
+        """
+
+    @abstractmethod
+    def fail(self, doc_id: str, error: str) -> None:
+        """
+        Mark a document as failed, so clients stop waiting for it.
+        """
+
+    @abstractmethod
+    def get(self, doc_id: str) -> StoredDocument | None:
+        """
+        Return the document entry, or None if it is unknown (or was evicted).
+        """
+
+    @abstractmethod
+    def delete(self, doc_id: str) -> None:
+        """
+        Remove a document entry if present.
+        """
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.get(doc_id) is not None
+
+    def close(self) -> None:
+        """
+        Release resources held by the store.
+        """
+
+class MemoryResultStore(ResultStore):
+    """
+    In-process store bounded by entry count, total compressed size and age.
+    Pending entries are never evicted by the size limits; they only expire with the TTL.
+    """
+
+    def __init__(self, max_items: int = 1000, max_bytes: int = 256 * 1024 * 1024, ttl: float | None = 3600.0,
+                 compresslevel: int = 6):
+        """
+        :param max_items: Maximum number of documents kept.
+        :param max_bytes: Maximum total size of the compressed documents.
+        :param ttl: Seconds a document is kept after its last update (None or 0 disables expiry).
+        :param compresslevel: Gzip compression level.
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.compresslevel = compresslevel
+        # Ordered by recency of use, least recent first.
+        self._entries: OrderedDict[str, StoredDocument] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def create(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove(doc_id)
+            self._entries[doc_id] = StoredDocument(PENDING, updated_at=time.time())
+            self._evict()
+
+    def put(self, doc_id: str, html_doc: str) -> None:
+        compressed, etag = compress_document(html_doc, self.compresslevel)
+        with self._lock:
+            self._remove(doc_id)
+            self._entries[doc_id] = StoredDocument(READY, compressed, etag, time.time())
+            self._bytes += len(compressed)
+            self._evict()
+
+    def fail(self, doc_id: str, error: str) -> None:
+        with self._lock:
+            self._remove(doc_id)
+            self._entries[doc_id] = StoredDocument(FAILED, updated_at=time.time(), error=error)
+            self._evict()
+
+    def get(self, doc_id: str) -> StoredDocument | None:
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is None:
+                return None
+            if self._expired(entry, time.time()):
+                self._remove(doc_id)
+                return None
+            self._entries.move_to_end(doc_id)
+            return entry
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove(doc_id)
+
+    @property
+    def total_bytes(self) -> int:
+        """
+        Total size of the compressed documents currently stored.
+        """
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, entry: StoredDocument, now: float) -> bool:
+        return self.ttl is not None and entry.updated_at + self.ttl <= now
+
+    def _remove(self, doc_id: str) -> None:
+        entry = self._entries.pop(doc_id, None)
+        if entry is not None and entry.compressed is not None:
+            self._bytes -= len(entry.compressed)
+
+    def _evict(self) -> None:
+        """
+        Drop expired entries, then the least recently used finished (ready or failed) documents until within limits.
+        """
+        now = time.time()
+        for doc_id in [doc_id for doc_id, entry in self._entries.items() if self._expired(entry, now)]:
+            self._remove(doc_id)
+        if len(self._entries) <= self.max_items and self._bytes <= self.max_bytes:
+            return
+        for doc_id in [doc_id for doc_id, entry in self._entries.items() if entry.status != PENDING]:
+            if len(self._entries) <= self.max_items and self._bytes <= self.max_bytes:
+                break
+            self._remove(doc_id)
+
+class SQLiteResultStore(ResultStore):
+    """
+    Store backed by a local SQLite database, so documents survive restarts.
+    The body column holds the compressed HTML of ready documents and the error message of failed ones.
+    """
+
+    def __init__(self, path: str, ttl: float | None = 3600.0, compresslevel: int = 6):
+        """
+        :param path: Filesystem path of the SQLite database (created if missing).
+        :param ttl: Seconds a document is kept after its last update (None or 0 disables expiry).
+        :param compresslevel: Gzip compression level.
+        """
+        self.path = path
+        self.ttl = ttl or None
+        self.compresslevel = compresslevel
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, status TEXT NOT NULL, body BLOB, etag TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def create(self, doc_id: str) -> None:
+        self._upsert(doc_id, PENDING, None, None)
+
+    def put(self, doc_id: str, html_doc: str) -> None:
+        compressed, etag = compress_document(html_doc, self.compresslevel)
+        self._upsert(doc_id, READY, compressed, etag)
+
+    def fail(self, doc_id: str, error: str) -> None:
+        self._upsert(doc_id, FAILED, error.encode("utf-8"), None)
+
+    def get(self, doc_id: str) -> StoredDocument | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, body, etag, updated_at FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, body, etag, updated_at = row
+        if self.ttl is not None and updated_at + self.ttl <= time.time():
+            self.delete(doc_id)
+            return None
+        if status == FAILED:
+            return StoredDocument(status, updated_at=updated_at, error=body.decode("utf-8"))
+        return StoredDocument(status, body, etag, updated_at)
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _upsert(self, doc_id: str, status: str, body: bytes | None, etag: str | None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, status, body, etag, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, status, body, etag, now),
+            )
+            if self.ttl is not None:
+                # Purge expired documents as part of the write.
+                self._conn.execute("DELETE FROM documents WHERE updated_at <= ?", (now - self.ttl,))
+            self._conn.commit()
+
+def create_result_store() -> ResultStore:
+    """
+    Build the result store from environment configuration.
+    - RESULT_STORE_BACKEND: "memory" (default) or "sqlite".
+    - RESULT_STORE_PATH: SQLite file for the sqlite backend (default data/results.sqlite).
+    - RESULT_STORE_MAX_ITEMS / RESULT_STORE_MAX_BYTES: limits of the memory backend.
+    - RESULT_STORE_TTL: seconds a document is kept (default 3600, 0 disables expiry).
+    """
+    ttl = float(os.getenv("RESULT_STORE_TTL", "3600"))
+    level = int(os.getenv("RESULT_STORE_COMPRESSLEVEL", "6"))
+    if os.getenv("RESULT_STORE_BACKEND", "memory") == "sqlite":
+        return SQLiteResultStore(os.getenv("RESULT_STORE_PATH", "data/results.sqlite"), ttl=ttl, compresslevel=level)
+    return MemoryResultStore(
+        max_items=int(os.getenv("RESULT_STORE_MAX_ITEMS", "1000")),
+        max_bytes=int(os.getenv("RESULT_STORE_MAX_BYTES", str(256 * 1024 * 1024))),
+        ttl=ttl,
+        compresslevel=level,
+    )
@@ -0,0 +1,161 @@
+"""
+Admission-controlled job scheduler for document generation.
+Jobs wait in a bounded priority queue and a fixed number of workers run them, so a burst of requests
+cannot start an unbounded number of orchestrations at once.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Job states reported by the scheduler.
+QUEUED = "queued"
+RUNNING = "running"
+
+class QueueFullError(Exception):
+    """
+    Raised when the queue is at capacity; carries a suggested Retry-After delay in seconds.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+@dataclass(order=True)
+class _QueuedJob:
+    # Ordering key: higher priority first, then submission order.
+    sort_key: tuple[int, int]
+    job_id: str = field(compare=False)
+    run: Callable[[], Awaitable[None]] = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+
+class JobScheduler:
+    """
+    Bounded priority queue drained by a fixed pool of worker tasks.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 100):
+        """
+        :param max_concurrent: Number of jobs (documents) generated at the same time.
+        :param max_queue: Maximum number of jobs waiting to run; further submissions are rejected.
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._heap: list[_QueuedJob] = []
+        self._sequence = itertools.count()
+        self._running: set[str] = set()
+        self._workers: list[asyncio.Task] = []
+        self._available: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Moving average of job run time, used to suggest Retry-After values.
+        self._avg_duration = 1.0
+
+    @classmethod
+    def from_env(cls) -> "JobScheduler":
+        """
+        Build a scheduler from SCHEDULER_MAX_CONCURRENT (default 8) and SCHEDULER_MAX_QUEUE (default 100).
+        """
+        return cls(
+            max_concurrent=int(os.getenv("SCHEDULER_MAX_CONCURRENT", "8")),
+            max_queue=int(os.getenv("SCHEDULER_MAX_QUEUE", "100")),
+        )
+
+    def start(self) -> None:
+        """
+        Start the worker tasks on the running event loop (no-op if already running there).
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._available = asyncio.Semaphore(len(self._heap))
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)]
+
+    async def stop(self) -> None:
+        """
+        Cancel the workers; jobs still queued are dropped.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._heap.clear()
+        self._running.clear()
+        self._loop = None
+
+    def submit(self, job_id: str, run: Callable[[], Awaitable[None]], priority: int = 0) -> int:
+        """
+        Queue a job.
+        :param job_id: Identifier used to report the job's position (e.g., the document ID).
+        :param run: Coroutine function executing the job.
+        :param priority: Jobs with a higher priority run first.
+        :return: The job's 1-based position in the queue.
+        :raises QueueFullError: If the queue is at capacity.
+        """
+        self.start()
+        if len(self._heap) >= self.max_queue:
+            raise QueueFullError(self.retry_after())
+        job = _QueuedJob((-priority, next(self._sequence)), job_id, run)
+        heapq.heappush(self._heap, job)
+        self._available.release()
+        return self.position(job_id)
+
+    def position(self, job_id: str) -> int | None:
+        """
+        Return the job's 1-based position in the queue, 0 if it is running, or None if unknown.
+        """
+        if job_id in self._running:
+            return 0
+        for job in self._heap:
+            if job.job_id == job_id:
+                return 1 + sum(1 for other in self._heap if other < job)
+        return None
+
+    def status(self, job_id: str) -> str | None:
+        """
+        Return QUEUED, RUNNING or None if the scheduler does not know the job.
+        """
+        position = self.position(job_id)
+        if position is None:
+            return None
+        return RUNNING if position == 0 else QUEUED
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._heap)
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    def retry_after(self) -> int:
+        """
+        Estimate how many seconds it takes until the queue has room again.
+        """
+        return max(1, math.ceil(self._avg_duration * len(self._heap) / max(1, self.max_concurrent)))
+
+    async def _worker(self) -> None:
+        while True:
+            await self._available.acquire()
+            job = heapq.heappop(self._heap)
+            self._running.add(job.job_id)
+            started = time.monotonic()
+            metrics.observe("queue_wait", started - job.enqueued_at, document_id=job.job_id)
+            try:
+                await job.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # A failing job must not take the worker down with it.
+                logger.exception("Job %s failed", job.job_id)
+            finally:
+                self._running.discard(job.job_id)
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.monotonic() - started)
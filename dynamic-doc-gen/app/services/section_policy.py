@@ -0,0 +1,159 @@
+"""
+Per-section deadlines and fallback policies.
+Every agent runs under a deadline. When it times out or raises, the section's fallbacks are tried in order, so one
+stalled or failing agent cannot hold the whole document back:
+- "stale": the last freshly generated content of the section for the same request fields and generation profile
+  (from the section store, which outlives the LLM response cache).
+- "retry": the agent once more on FALLBACK_MODEL (typically a faster model), under SECTION_RETRY_DEADLINE.
+- "placeholder": static HTML stating that the section is temporarily unavailable.
+Each section ends up "fresh" (its agent answered in time), "fallback" (a fallback provided it) or "failed" (empty).
+A document therefore takes at most SECTION_DEADLINE + SECTION_RETRY_DEADLINE per level of section dependencies
+(plus validation and rendering).
+"""
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Iterator
+from app.models.request_models import DocumentRequest
+from app.services.section_store import section_store
+from app.utils import ai_clients, metrics
+
+logger = logging.getLogger(__name__)
+
+# Section states.
+FRESH = "fresh"
+FALLBACK = "fallback"
+FAILED = "failed"
+
+FALLBACK_POLICIES = ("stale", "retry", "placeholder")
+
+# Seconds an agent may take before its section falls back, and seconds allowed for the retry fallback.
+# Per-section overrides: SECTION_DEADLINE_<SLOT> and SECTION_FALLBACKS_<SLOT> (e.g., SECTION_DEADLINE_ZONING_CONTENT).
+SECTION_DEADLINE = float(os.getenv("SECTION_DEADLINE", "45"))
+SECTION_RETRY_DEADLINE = float(os.getenv("SECTION_RETRY_DEADLINE", "15"))
+
+# Comma-separated fallbacks tried in order when a section misses its deadline or fails.
+SECTION_FALLBACKS = os.getenv("SECTION_FALLBACKS", "stale,retry,placeholder")
+
+# Model used by the retry fallback (the retry is skipped when unset).
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL", "")
+
+# Content of the placeholder fallback.
+PLACEHOLDER_CONTENT = "<p>This section is temporarily unavailable.</p>"
+
+@dataclass(frozen=True)
+class SectionPolicy:
+    """
+    Deadline and fallbacks of one section.
+    """
+    deadline: float
+    retry_deadline: float
+    fallbacks: tuple[str, ...]
+
+def parse_fallbacks(value: str) -> tuple[str, ...]:
+    """
+    Parse a comma-separated list of fallback names.
+    :raises ValueError: If a name is not one of FALLBACK_POLICIES.
+    """
+    fallbacks = tuple(name.strip() for name in value.split(",") if name.strip())
+    unknown = [name for name in fallbacks if name not in FALLBACK_POLICIES]
+    if unknown:
+        raise ValueError(f"Unknown section fallback(s): {', '.join(unknown)}")
+    return fallbacks
+
+def get_policy(slot: str) -> SectionPolicy:
+    """
+    Return the policy of a section (the defaults, overridden by the section's own environment variables).
+    """
+    suffix = slot.upper()
+    return SectionPolicy(
+        deadline=float(os.getenv(f"SECTION_DEADLINE_{suffix}", SECTION_DEADLINE)),
+        retry_deadline=float(os.getenv(f"SECTION_RETRY_DEADLINE_{suffix}", SECTION_RETRY_DEADLINE)),
+        fallbacks=parse_fallbacks(os.getenv(f"SECTION_FALLBACKS_{suffix}", SECTION_FALLBACKS)),
+    )
+
+# Status of every section generated in the current scope (tasks created inside a scope share it).
+_statuses: ContextVar[dict[str, str] | None] = ContextVar("section_statuses", default=None)
+
+@contextmanager
+def track_statuses() -> Iterator[dict[str, str]]:
+    """
+    Collect the status of every section generated inside the with-block (including tasks it starts).
+    A nested block shares the collection of the enclosing one.
+    """
+    statuses = _statuses.get()
+    if statuses is not None:
+        yield statuses
+        return
+    statuses = {}
+    token = _statuses.set(statuses)
+    try:
+        yield statuses
+    finally:
+        _statuses.reset(token)
+
+def record_status(slot: str, status: str) -> None:
+    """
+    Count a section outcome and record it in the current status scope.
+    """
+    metrics.section_outcomes.inc(section=slot, status=status)
+    statuses = _statuses.get()
+    if statuses is not None:
+        statuses[slot] = status
+
+async def run_section(slot: str, request: DocumentRequest, agent: Callable[[], Awaitable[str]],
+                      fields: Iterable[str], profile: str = "") -> str:
+    """
+    Run a section's agent under its deadline and fall back according to the section's policy.
+    :param agent: Starts the agent (called again by the retry fallback).
+    :param fields: Request fields the section depends on (its key in the stale store).
+    :param profile: Fingerprint of the section's generation profile (also part of its key in the stale store).
+    :return: The section content (empty if the agent and every fallback failed).
+    """
+    policy = get_policy(slot)
+    fields = tuple(fields)
+    try:
+        with metrics.span("agent", section=slot):
+            content = await asyncio.wait_for(agent(), policy.deadline)
+    except Exception as exc:
+        logger.warning("Section %s failed (%s), trying fallbacks %s", slot, _describe(exc, policy.deadline),
+                       ",".join(policy.fallbacks) or "none")
+        content, status = await _fall_back(slot, request, agent, fields, profile, policy)
+    else:
+        status = FRESH
+        section_store.save_section(slot, request, fields, content, profile)
+    record_status(slot, status)
+    return content
+
+async def _fall_back(slot: str, request: DocumentRequest, agent: Callable[[], Awaitable[str]],
+                     fields: tuple[str, ...], profile: str, policy: SectionPolicy) -> tuple[str, str]:
+    """
+    Try the section's fallbacks in order.
+    :return: (content, FALLBACK) from the first fallback that works, or ("", FAILED).
+    """
+    for name in policy.fallbacks:
+        if name == "stale":
+            content = section_store.load_section(slot, request, fields, profile)
+            if content is not None:
+                return content, FALLBACK
+        elif name == "retry" and FALLBACK_MODEL:
+            try:
+                with ai_clients.use_model(FALLBACK_MODEL), metrics.span("agent_retry", section=slot):
+                    return await asyncio.wait_for(agent(), policy.retry_deadline), FALLBACK
+            except Exception as exc:
+                logger.warning("Retry of section %s on %s failed (%s)", slot, FALLBACK_MODEL,
+                               _describe(exc, policy.retry_deadline))
+        elif name == "placeholder":
+            return PLACEHOLDER_CONTENT, FALLBACK
+    return "", FAILED
+
+def _describe(exc: Exception, deadline: float) -> str:
+    if isinstance(exc, asyncio.TimeoutError):
+        return f"no answer within {deadline:g}s"
+    return str(exc) or type(exc).__name__
+
+# Validate the default fallbacks at import so a misconfiguration fails at startup.
+parse_fallbacks(SECTION_FALLBACKS)
@@ -0,0 +1,170 @@
+"""
+Registry of the agent-generated document sections.
+Each template slot is declared once: the agent that produces it, the request fields the agent uses, the sections
+whose content it needs and when it applies. The orchestrator plans a document from the slots of its template and
+runs the agents as a DAG, each agent starting as soon as the sections it depends on are done, so agents whose
+output is not rendered are never called. A new section (or a template combining sections differently) only needs
+a register() call and a {{slot}} placeholder.
+"""
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Collection, Iterable, Iterator
+from app.agents import header_agent, standards_agent, zoning_agent
+from app.models.request_models import CONTENT_FIELDS, DocumentRequest
+
+# An agent receives the request and the content of the sections it depends on.
+SectionAgent = Callable[[DocumentRequest, dict[str, str]], Awaitable[str]]
+
+def _always(request: DocumentRequest) -> bool:
+    return True
+
+@dataclass(frozen=True)
+class SectionSpec:
+    """
+    Declaration of one agent-generated template slot.
+    """
+    slot: str
+    agent: SectionAgent
+    # Request fields the agent uses. Incremental regeneration reuses the section while they are unchanged.
+    fields: tuple[str, ...] = CONTENT_FIELDS
+    # Sections whose content the agent needs; they run first, even if the template does not render them.
+    depends_on: tuple[str, ...] = ()
+    # Whether the agent runs for a request (may only look at `fields`); otherwise the slot gets `otherwise`.
+    applies: Callable[[DocumentRequest], bool] = _always
+    otherwise: str = ""
+
+@dataclass
+class SectionPlan:
+    """
+    The work needed to fill a set of template slots for one request.
+    """
+    # Sections to generate, in dependency order (dependencies before the sections that need them).
+    agents: list[SectionSpec]
+    # Slots whose content is known without calling an agent.
+    static: dict[str, str]
+
+class SectionRegistry:
+    """
+    Section declarations keyed by template slot.
+    """
+
+    def __init__(self):
+        self._specs: dict[str, SectionSpec] = {}
+
+    def register(self, spec: SectionSpec) -> SectionSpec:
+        """
+        Declare a section (replacing an earlier declaration of the same slot).
+        """
+        self._specs[spec.slot] = spec
+        return spec
+
+    def get(self, slot: str) -> SectionSpec | None:
+        return self._specs.get(slot)
+
+    def __contains__(self, slot: str) -> bool:
+        return slot in self._specs
+
+    def __iter__(self) -> Iterator[SectionSpec]:
+        return iter(self._specs.values())
+
+    def inputs(self, slot: str) -> tuple[str, ...]:
+        """
+        Return the request fields a section's content depends on, directly or through its dependencies.
+        Unknown slots are assumed to depend on every content field.
+        :raises ValueError: If the dependencies form a cycle.
+        """
+        fields: set[str] = set()
+        visiting: set[str] = set()
+        done: set[str] = set()
+
+        def visit(slot: str) -> None:
+            if slot in done:
+                return
+            if slot in visiting:
+                raise ValueError(f"Section dependencies form a cycle through {slot}")
+            spec = self._specs.get(slot)
+            if spec is None:
+                fields.update(CONTENT_FIELDS)
+                return
+            visiting.add(slot)
+            fields.update(spec.fields)
+            for dependency in spec.depends_on:
+                visit(dependency)
+            visiting.discard(slot)
+            done.add(slot)
+
+        visit(slot)
+        return tuple(name for name in CONTENT_FIELDS if name in fields)
+
+    def determined_by(self, fields: Collection[str]) -> list[str]:
+        """
+        Return the sections whose content depends on the given request fields only, so they can be shared
+        between requests that agree on those fields.
+        :raises ValueError: If the dependencies form a cycle.
+        """
+        return [spec.slot for spec in self._specs.values() if set(self.inputs(spec.slot)) <= set(fields)]
+
+    def plan(self, request: DocumentRequest, slots: Iterable[str], available: Collection[str] = ()) -> SectionPlan:
+        """
+        Work out which agents must run to fill the given slots.
+        :param slots: Template slots to fill; slots without a declared section are ignored.
+        :param available: Slots whose content is already known (their agents do not run).
+        :raises ValueError: If a dependency is not declared or the dependencies form a cycle.
+        """
+        agents: list[SectionSpec] = []
+        static: dict[str, str] = {}
+        visiting: set[str] = set()
+        done: set[str] = set()
+
+        def visit(slot: str) -> None:
+            if slot in done:
+                return
+            if slot in visiting:
+                raise ValueError(f"Section dependencies form a cycle through {slot}")
+            spec = self._specs.get(slot)
+            if spec is None:
+                raise ValueError(f"Unknown section: {slot}")
+            visiting.add(slot)
+            if slot not in available:
+                if spec.applies(request):
+                    for dependency in spec.depends_on:
+                        visit(dependency)
+                    agents.append(spec)
+                else:
+                    static[slot] = spec.otherwise
+            visiting.discard(slot)
+            done.add(slot)
+
+        for slot in slots:
+            if slot in self._specs:
+                visit(slot)
+        return SectionPlan(agents, static)
+
+# Content used for the commercial standards section when the project is not commercial.
+NON_COMMERCIAL_CONTENT = "<p>No commercial-specific standards applicable.</p>"
+
+# Process-wide registry with the sections of the bundled templates.
+registry = SectionRegistry()
+registry.register(SectionSpec(
+    "header_content",
+    lambda request, sections: header_agent.generate_header(request),
+    fields=("project_name", "project_type", "location", "meeting_date"),
+))
+registry.register(SectionSpec(
+    "zoning_content",
+    lambda request, sections: zoning_agent.generate_zoning(request),
+    fields=("project_type", "location"),
+))
+# Commercial standards only apply to commercial projects.
+registry.register(SectionSpec(
+    "commercial_standards_content",
+    lambda request, sections: standards_agent.generate_standards(request, "commercial"),
+    fields=("project_type",),
+    applies=lambda request: request.project_type.lower() == "commercial",
+    otherwise=NON_COMMERCIAL_CONTENT,
+))
+# General standards apply to every project type.
+registry.register(SectionSpec(
+    "general_standards_content",
+    lambda request, sections: standards_agent.generate_standards(request, "general"),
+    fields=("project_type",),
+))
@@ -0,0 +1,131 @@
+"""
+Storage of per-section outputs for incremental regeneration.
+Each generated document's validated sections (whether each was generated fresh or came from a fallback, and the
+generation profile it was generated with) are kept under its request hash, and each document ID remembers the
+request it was generated from, so PATCH /document/{doc_id} can re-run only the agents whose inputs changed.
+The section statuses are also kept per document ID, since documents with the same request hash can be generated
+separately (and end up with different statuses).
+The last freshly generated content of every section is also kept per section inputs and generation profile, as the
+"stale" fallback of app/services/section_policy.py.
+Entries use the cache of app/utils/cache.py: a memory LRU, or SQLite when the store is shared between processes
+(entries such as the request of a document change, so a per-process memory tier would serve stale values).
+"""
+import hashlib
+import json
+import os
+from typing import Iterable
+from app.models.request_models import DocumentRequest
+from app.utils.cache import MemoryCache, ResponseCache, SQLiteCache
+
+class SectionStore:
+    """
+    Maps request hashes to validated sections and document IDs to their requests.
+    """
+
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+
+    @property
+    def shared(self) -> bool:
+        """
+        Whether entries are visible to other processes (SECTION_STORE_PATH is set).
+        """
+        return self.cache.persistent is not None
+
+    def save_request(self, doc_id: str, request: DocumentRequest) -> None:
+        """
+        Remember the request a document was generated from.
+        """
+        self.cache.set(f"request:{doc_id}", request.model_dump_json())
+
+    def load_request(self, doc_id: str) -> DocumentRequest | None:
+        """
+        Return the request of a document, or None if it is unknown or expired.
+        """
+        value = self.cache.get(f"request:{doc_id}")
+        return DocumentRequest.model_validate_json(value) if value is not None else None
+
+    def save_sections(self, request: DocumentRequest, sections: dict[str, str],
+                      statuses: dict[str, str] | None = None, profiles: dict[str, str] | None = None) -> None:
+        """
+        Keep the validated sections generated for a request.
+        :param statuses: Status of each section ("fresh", "fallback" or "failed").
+        :param profiles: Fingerprint of the generation profile of each section (GenerationProfile.fingerprint).
+        """
+        value = {"sections": sections, "statuses": statuses or {}, "profiles": profiles or {}}
+        self.cache.set(f"sections:{request.request_hash()}", json.dumps(value))
+
+    def load_sections(self, request: DocumentRequest) -> dict[str, str]:
+        """
+        Return the sections last generated for a request (empty if they are no longer available).
+        """
+        return self._load(request).get("sections", {})
+
+    def load_statuses(self, request: DocumentRequest) -> dict[str, str]:
+        """
+        Return the status of each section last generated for a request (empty if no longer available).
+        """
+        return self._load(request).get("statuses", {})
+
+    def load_profiles(self, request: DocumentRequest) -> dict[str, str]:
+        """
+        Return the generation profile fingerprint of each section last generated for a request.
+        """
+        return self._load(request).get("profiles", {})
+
+    def save_document_statuses(self, doc_id: str, statuses: dict[str, str]) -> None:
+        """
+        Keep the status of each section of a document ("fresh", "fallback" or "failed").
+        """
+        self.cache.set(f"statuses:{doc_id}", json.dumps(statuses))
+
+    def load_document_statuses(self, doc_id: str) -> dict[str, str]:
+        """
+        Return the status of each section of a document (empty if unknown or expired).
+        """
+        value = self.cache.get(f"statuses:{doc_id}")
+        return json.loads(value) if value is not None else {}
+
+    def _load(self, request: DocumentRequest) -> dict:
+        value = self.cache.get(f"sections:{request.request_hash()}")
+        return json.loads(value) if value is not None else {}
+
+    def save_section(self, slot: str, request: DocumentRequest, fields: Iterable[str], content: str,
+                     profile: str = "") -> None:
+        """
+        Keep freshly generated content of one section under the request fields it depends on.
+        :param profile: Fingerprint of the generation profile the content was generated with.
+        """
+        self.cache.set(self._section_key(slot, request, fields, profile), content)
+
+    def load_section(self, slot: str, request: DocumentRequest, fields: Iterable[str], profile: str = "") -> str | None:
+        """
+        Return the last fresh content of a section generated for the same values of its request fields
+        with the same generation profile.
+        """
+        return self.cache.get(self._section_key(slot, request, fields, profile))
+
+    @staticmethod
+    def _section_key(slot: str, request: DocumentRequest, fields: Iterable[str], profile: str) -> str:
+        inputs = json.dumps([slot, profile, *(getattr(request, name) for name in fields)], default=str)
+        return "section:" + hashlib.sha256(inputs.encode("utf-8")).hexdigest()
+
+def create_section_store() -> SectionStore:
+    """
+    Build the section store from environment configuration.
+    - SECTION_STORE_MAX_ENTRIES: entries kept in memory (default 2048; each document uses three, plus one per
+      section whose inputs were not seen before). Not used with SECTION_STORE_PATH.
+    - SECTION_STORE_TTL: seconds entries are kept (default 86400, 0 disables expiry).
+    - SECTION_STORE_PATH: SQLite file shared between processes (unset keeps entries in memory only). Every read
+      goes to the file, so a process sees the entries other processes saved or updated.
+    """
+    ttl = float(os.getenv("SECTION_STORE_TTL", "86400"))
+    path = os.getenv("SECTION_STORE_PATH", "")
+    if path:
+        # No memory tier: it would keep serving entries that another process has since updated.
+        return SectionStore(ResponseCache(MemoryCache(max_entries=0), SQLiteCache(path, ttl=ttl)))
+    memory = MemoryCache(max_entries=int(os.getenv("SECTION_STORE_MAX_ENTRIES", "2048")), ttl=ttl)
+    return SectionStore(ResponseCache(memory))
+
+# Process-wide section store.
+section_store = create_section_store()
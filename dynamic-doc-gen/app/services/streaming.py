@@ -0,0 +1,113 @@
+"""
+Streaming delivery of generated documents.
+Sends the static parts of the template immediately and each validated section as soon as its agent finishes,
+either as chunked HTML (in document order) or as Server-Sent Events (in completion order).
+Streams are generated as scheduler jobs (run_scheduled), under the same admission control as other documents.
+"""
+import asyncio
+import json
+from typing import AsyncIterator, Callable
+from app.models.request_models import DocumentRequest
+from app.services import orchestrator
+from app.services.scheduler import JobScheduler
+
+# Marks the end of a scheduled stream.
+_END = object()
+
+async def stream_html(request: DocumentRequest, on_complete: Callable[[str], None]) -> AsyncIterator[str]:
+    """
+    Stream the document as chunked HTML.
+    The static header is sent right away; each section is sent once it and every section before it are ready,
+    so the browser can render the document progressively.
+    :param request: The document request.
+    :param on_complete: Called with the assembled document once every section has been sent.
+    """
+    template = orchestrator.prepare_template(request)
+    literals, slots = template.literals, template.slots
+    # Everything up to the first dynamic slot needs no AI content.
+    yield literals[0]
+    sections: dict[str, str] = {}
+    next_index = 0
+    async for slot, content in orchestrator.stream_sections(request):
+        sections[slot] = content
+        # Flush every consecutive section that is now available, in document order.
+        chunk = []
+        while next_index < len(slots) and slots[next_index] in sections:
+            chunk.append(sections[slots[next_index]])
+            chunk.append(literals[next_index + 1])
+            next_index += 1
+        if chunk:
+            yield "".join(chunk)
+    on_complete(template.render(sections))
+
+def _sse_event(event: str, data: dict) -> str:
+    """
+    Format a single Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_events(request: DocumentRequest, doc_id: str, on_complete: Callable[[str], None]) -> AsyncIterator[str]:
+    """
+    Stream the document as Server-Sent Events.
+    - "shell": the template with static fields filled in and an empty <div data-slot="..."> per dynamic slot.
+    - "section": one event per validated section, in the order the agents finish.
+    - "done": sent after the last section; the full document is then also available via GET /document/{doc_id}.
+    :param request: The document request.
+    :param doc_id: The identifier under which the final document is stored.
+    :param on_complete: Called with the assembled document once every section has been sent.
+    """
+    template = orchestrator.prepare_template(request)
+    shell = template.render({slot: f'<div data-slot="{slot}"></div>' for slot in template.slots})
+    yield _sse_event("shell", {"document_id": doc_id, "html": shell})
+    sections: dict[str, str] = {}
+    async for slot, content in orchestrator.stream_sections(request):
+        sections[slot] = content
+        yield _sse_event("section", {"slot": slot, "html": content})
+    on_complete(template.render(sections))
+    yield _sse_event("done", {"document_id": doc_id})
+
+def run_scheduled(scheduler: JobScheduler, job_id: str, chunks: AsyncIterator[str],
+                  priority: int = 0) -> AsyncIterator[str]:
+    """
+    Queue the generation of a stream with the scheduler and return an iterator over its chunks.
+    The chunks are produced once the job gets a slot; the returned iterator waits for them. If its consumer stops
+    early (e.g., the client disconnected), the generation is cancelled, or skipped if it has not started yet.
+    :param job_id: Identifier the job is queued under (the document ID).
+    :raises QueueFullError: If the scheduler queue is at capacity.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    producer: asyncio.Task | None = None
+    abandoned = False
+
+    async def produce() -> None:
+        try:
+            async for chunk in chunks:
+                queue.put_nowait(chunk)
+        except Exception as exc:
+            # Raised to the consumer instead.
+            queue.put_nowait(exc)
+        finally:
+            queue.put_nowait(_END)
+
+    async def run() -> None:
+        nonlocal producer
+        if abandoned:
+            return
+        producer = asyncio.create_task(produce())
+        # The job holds its slot until the stream is done; asyncio.wait does not raise if the producer is cancelled.
+        await asyncio.wait({producer})
+
+    scheduler.submit(job_id, run, priority=priority)
+
+    async def consume() -> AsyncIterator[str]:
+        nonlocal abandoned
+        try:
+            while (item := await queue.get()) is not _END:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            abandoned = True
+            if producer is not None:
+                producer.cancel()
+    return consume()
@@ -1,31 +1,429 @@
 """
 Utility module for AI (OpenAI) client interactions.
+A single long-lived client (created at application startup, closed at shutdown) reuses pooled keep-alive
+connections, enforces per-call deadlines, retries transient failures and can hedge slow requests.
 """
+import asyncio
+import logging
 import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator
+import httpx
 import openai
+from app.utils import metrics
+from app.utils.cache import create_response_cache, make_cache_key
+from app.utils.rate_limit import create_rate_limiter, estimate_tokens
+from app.utils.singleflight import SingleFlight
 
-# Load API key from environment variable.
-openai.api_key = os.getenv("OPENAI_API_KEY", "")
+logger = logging.getLogger(__name__)
 
 # Default model (can be overridden by environment).
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
-async def generate_content(system_prompt: str, user_prompt: str) -> str:
+# Global switch for the response cache (per-call bypass is available via use_cache=False).
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Content-addressed cache of completions, shared by all agents.
+response_cache = create_response_cache()
+
+# Requests/tokens per minute limiter shared by all agents.
+rate_limiter = create_rate_limiter()
+
+# Concurrent identical completions share one API call (disable with LLM_COALESCE_ENABLED=false).
+LLM_COALESCE_ENABLED = os.getenv("LLM_COALESCE_ENABLED", "true").lower() in ("1", "true", "yes")
+llm_flights = SingleFlight()
+
+# Errors worth retrying: rate limiting, server errors, timeouts and connection problems.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+)
+
+@dataclass
+class UsageTotals:
+    """
+    Token usage and call counts accumulated within a track_usage() scope.
+    """
+    calls: int = 0
+    cached_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    parent: "UsageTotals | None" = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, calls: int = 0, cached_calls: int = 0, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        """
+        Add usage to this scope and every enclosing scope.
+        """
+        scope = self
+        while scope is not None:
+            scope.calls += calls
+            scope.cached_calls += cached_calls
+            scope.prompt_tokens += prompt_tokens
+            scope.completion_tokens += completion_tokens
+            scope = scope.parent
+
+# Usage scope of the current task (tasks created inside a scope inherit it).
+_usage_scope: ContextVar[UsageTotals | None] = ContextVar("llm_usage_scope", default=None)
+
+@contextmanager
+def track_usage() -> Iterator[UsageTotals]:
+    """
+    Accumulate the LLM calls and tokens spent inside the with-block (including tasks it starts).
+    """
+    totals = UsageTotals(parent=_usage_scope.get())
+    token = _usage_scope.set(totals)
+    try:
+        yield totals
+    finally:
+        _usage_scope.reset(token)
+
+def _record_usage(**usage) -> None:
+    scope = _usage_scope.get()
+    if scope is not None:
+        scope.add(**usage)
+
+# Model used instead of OPENAI_MODEL by calls of the current task (e.g., a retry on a faster model).
+_model_override: ContextVar[str | None] = ContextVar("llm_model_override", default=None)
+
+@contextmanager
+def use_model(model: str) -> Iterator[None]:
+    """
+    Send the completions requested inside the with-block (including tasks it starts) to another model.
+    """
+    token = _model_override.set(model)
+    try:
+        yield
+    finally:
+        _model_override.reset(token)
+
+def current_model() -> str:
+    """
+    Return the model completions of the current task are sent to.
+    """
+    return _model_override.get() or OPENAI_MODEL
+
+# Generation parameters applied to calls of the current task unless the call passes its own.
+_default_params: ContextVar[dict | None] = ContextVar("llm_default_params", default=None)
+
+@contextmanager
+def use_params(**params) -> Iterator[None]:
+    """
+    Apply generation parameters (e.g., max_tokens, temperature) to the completions requested inside the
+    with-block (including tasks it starts). Parameters passed to generate_content take precedence.
+    """
+    token = _default_params.set({**(_default_params.get() or {}), **params})
+    try:
+        yield
+    finally:
+        _default_params.reset(token)
+
+class LatencyTracker:
+    """
+    Rolling window of observed call latencies, used to decide when to hedge.
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Return the q-quantile of the window, or None if there are no samples.
+        """
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class LLMClient:
+    """
+    Long-lived async OpenAI client with connection pooling, deadlines, jittered retries and hedging.
+    """
+
+    def __init__(self, api_key: str | None = None, base_url: str | None = None, timeout: float = 60.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 max_connections: int = 100, max_keepalive_connections: int = 20, keepalive_expiry: float = 30.0,
+                 hedge: bool = False, hedge_quantile: float = 0.95, hedge_min_samples: int = 20):
+        """
+        :param timeout: Default deadline in seconds for one generate call, retries included.
+        :param max_retries: Retries after the first attempt for 429, 5xx, timeout and connection errors.
+        :param backoff_base: Base delay of the exponential backoff (full jitter is applied).
+        :param backoff_max: Upper bound of a single backoff delay.
+        :param max_connections: Size of the HTTP connection pool.
+        :param max_keepalive_connections: Idle connections kept open for reuse.
+        :param keepalive_expiry: Seconds an idle connection is kept.
+        :param hedge: Send a duplicate request when a call runs longer than the observed hedge_quantile latency.
+        :param hedge_quantile: Latency quantile that triggers a hedged request.
+        :param hedge_min_samples: Number of observed latencies required before hedging starts.
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        # Counters for observability.
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0}
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            # openai.Timeout is the timeout type of the HTTP library the SDK is built on.
+            timeout=openai.Timeout(timeout, connect=min(10.0, timeout)),
+        )
+        # Retries are handled here (with deadlines and jitter), so the SDK's own retries are disabled.
+        self._client = openai.AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY", ""),
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_client,
+        )
+
+    @classmethod
+    def from_env(cls) -> "LLMClient":
+        """
+        Build a client from environment configuration (see the README for the LLM_* variables).
+        """
+        return cls(
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30")),
+            hedge=os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes"),
+            hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+            hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        )
+
+    async def close(self) -> None:
+        """
+        Close the pooled HTTP connections.
+        """
+        await self._client.close()
+
+    async def complete(self, model: str, messages: list[dict], deadline: float | None = None,
+                       hedge: bool | None = None, **params):
+        """
+        Request a chat completion, retrying transient errors until the deadline.
+        :param model: Model name.
+        :param messages: Chat messages.
+        :param deadline: Seconds allowed for the whole call including retries (defaults to the client timeout).
+        :param hedge: Override the client's hedging setting for this call.
+        :return: The completion object returned by the API.
+        :raises asyncio.TimeoutError: If the deadline passes before a successful response.
+        """
+        budget = deadline if deadline is not None else self.timeout
+        try:
+            return await asyncio.wait_for(
+                self._complete_with_retries(model, messages, self.hedge if hedge is None else hedge, params),
+                timeout=budget,
+            )
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+
+    async def _complete_with_retries(self, model: str, messages: list[dict], hedge: bool, params: dict):
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt(model, messages, hedge, params)
+            except RETRYABLE_ERRORS as exc:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, exc))
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        """
+        Exponential backoff with full jitter, honouring a Retry-After header when the server sends one.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        response = getattr(exc, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    async def _attempt(self, model: str, messages: list[dict], hedge: bool, params: dict):
+        """
+        One logical attempt, possibly raced against a hedged duplicate.
+        """
+        threshold = None
+        if hedge and len(self.latency) >= self.hedge_min_samples:
+            threshold = self.latency.quantile(self.hedge_quantile)
+        primary = asyncio.create_task(self._request(model, messages, params))
+        if threshold is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done:
+            return primary.result()
+        # The call is slower than the observed tail: race a duplicate request against it.
+        self.stats["hedges"] += 1
+        backup = asyncio.create_task(self._request(model, messages, params))
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _request(self, model: str, messages: list[dict], params: dict):
+        self.stats["requests"] += 1
+        started = time.monotonic()
+        response = await self._client.chat.completions.create(model=model, messages=messages, **params)
+        self.latency.record(time.monotonic() - started)
+        return response
+
+# The shared client; created at application startup (or lazily on first use outside the app).
+_client: LLMClient | None = None
+
+def init_client() -> LLMClient | None:
     """
-    Use OpenAI's ChatCompletion API to generate content based on given prompts.
+    Create the shared client (called at application startup).
+    If it cannot be created (e.g., no API key is configured) the application still starts
+    and the error is raised by the first generation call instead.
+    """
+    global _client
+    if _client is None:
+        try:
+            _client = LLMClient.from_env()
+        except openai.OpenAIError as exc:
+            logger.warning("OpenAI client not initialized at startup: %s", exc)
+    return _client
+
+def get_client() -> LLMClient:
+    """
+    Return the shared client, creating it if the application did not do so yet.
+    """
+    global _client
+    if _client is None:
+        _client = LLMClient.from_env()
+    return _client
+
+async def close_client() -> None:
+    """
+    Close the shared client and its connection pool (called at application shutdown).
+    """
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+async def generate_content(system_prompt: str, user_prompt: str, use_cache: bool = True,
+                           deadline: float | None = None, **params) -> str:
+    """
+    Use OpenAI's Chat Completions API to generate content based on given prompts.
+    Identical requests (same model, prompts and parameters) are served from the response cache,
+    and concurrent identical requests share a single in-flight API call.
     :param system_prompt: The system level instructions for the AI.
     :param user_prompt: The user query or request for content generation.
+    :param use_cache: Set to False to bypass the cache (and coalescing) and force a fresh completion.
+    :param deadline: Seconds allowed for this call including retries (defaults to LLM_TIMEOUT).
+    :param params: Extra generation parameters passed through to the API (e.g., temperature), on top of the
+                   ones set with use_params().
     :return: Generated content as a string.
     """
-    # Perform the API call to OpenAI (async).
-    response = await openai.ChatCompletion.acreate(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-    )
+    model = current_model()
+    params = {**(_default_params.get() or {}), **params}
+    cache_key = make_cache_key(model, system_prompt, user_prompt, params)
+    if LLM_CACHE_ENABLED and use_cache:
+        # Look up a previous completion for exactly this request.
+        cached = await response_cache.get_async(cache_key)
+        if cached is not None:
+            _record_usage(cached_calls=1)
+            metrics.llm_calls.inc(model=model, outcome="cache_hit")
+            return cached
+    else:
+        response_cache.record_bypass()
+    async def fetch() -> str:
+        content = await _request_completion(model, system_prompt, user_prompt, deadline, params)
+        if LLM_CACHE_ENABLED and use_cache:
+            await response_cache.set_async(cache_key, content)
+        return content
+    if use_cache and LLM_COALESCE_ENABLED:
+        # Identical calls already in flight (e.g., the same standards prompt for two documents) share one request.
+        if llm_flights.in_flight(cache_key):
+            metrics.llm_calls.inc(model=model, outcome="coalesced")
+        return await llm_flights.do(cache_key, fetch)
+    return await fetch()
+
+async def _request_completion(model: str, system_prompt: str, user_prompt: str, deadline: float | None,
+                              params: dict) -> str:
+    """
+    Call the API under the rate limits and return the stripped completion text.
+    """
+    # Wait for capacity under the global rate limits before calling the API.
+    estimated_tokens = estimate_tokens(system_prompt, user_prompt, completion_tokens=params.get("max_tokens", 512))
+    await rate_limiter.acquire(estimated_tokens)
+    # Perform the API call to OpenAI (async) through the pooled client.
+    with metrics.span("llm_request", model=model):
+        response = await get_client().complete(
+            model,
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            deadline=deadline,
+            **params
+        )
     # Extract the assistant's reply content.
-    content = response["choices"][0]["message"]["content"]
+    content = response.choices[0].message.content or ""
+    # Charge the rate limiter for the tokens actually used, and record them for the current usage scope.
+    usage = response.usage
+    rate_limiter.settle(estimated_tokens, usage.total_tokens if usage else 0)
+    _record_usage(
+        calls=1,
+        prompt_tokens=usage.prompt_tokens if usage else 0,
+        completion_tokens=usage.completion_tokens if usage else 0,
+    )
+    metrics.llm_calls.inc(model=model, outcome="api")
+    if usage:
+        metrics.llm_tokens.inc(usage.prompt_tokens, model=model, kind="prompt")
+        metrics.llm_tokens.inc(usage.completion_tokens, model=model, kind="completion")
     # Strip any trailing whitespace/newlines for cleanliness.
     return content.strip()
+
+# Cache and client counters exposed at GET /metrics.
+metrics.registry.gauge("docgen_llm_cache_memory_hits", "Response cache memory hits",
+                       lambda: response_cache.stats["memory_hits"])
+metrics.registry.gauge("docgen_llm_cache_persistent_hits", "Response cache persistent hits",
+                       lambda: response_cache.stats["persistent_hits"])
+metrics.registry.gauge("docgen_llm_cache_misses", "Response cache misses", lambda: response_cache.stats["misses"])
+metrics.registry.gauge("docgen_llm_retries", "LLM request retries", lambda: _client.stats["retries"] if _client else 0)
+metrics.registry.gauge("docgen_llm_hedges", "Hedged LLM requests", lambda: _client.stats["hedges"] if _client else 0)
+metrics.registry.gauge("docgen_llm_timeouts", "LLM calls that hit their deadline",
+                       lambda: _client.stats["timeouts"] if _client else 0)
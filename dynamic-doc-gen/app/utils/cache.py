@@ -0,0 +1,247 @@
+"""
+Content-addressed cache for LLM responses.
+Provides an in-process LRU tier (bounded by entry count and TTL) backed by an optional
+persistent SQLite tier so cached completions survive process restarts.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+def make_cache_key(model: str, system_prompt: str, user_prompt: str, params: dict[str, Any] | None = None) -> str:
+    """
+    Build a content-addressed key for a completion request.
+    :param model: The model name the completion is requested from.
+    :param system_prompt: The system level instructions for the AI.
+    :param user_prompt: The user query or request for content generation.
+    :param params: Additional generation parameters (temperature, max_tokens, ...).
+    :return: A hex SHA-256 digest identifying the request.
+    """
+    # Serialize canonically (sorted keys, no whitespace) so equal requests hash equally.
+    payload = json.dumps(
+        {"model": model, "system": system_prompt, "user": user_prompt, "params": params or {}},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryCache:
+    """
+    Thread-safe in-process LRU cache with per-entry TTL expiry.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float | None = 3600.0):
+        """
+        :param max_entries: Maximum number of entries kept before evicting the least recently used.
+        :param ttl: Seconds an entry stays valid (None or 0 disables expiry).
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        # Maps key -> (expires_at, value); order tracks recency of use.
+        self._entries: OrderedDict[str, tuple[float | None, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        """
+        Return the cached value for key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                # Drop expired entries lazily on access.
+                del self._entries[key]
+                return None
+            # Mark as most recently used.
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store value under key, evicting the least recently used entries if over capacity.
+        """
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Remove all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCache:
+    """
+    Persistent cache tier stored in a local SQLite database file.
+    """
+
+    def __init__(self, path: str, ttl: float | None = None):
+        """
+        :param path: Filesystem path of the SQLite database (created if missing).
+        :param ttl: Seconds an entry stays valid (None or 0 disables expiry).
+        """
+        self.path = path
+        self.ttl = ttl or None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # A single connection shared across threads, serialized by a lock.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        """
+        Return the cached value for key, or None if it is missing or expired.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl is not None and created_at + self.ttl <= time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store value under key, replacing any previous entry.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """
+        Remove all entries.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+class ResponseCache:
+    """
+    Two-tier cache: a fast in-memory LRU in front of an optional persistent SQLite tier.
+    Hits in the persistent tier are promoted into memory.
+    """
+
+    def __init__(self, memory: MemoryCache, persistent: SQLiteCache | None = None):
+        self.memory = memory
+        self.persistent = persistent
+        # Hit/miss counters for observability.
+        self.stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "bypassed": 0}
+
+    def get(self, key: str) -> str | None:
+        """
+        Look up key in memory first, then in the persistent tier.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+        if self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.stats["persistent_hits"] += 1
+                # Promote to memory so later lookups skip the disk.
+                self.memory.set(key, value)
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store value in every configured tier.
+        """
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self.persistent.set(key, value)
+
+    async def get_async(self, key: str) -> str | None:
+        """
+        Like get(), but reads the persistent tier in a worker thread so the event loop never waits on disk.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+        if self.persistent is not None:
+            value = await asyncio.to_thread(self.persistent.get, key)
+            if value is not None:
+                self.stats["persistent_hits"] += 1
+                self.memory.set(key, value)
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    async def set_async(self, key: str, value: str) -> None:
+        """
+        Like set(), but writes the persistent tier in a worker thread.
+        """
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            await asyncio.to_thread(self.persistent.set, key, value)
+
+    def record_bypass(self) -> None:
+        """
+        Count a call that deliberately skipped the cache.
+        """
+        self.stats["bypassed"] += 1
+
+    def clear(self) -> None:
+        """
+        Remove all entries from every tier and reset the counters.
+        """
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+        for name in self.stats:
+            self.stats[name] = 0
+
+def create_response_cache() -> ResponseCache:
+    """
+    Build the response cache from environment configuration.
+    - LLM_CACHE_MAX_ENTRIES: size of the in-memory LRU tier (default 1024, 0 disables it).
+    - LLM_CACHE_TTL: seconds before an entry expires (default 86400, 0 disables expiry).
+    - LLM_CACHE_PATH: SQLite file for the persistent tier (unset disables it).
+    """
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+    ttl = float(os.getenv("LLM_CACHE_TTL", "86400"))
+    path = os.getenv("LLM_CACHE_PATH", "")
+    persistent = SQLiteCache(path, ttl=ttl) if path else None
+    return ResponseCache(MemoryCache(max_entries=max_entries, ttl=ttl), persistent)
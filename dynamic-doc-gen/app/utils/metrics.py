@@ -0,0 +1,256 @@
+"""
+Lightweight metrics for the generation pipeline.
+Provides Prometheus-style counters, gauges and histograms, timing spans tagged with the current document ID,
+and a per-document timing breakdown. When METRICS_ENABLED is false every call returns immediately.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+# Global switch; when disabled spans and counters are no-ops.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Default histogram buckets in seconds (covering sub-millisecond rendering up to slow LLM calls).
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Number of documents whose timing breakdown is kept.
+MAX_TRACKED_DOCUMENTS = int(os.getenv("METRICS_MAX_TRACKED_DOCUMENTS", "1000"))
+
+# Document being generated by the current task (tasks started inside inherit it).
+current_document_id: ContextVar[str | None] = ContextVar("current_document_id", default=None)
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    # Empty label values are equivalent to an absent label, so they are left out.
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values) if value != ""]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """
+    Monotonically increasing value per label set.
+    """
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in sorted(self._values.items())]
+
+class Gauge(_Metric):
+    """
+    Value read from a callback at scrape time.
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name} {float(self.read())}"]
+
+class Histogram(_Metric):
+    """
+    Cumulative bucket counts, sum and count per label set.
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Maps label values -> [bucket counts..., sum, count].
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return int(state[-1]) if state else 0
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, state in sorted(self._values.items()):
+            for index, bound in enumerate(self.buckets):
+                le = 'le="' + str(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {state[index]}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+class Registry:
+    """
+    Collection of metrics rendered together in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry exposed at GET /metrics.
+registry = Registry()
+
+# Duration of every pipeline stage, labelled by stage and (where relevant) section/model/mode.
+stage_duration = registry.histogram(
+    "docgen_stage_duration_seconds",
+    "Duration of generation pipeline stages",
+    ("stage", "section", "model", "mode"),
+)
+llm_tokens = registry.counter("docgen_llm_tokens_total", "Tokens used by LLM calls", ("model", "kind"))
+llm_calls = registry.counter("docgen_llm_calls_total", "LLM generate calls by outcome", ("model", "outcome"))
+section_outcomes = registry.counter("docgen_sections_total", "Generated sections by status", ("section", "status"))
+profile_duration = registry.histogram(
+    "docgen_profile_duration_seconds", "Section generation time by generation profile", ("profile", "model")
+)
+profile_tokens = registry.counter(
+    "docgen_profile_tokens_total", "Tokens used by generation profile", ("profile", "kind")
+)
+
+# Per-document timing breakdown: document ID -> list of spans (most recent documents only).
+_document_timings: OrderedDict[str, list[dict]] = OrderedDict()
+_timings_lock = threading.Lock()
+
+def observe(stage: str, seconds: float, document_id: str | None = None, **labels) -> None:
+    """
+    Record a completed stage duration in the stage histogram and the document's timing breakdown.
+    :param document_id: Document the stage belongs to (defaults to the current document context).
+    """
+    if not METRICS_ENABLED:
+        return
+    stage_duration.observe(seconds, stage=stage, **labels)
+    document_id = document_id or current_document_id.get()
+    if document_id is None:
+        return
+    entry = {"stage": stage, **labels, "seconds": round(seconds, 6)}
+    with _timings_lock:
+        spans = _document_timings.get(document_id)
+        if spans is None:
+            spans = _document_timings[document_id] = []
+            while len(_document_timings) > MAX_TRACKED_DOCUMENTS:
+                _document_timings.popitem(last=False)
+        spans.append(entry)
+
+class _Span:
+    __slots__ = ("stage", "labels", "started")
+
+    def __init__(self, stage: str, labels: dict):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.stage, time.perf_counter() - self.started, **self.labels)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(stage: str, **labels):
+    """
+    Time a block as a pipeline stage (usable in sync and async code).
+    Returns a shared no-op context manager when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return _Span(stage, labels)
+
+@contextmanager
+def document_context(document_id: str) -> Iterator[None]:
+    """
+    Tag every span recorded inside the block (and in tasks it starts) with document_id.
+    """
+    token = current_document_id.set(document_id)
+    try:
+        yield
+    finally:
+        current_document_id.reset(token)
+
+def document_timings(document_id: str) -> list[dict]:
+    """
+    Return the recorded spans of a document (empty if unknown or metrics are disabled).
+    """
+    with _timings_lock:
+        return list(_document_timings.get(document_id, ()))
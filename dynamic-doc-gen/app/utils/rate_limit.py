@@ -0,0 +1,102 @@
+"""
+Global token-bucket rate limiting for LLM calls.
+All agents share one limiter so the process as a whole stays within the provider's
+requests-per-minute and tokens-per-minute quotas.
+"""
+import asyncio
+import os
+import time
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a fixed rate.
+    The balance may go negative when a debit is corrected after the fact (e.g., actual token usage),
+    which simply delays later acquisitions.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        """
+        :param rate_per_minute: Tokens added per minute.
+        :param capacity: Maximum balance (defaults to one minute worth of tokens).
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        Wait until amount tokens are available and take them.
+        :return: Seconds spent waiting.
+        """
+        # A single request larger than the bucket could never be served otherwise.
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return waited
+            delay = (amount - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def adjust(self, delta: float) -> None:
+        """
+        Add (positive) or remove (negative) tokens without waiting.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+class LLMRateLimiter:
+    """
+    Combined requests-per-minute and tokens-per-minute limiter.
+    A limit of 0 disables the corresponding bucket.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """
+        Wait for capacity for one request of roughly estimated_tokens tokens.
+        :return: Seconds spent waiting.
+        """
+        waited = 0.0
+        if self.requests is not None:
+            waited += await self.requests.acquire(1)
+        if self.tokens is not None:
+            waited += await self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Correct the token bucket once the real usage of a request is known.
+        """
+        if self.tokens is not None and actual_tokens:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+def estimate_tokens(*texts: str, completion_tokens: int = 512) -> int:
+    """
+    Rough token estimate for a request (about four characters per token plus the expected completion).
+    """
+    return sum(len(text) for text in texts) // 4 + completion_tokens
+
+def create_rate_limiter() -> LLMRateLimiter:
+    """
+    Build the limiter from LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE (0 or unset means unlimited).
+    """
+    return LLMRateLimiter(
+        requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+        tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+    )
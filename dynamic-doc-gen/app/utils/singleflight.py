@@ -0,0 +1,45 @@
+"""
+Single-flight coalescing of concurrent identical work.
+While a call for a key is in flight, further callers with the same key await the same result
+instead of starting their own call.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable
+
+class SingleFlight:
+    """
+    Group of in-flight calls keyed by a string (typically a content hash).
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+        # Counters for observability: calls that did the work vs. calls that joined an in-flight one.
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn() unless a call with the same key is already in flight, in which case wait for its result.
+        The work runs in its own task, so one waiter being cancelled does not cancel it for the others.
+        """
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            self.stats["leaders"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: str) -> bool:
+        """
+        Whether a call for key is currently running.
+        """
+        return key in self._inflight
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved if every waiter was cancelled before it arrived.
+        if not task.cancelled():
+            task.exception()
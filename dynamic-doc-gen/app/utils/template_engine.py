@@ -0,0 +1,149 @@
+"""
+Minimal precompiled template engine for the HTML document templates.
+Templates are parsed once into literal segments and {{placeholder}} slots, then rendered in a single pass
+with a join, so substituted content is never re-scanned for placeholders.
+"""
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+# Matches {{name}} placeholders (optionally padded with spaces inside the braces).
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# Directory containing the bundled HTML templates.
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+
+class CompiledTemplate:
+    """
+    A template split into literal segments and placeholder slots.
+    The document is literals[0] + value(slots[0]) + literals[1] + ... + literals[-1].
+    """
+
+    def __init__(self, literals: list[str], slots: list[str]):
+        """
+        :param literals: Literal text segments; always exactly one more than slots.
+        :param slots: Placeholder names in document order (a name may appear more than once).
+        """
+        self.literals = literals
+        self.slots = slots
+
+    @classmethod
+    def compile(cls, source: str) -> "CompiledTemplate":
+        """
+        Parse template source into literals and slots.
+        """
+        literals: list[str] = []
+        slots: list[str] = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            literals.append(source[position:match.start()])
+            slots.append(match.group(1))
+            position = match.end()
+        literals.append(source[position:])
+        return cls(literals, slots)
+
+    @property
+    def slot_names(self) -> set[str]:
+        """
+        The distinct placeholder names used by the template.
+        """
+        return set(self.slots)
+
+    def render(self, context: dict[str, str]) -> str:
+        """
+        Render the template in a single pass.
+        Placeholders missing from context are left in the output unchanged.
+        """
+        parts = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            value = context.get(slot)
+            parts.append(value if value is not None else "{{" + slot + "}}")
+            parts.append(literal)
+        return "".join(parts)
+
+    def partial(self, context: dict[str, str]) -> "CompiledTemplate":
+        """
+        Substitute the placeholders present in context and return a template of the remaining slots.
+        Useful to pre-render request fields once and stream the dynamic sections afterwards.
+        """
+        literals = [self.literals[0]]
+        slots: list[str] = []
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            value = context.get(slot)
+            if value is None:
+                slots.append(slot)
+                literals.append(literal)
+            else:
+                # Merge the value and the following literal into the current segment.
+                literals[-1] = literals[-1] + value + literal
+        return CompiledTemplate(literals, slots)
+
+class TemplateRegistry:
+    """
+    Registry of named templates, compiled once and recompiled when the file on disk changes.
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        """
+        :param check_interval: Minimum seconds between modification-time checks of a template file.
+        """
+        self.check_interval = check_interval
+        # Maps name -> path of the template source.
+        self._paths: dict[str, Path] = {}
+        # Maps name -> (mtime in ns, last check time, compiled template).
+        self._compiled: dict[str, tuple[int, float, CompiledTemplate]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, path: str | Path) -> None:
+        """
+        Register a template file under a name (replacing any previous registration).
+        """
+        with self._lock:
+            self._paths[name] = Path(path)
+            self._compiled.pop(name, None)
+
+    def register_directory(self, directory: str | Path) -> None:
+        """
+        Register every *.html file in a directory under its file stem (e.g., base_document).
+        """
+        for path in sorted(Path(directory).glob("*.html")):
+            self.register(path.stem, path)
+
+    @property
+    def names(self) -> list[str]:
+        """
+        Names of the registered templates.
+        """
+        return sorted(self._paths)
+
+    def get(self, name: str) -> CompiledTemplate:
+        """
+        Return the compiled template, recompiling it if the source file changed.
+        :raises KeyError: If no template is registered under name.
+        """
+        path = self._paths[name]
+        now = time.monotonic()
+        cached = self._compiled.get(name)
+        if cached is not None and now - cached[1] < self.check_interval:
+            return cached[2]
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._compiled.get(name)
+            if cached is not None and cached[0] == mtime:
+                self._compiled[name] = (mtime, now, cached[2])
+                return cached[2]
+            compiled = CompiledTemplate.compile(path.read_text(encoding="utf-8"))
+            self._compiled[name] = (mtime, now, compiled)
+            return compiled
+
+# Default registry with all bundled templates.
+registry = TemplateRegistry()
+registry.register_directory(TEMPLATES_DIR)
+
+def get_template(name: str = "base_document") -> CompiledTemplate:
+    """
+    Return a compiled template from the default registry.
+    """
+    return registry.get(name)
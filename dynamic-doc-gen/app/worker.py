@@ -0,0 +1,172 @@
+"""
+Document generation worker processes.
+Each process claims jobs from the durable job queue, runs the orchestrator and writes the finished document
+to the shared result store (and its sections to the shared section store), so generation scales independently
+of the API processes. Run next to an API started with JOB_BACKEND=queue, RESULT_STORE_BACKEND=sqlite and
+SECTION_STORE_PATH set:
+    python -m app.worker --processes 4 --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+from app.agents import validation_agent
+from app.services import notifications, orchestrator
+from app.services.job_queue import LEASE_EXPIRED, ClaimedJob, SQLiteJobQueue
+from app.services.result_store import ResultStore, create_result_store
+from app.utils import ai_clients, metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before polling the queue again.
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.2"))
+
+# Seconds finished jobs are kept in the queue database (for status reporting).
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+# Seconds between checks for abandoned jobs and purges of old ones.
+MAINTENANCE_INTERVAL = 30.0
+
+async def _keep_lease(queue: SQLiteJobQueue, job: ClaimedJob, generation: asyncio.Task) -> None:
+    """
+    Renew a job's lease while it is generated. If the lease was lost (the job was handed to another worker),
+    stop the generation so the document is not paid for twice.
+    """
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not queue.renew(job.job_id, job.worker):
+            logger.warning("Lost the lease of job %s, stopping its generation", job.job_id)
+            generation.cancel()
+            return
+
+async def run_job(queue: SQLiteJobQueue, store: ResultStore, worker_id: str) -> bool:
+    """
+    Claim and run one job.
+    A job whose lease was lost meanwhile (another worker may be running it) is abandoned without writing a result.
+    :return: False if the queue was empty.
+    """
+    job = queue.claim(worker_id)
+    if job is None:
+        return False
+    metrics.observe("queue_wait", time.time() - job.enqueued_at, document_id=job.job_id)
+    with metrics.document_context(job.job_id):
+        generation = asyncio.create_task(orchestrator.generate_document(job.request))
+    lease = asyncio.create_task(_keep_lease(queue, job, generation))
+    try:
+        html_doc = await generation
+    except asyncio.CancelledError:
+        if lease.done():
+            # Cancelled by _keep_lease: the job belongs to another worker now.
+            return True
+        raise
+    except Exception as exc:
+        # A failing job must not take the worker down with it.
+        logger.exception("Job %s failed", job.job_id)
+        error = str(exc) or type(exc).__name__
+        if queue.fail(job.job_id, error, worker=job.worker):
+            store.fail(job.job_id, error)
+            notifications.document_finished(job.job_id, job.request.request_hash(), "failed", error,
+                                            job.request.callback_url)
+        return True
+    finally:
+        lease.cancel()
+    if not queue.complete(job.job_id, worker=job.worker):
+        logger.warning("Discarding the result of job %s: its lease expired", job.job_id)
+        return True
+    store.put(job.job_id, html_doc)
+    notifications.document_finished(job.job_id, job.request.request_hash(), callback_url=job.request.callback_url)
+    return True
+
+async def run_worker(queue: SQLiteJobQueue, store: ResultStore, concurrency: int = 4,
+                     stop: asyncio.Event | None = None, poll_interval: float = WORKER_POLL_INTERVAL) -> None:
+    """
+    Run jobs with up to `concurrency` documents in flight until `stop` is set.
+    Jobs already started when `stop` is set are finished first.
+    """
+    stop = stop or asyncio.Event()
+    worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    async def slot() -> None:
+        while not stop.is_set():
+            if not await run_job(queue, store, worker_id):
+                # Queue is empty: wait for new jobs (or the stop signal).
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def maintenance() -> None:
+        while not stop.is_set():
+            recovered, failed = queue.requeue_stale()
+            if recovered:
+                logger.warning("Re-queued %d job(s) whose worker lease expired", recovered)
+            for job_id, request in failed:
+                logger.error("Job %s failed: its worker lease expired %d times", job_id, queue.max_attempts)
+                store.fail(job_id, LEASE_EXPIRED)
+                notifications.document_finished(job_id, request.request_hash(), "failed", LEASE_EXPIRED,
+                                                request.callback_url)
+            queue.purge(JOB_RETENTION)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=MAINTENANCE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    await asyncio.gather(maintenance(), *(slot() for _ in range(concurrency)))
+
+async def _serve(concurrency: int) -> None:
+    """
+    Entry point of one worker process: set up shared clients, run jobs until SIGTERM/SIGINT, clean up.
+    """
+    queue = SQLiteJobQueue.from_env()
+    store = create_result_store()
+    ai_clients.init_client()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await run_worker(queue, store, concurrency, stop)
+    finally:
+        # Webhooks still being retried are dropped.
+        await notifications.shutdown()
+        await ai_clients.close_client()
+        validation_agent.shutdown_executor()
+        store.close()
+        queue.close()
+
+def _process_main(concurrency: int) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s")
+    asyncio.run(_serve(concurrency))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "2")),
+                        help="Worker processes (default WORKER_PROCESSES or 2)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")),
+                        help="Documents generated at the same time per process (default WORKER_CONCURRENCY or 4)")
+    args = parser.parse_args()
+    if os.getenv("RESULT_STORE_BACKEND", "memory") != "sqlite":
+        parser.error("Workers need a result store shared with the API: set RESULT_STORE_BACKEND=sqlite")
+    if not os.getenv("SECTION_STORE_PATH"):
+        parser.error("Workers need a section store shared with the API: set SECTION_STORE_PATH")
+    # Spawned (not forked) processes do not inherit locks or connections of the parent.
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_process_main, args=(args.concurrency,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    # Forward SIGTERM so every worker finishes its current jobs before exiting.
+    signal.signal(signal.SIGTERM, lambda signum, frame: [process.terminate() for process in processes])
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # The children received the same SIGINT and finish their current jobs.
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-benchmarks of the CPU-bound steps of a generation at several document sizes:
+- whole-document validation (validation_agent.validate_document),
+- per-section validation in both modes (validation_agent.validate_sections),
+- template rendering (template_engine.CompiledTemplate.render).
+Results are printed and written to a JSON file. Run from the project root:
+    python -m benchmarks.bench_micro --sizes 1000 10000 100000
+"""
+import argparse
+import timeit
+from app.agents import validation_agent
+from app.utils.template_engine import get_template
+from benchmarks.bench_template import _context
+from benchmarks.results import save_results
+
+# Dynamic sections filled by the agents.
+SECTION_SLOTS = ("header_content", "zoning_content", "commercial_standards_content", "general_standards_content")
+
+def _section(size: int) -> str:
+    """
+    A section of roughly size characters shaped like agent output: subsections, an inline style and a script.
+    """
+    subsection = (
+        '<div class="subsection"><h4 class="subsection-title">Requirement</h4>'
+        '<p style="color:red">Setbacks, height limits and parking ratios apply to the proposed building.</p></div>'
+    )
+    return subsection * max(1, size // len(subsection)) + "<script>alert(1)</script>"
+
+def _time(function, iterations: int) -> float:
+    """
+    Best of three runs, in microseconds per call.
+    """
+    return min(timeit.repeat(function, number=iterations, repeat=3)) / iterations * 1e6
+
+def run(sizes: list[int], iterations: int) -> dict[str, dict[str, float]]:
+    """
+    Measure every benchmark at every section size.
+    :return: Mapping of benchmark name to {section size: microseconds per call}.
+    """
+    results: dict[str, dict[str, float]] = {
+        "template_render_us": {}, "validate_document_us": {},
+        "validate_sections_stream_us": {}, "validate_sections_reference_us": {},
+    }
+    template = get_template()
+    for size in sizes:
+        # Larger documents get fewer iterations so every measurement takes a similar time.
+        count = max(1, iterations * 1000 // max(size, 1000))
+        sections = {slot: _section(size) for slot in SECTION_SLOTS}
+        context = {**_context(size), **sections}
+        document = template.render(context)
+        results["template_render_us"][str(size)] = _time(lambda: template.render(context), count * 10)
+        results["validate_document_us"][str(size)] = _time(lambda: validation_agent.validate_document(document), count)
+        results["validate_sections_stream_us"][str(size)] = _time(
+            lambda: validation_agent.validate_sections(sections, "stream"), count)
+        results["validate_sections_reference_us"][str(size)] = _time(
+            lambda: validation_agent.validate_sections(sections, "reference"), count)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Characters per dynamic section")
+    parser.add_argument("--iterations", type=int, default=50, help="Calls per measurement at 1000 characters")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/micro-<timestamp>.json)")
+    args = parser.parse_args()
+    results = run(args.sizes, args.iterations)
+    print(f"{'benchmark':<32}" + "".join(f"{size:>14}" for size in args.sizes))
+    for name, by_size in results.items():
+        print(f"{name:<32}" + "".join(f"{by_size[str(size)]:>14.1f}" for size in args.sizes))
+    path = save_results("micro", {"sizes": args.sizes, "iterations": args.iterations}, results, args.output)
+    print(f"results written to {path}")
+
+if __name__ == "__main__":
+    main()
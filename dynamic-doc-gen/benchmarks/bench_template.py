@@ -0,0 +1,57 @@
+"""
+Micro-benchmark comparing the precompiled template engine with the previous approach
+(reading the template from disk and running one str.replace pass per placeholder).
+Run from the project root:
+    python -m benchmarks.bench_template --iterations 2000
+"""
+import argparse
+import timeit
+from app.utils.template_engine import TEMPLATES_DIR, get_template
+
+def _context(section_size: int) -> dict[str, str]:
+    """
+    Build a render context with dynamic sections of roughly section_size characters each.
+    """
+    paragraph = "<p>" + ("Lorem ipsum dolor sit amet. " * max(1, section_size // 28)) + "</p>"
+    return {
+        "project_name": "Benchmark Tower",
+        "project_type": "Commercial",
+        "location": "1 Benchmark Way",
+        "meeting_date": "April 27, 2025",
+        "header_content": paragraph,
+        "zoning_content": paragraph,
+        "commercial_standards_content": paragraph,
+        "general_standards_content": paragraph,
+    }
+
+def legacy_render(context: dict[str, str]) -> str:
+    """
+    The previous approach: read the file and replace each placeholder in turn.
+    """
+    filled = (TEMPLATES_DIR / "base_document.html").read_text(encoding="utf-8")
+    for name, value in context.items():
+        filled = filled.replace("{{" + name + "}}", value)
+    return filled
+
+def compiled_render(context: dict[str, str]) -> str:
+    """
+    The precompiled engine: one pass over literal segments and slots.
+    """
+    return get_template().render(context)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="Renders per measurement")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 5000, 50000], help="Section sizes in characters")
+    args = parser.parse_args()
+    print(f"{'section size':>12} {'legacy us':>12} {'compiled us':>12} {'speedup':>8}")
+    for size in args.sizes:
+        context = _context(size)
+        # Both approaches must produce the same document.
+        assert legacy_render(context) == compiled_render(context)
+        legacy = min(timeit.repeat(lambda: legacy_render(context), number=args.iterations, repeat=3)) / args.iterations
+        compiled = min(timeit.repeat(lambda: compiled_render(context), number=args.iterations, repeat=3)) / args.iterations
+        print(f"{size:>12} {legacy * 1e6:>12.1f} {compiled * 1e6:>12.1f} {legacy / compiled:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
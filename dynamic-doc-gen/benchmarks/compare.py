@@ -0,0 +1,51 @@
+"""
+Compare two benchmark result files side by side.
+Every numeric measurement present in both runs is printed with its relative change. Run from the project root:
+    python -m benchmarks.compare benchmarks/results/load-A.json benchmarks/results/load-B.json
+"""
+import argparse
+import json
+
+def flatten(data, prefix: str = "") -> dict[str, float]:
+    """
+    Map dotted paths to the numeric leaves of a nested result dictionary.
+    """
+    values = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            values.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        values[prefix.rstrip(".")] = float(data)
+    return values
+
+def compare(baseline: dict, candidate: dict) -> list[tuple[str, float, float, float | None]]:
+    """
+    Return (metric, baseline value, candidate value, relative change) for the metrics of both runs.
+    """
+    old, new = flatten(baseline["results"]), flatten(candidate["results"])
+    rows = []
+    for name in old:
+        if name in new:
+            change = (new[name] - old[name]) / old[name] if old[name] else None
+            rows.append((name, old[name], new[name], change))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", help="Result file of the reference run")
+    parser.add_argument("candidate", help="Result file of the run to compare")
+    args = parser.parse_args()
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.candidate, encoding="utf-8") as file:
+        candidate = json.load(file)
+    if baseline["benchmark"] != candidate["benchmark"]:
+        parser.error(f"Cannot compare a {baseline['benchmark']} run with a {candidate['benchmark']} run")
+    print(f"baseline  {baseline.get('git_commit')} {baseline['timestamp']}")
+    print(f"candidate {candidate.get('git_commit')} {candidate['timestamp']}")
+    for name, old, new, change in compare(baseline, candidate):
+        change_text = f"{change:+.1%}" if change is not None else "n/a"
+        print(f"{name:<55} {old:>14.4f} {new:>14.4f} {change_text:>9}")
+
+if __name__ == "__main__":
+    main()
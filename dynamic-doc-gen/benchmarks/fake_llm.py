@@ -0,0 +1,154 @@
+"""
+Local stand-in for the OpenAI Chat Completions endpoint, used by the load benchmark.
+Responses are synthetic HTML of a configurable size, returned after a latency drawn from a configurable
+distribution (plus an optional cost per generated token, so output budgets show up in latency); a configurable
+fraction of calls fails with an HTTP error so retries can be exercised. A request's max_tokens caps the output.
+Point the application at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1. Run standalone:
+    python -m benchmarks.fake_llm --port 8100 --latency-ms 800 --latency-dist lognormal --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Keys requested by the consolidated agent's JSON-mode prompt (lines like: - "zoning_content": ...).
+JSON_KEY_PATTERN = re.compile(r'^- "(\w+)":', re.MULTILINE)
+
+@dataclass
+class FakeLLMConfig:
+    """
+    Behaviour of the fake server.
+    """
+    # Median latency of a completion in milliseconds.
+    latency_ms: float = 500.0
+    # "constant", "uniform" (latency_ms +/- spread ms) or "lognormal" (median latency_ms, sigma spread).
+    latency_dist: str = "lognormal"
+    latency_spread: float = 0.5
+    # Fraction of requests answered with error_status.
+    error_rate: float = 0.0
+    error_status: int = 500
+    # Approximate number of characters of HTML per generated section.
+    response_chars: int = 1200
+    # Additional latency per completion token in milliseconds (models generate tokens sequentially).
+    ms_per_token: float = 0.0
+    seed: int | None = None
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """
+        Draw one latency in seconds.
+        """
+        if self.latency_dist == "constant":
+            latency = self.latency_ms
+        elif self.latency_dist == "uniform":
+            latency = rng.uniform(self.latency_ms - self.latency_spread, self.latency_ms + self.latency_spread)
+        elif self.latency_dist == "lognormal":
+            latency = self.latency_ms * rng.lognormvariate(0.0, self.latency_spread)
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.latency_dist}")
+        return max(0.0, latency) / 1000
+
+def _html(chars: int) -> str:
+    sentence = "The proposed development is reviewed against the applicable code requirements. "
+    text = (sentence * (chars // len(sentence) + 1))[:max(1, chars - len("<p></p>"))]
+    return "<p>" + text + "</p>"
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    """
+    Build the fake OpenAI-compatible application.
+    """
+    app = FastAPI(title="Fake LLM")
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "errors": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(http_request: Request):
+        body = await http_request.json()
+        stats["requests"] += 1
+        latency = config.sample_latency(rng)
+        if rng.random() < config.error_rate:
+            await asyncio.sleep(latency)
+            stats["errors"] += 1
+            return JSONResponse(
+                status_code=config.error_status,
+                content={"error": {"message": "Injected failure", "type": "server_error"}},
+            )
+        prompt = " ".join(message.get("content", "") for message in body.get("messages", []))
+        # Rough token counts (about four characters per token); max_tokens truncates the output.
+        budget = body.get("max_tokens") * 4 if body.get("max_tokens") else None
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            keys = JSON_KEY_PATTERN.findall(prompt) or ["content"]
+            chars = min(config.response_chars, budget // len(keys)) if budget else config.response_chars
+            content = json.dumps({key: _html(chars) for key in keys})
+        else:
+            content = _html(min(config.response_chars, budget) if budget else config.response_chars)
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        await asyncio.sleep(latency + completion_tokens * config.ms_per_token / 1000)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return {**stats, "config": asdict(config)}
+
+    return app
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the FakeLLMConfig options to a command-line parser (shared with the load benchmark).
+    """
+    defaults = FakeLLMConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="Median completion latency")
+    parser.add_argument("--latency-dist", choices=["constant", "uniform", "lognormal"], default=defaults.latency_dist)
+    parser.add_argument("--latency-spread", type=float, default=defaults.latency_spread,
+                        help="Half-width in ms for uniform, sigma for lognormal")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Fraction of failed calls")
+    parser.add_argument("--error-status", type=int, default=defaults.error_status, help="HTTP status of failed calls")
+    parser.add_argument("--response-chars", type=int, default=defaults.response_chars, help="Characters per section")
+    parser.add_argument("--ms-per-token", type=float, default=defaults.ms_per_token,
+                        help="Additional latency per completion token")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        latency_spread=args.latency_spread,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        response_chars=args.response_chars,
+        ms_per_token=args.ms_per_token,
+        seed=args.seed,
+    )
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+End-to-end load benchmark.
+Starts the fake LLM server and the application (each in its own process), then submits documents with
+POST /generate at a fixed arrival rate and polls GET /document/{id} until each one is ready.
+Reports throughput, submit and end-to-end latency percentiles, rejections and the application's peak RSS,
+and writes them to a JSON file. Run from the project root:
+    python -m benchmarks.load_test --rate 5 --duration 30 --latency-ms 800
+Use --target to benchmark an application that is already running (its fake LLM is then up to you).
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+import httpx
+from benchmarks import fake_llm
+from benchmarks.results import peak_rss_mb, save_results, summarize
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Project types cycled through by the generated requests (commercial documents need one more section).
+PROJECT_TYPES = ["Commercial", "Residential", "Industrial", "Mixed-Use"]
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def start_servers(args: argparse.Namespace) -> tuple[str, str, list[subprocess.Popen]]:
+    """
+    Launch the fake LLM server and the application pointed at it.
+    :return: Base URLs of the application and the fake LLM, and the started processes (the application last).
+    """
+    llm_port, app_port = _free_port(), _free_port()
+    llm_command = [
+        sys.executable, "-m", "benchmarks.fake_llm", "--port", str(llm_port),
+        "--latency-ms", str(args.latency_ms), "--latency-dist", args.latency_dist,
+        "--latency-spread", str(args.latency_spread), "--error-rate", str(args.error_rate),
+        "--error-status", str(args.error_status), "--response-chars", str(args.response_chars),
+        "--ms-per-token", str(args.ms_per_token),
+    ]
+    if args.seed is not None:
+        llm_command += ["--seed", str(args.seed)]
+    llm = subprocess.Popen(llm_command, cwd=PROJECT_ROOT)
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+    }
+    if not args.cache:
+        env["LLM_CACHE_ENABLED"] = "false"
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT, env=env,
+    )
+    processes = [llm, app]
+    try:
+        _wait_until_up(f"http://127.0.0.1:{llm_port}/stats", llm)
+        _wait_until_up(f"http://127.0.0.1:{app_port}/docs", app)
+    except Exception:
+        stop_servers(processes)
+        raise
+    return f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{llm_port}", processes
+
+def stop_servers(processes: list[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+async def _one_document(client: httpx.AsyncClient, index: int, args: argparse.Namespace, samples: dict) -> None:
+    """
+    Submit one document and poll until it is ready, recording latencies and the outcome.
+    """
+    payload = {
+        "project_name": f"Load Test Project {index}",
+        "project_type": PROJECT_TYPES[index % len(PROJECT_TYPES)],
+        "location": f"{index} Benchmark Avenue",
+    }
+    started = time.monotonic()
+    try:
+        response = await client.post("/generate", json=payload)
+    except httpx.HTTPError:
+        samples["outcomes"]["errors"] += 1
+        return
+    samples["submit"].append(time.monotonic() - started)
+    if response.status_code == 429:
+        samples["outcomes"]["rejected"] += 1
+        return
+    if response.status_code != 200:
+        samples["outcomes"]["errors"] += 1
+        return
+    doc_id = response.json()["document_id"]
+    deadline = started + args.timeout
+    while time.monotonic() < deadline:
+        fetch_started = time.monotonic()
+        try:
+            params = {"wait": min(args.wait, max(0.0, deadline - time.monotonic()))} if args.wait else None
+            samples["get_requests"] += 1
+            document = await client.get(f"/document/{doc_id}", params=params)
+        except httpx.HTTPError:
+            samples["outcomes"]["errors"] += 1
+            return
+        if document.status_code == 200:
+            samples["fetch"].append(time.monotonic() - fetch_started)
+            samples["end_to_end"].append(time.monotonic() - started)
+            samples["outcomes"]["completed"] += 1
+            return
+        if document.status_code != 202:
+            # The generation failed (e.g., the LLM kept erroring) and the document was dropped.
+            samples["outcomes"]["failed"] += 1
+            return
+        if not args.wait:
+            await asyncio.sleep(args.poll_interval)
+    samples["outcomes"]["timed_out"] += 1
+
+async def run_load(base_url: str, args: argparse.Namespace) -> dict:
+    """
+    Submit documents at args.rate per second for args.duration seconds (open loop: arrivals do not wait
+    for earlier documents) and wait for all of them to finish.
+    """
+    samples = {
+        "submit": [], "fetch": [], "end_to_end": [], "get_requests": 0,
+        "outcomes": {"completed": 0, "rejected": 0, "failed": 0, "timed_out": 0, "errors": 0},
+    }
+    limits = httpx.Limits(max_connections=args.connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        started = time.monotonic()
+        total = int(args.rate * args.duration)
+        tasks = []
+        for index in range(total):
+            # Keep a fixed schedule so slow responses do not lower the offered load.
+            delay = started + index / args.rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_one_document(client, index, args, samples)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+    return {
+        "submitted": total,
+        **samples["outcomes"],
+        "elapsed_seconds": elapsed,
+        "throughput_documents_per_second": samples["outcomes"]["completed"] / elapsed if elapsed > 0 else None,
+        "get_requests_per_document": samples["get_requests"] / total if total else None,
+        "submit_latency_seconds": summarize(samples["submit"]),
+        "fetch_latency_seconds": summarize(samples["fetch"]),
+        "end_to_end_latency_seconds": summarize(samples["end_to_end"]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=5.0, help="Documents submitted per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds during which documents are submitted")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds a document may take before it counts as timed out")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="Seconds between GET /document polls")
+    parser.add_argument("--wait", type=float, default=0.0,
+                        help="Long-poll GET /document with ?wait= this many seconds instead of polling")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connections to the application")
+    parser.add_argument("--cache", action="store_true", help="Keep the LLM response cache enabled")
+    parser.add_argument("--target", help="Base URL of an already running application (no servers are started)")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load-<timestamp>.json)")
+    fake_llm.add_arguments(parser)
+    args = parser.parse_args()
+    processes = []
+    base_url = args.target
+    if base_url is None:
+        base_url, llm_url, processes = start_servers(args)
+    try:
+        results = asyncio.run(run_load(base_url, args))
+        # Realized latency and tokens per generation profile. They are recorded by the process that generated the
+        # sections, so an application using worker processes (JOB_BACKEND=queue) reports none here.
+        results["profiles"] = httpx.get(f"{base_url}/stats/profiles").json()["profiles"]
+        if processes:
+            # Read before the processes exit.
+            results["app_peak_rss_mb"] = peak_rss_mb(processes[-1].pid)
+            results["fake_llm_requests"] = httpx.get(f"{llm_url}/stats").json()
+    finally:
+        stop_servers(processes)
+    path = save_results("load", {key: value for key, value in vars(args).items() if key != "output"}, results, args.output)
+    latency = results["end_to_end_latency_seconds"]
+    print(f"completed {results['completed']}/{results['submitted']} "
+          f"(rejected {results['rejected']}, failed {results['failed']}, timed out {results['timed_out']})")
+    print(f"throughput {results['throughput_documents_per_second']:.2f} docs/s")
+    if latency["count"]:
+        print(f"end-to-end p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  p99 {latency['p99']:.3f}s")
+    if results.get("app_peak_rss_mb") is not None:
+        print(f"peak RSS {results['app_peak_rss_mb']:.1f} MiB")
+    for name, profile in results["profiles"].items():
+        print(f"profile {name} ({profile['model']}, max_tokens {profile['max_tokens']}): "
+              f"p95 {profile['latency_p95_seconds']:.3f}s vs SLO {profile['latency_slo_seconds']:g}s, "
+              f"{profile['completion_tokens_per_generation']:.0f} completion tokens per section")
+    if not results["profiles"] and results["completed"]:
+        print("no generation profile stats: the sections were generated outside the application process "
+              "(e.g., by app.worker processes with JOB_BACKEND=queue)")
+    print(f"results written to {path}")
+
+if __name__ == "__main__":
+    main()
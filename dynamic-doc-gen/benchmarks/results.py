@@ -0,0 +1,102 @@
+"""
+Shared helpers for the benchmark scripts: percentiles and JSON result files that can be compared across runs.
+"""
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Default directory for result files.
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+def percentile(values: list[float], q: float) -> float | None:
+    """
+    Return the q-quantile (0..1) of values using linear interpolation, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = q * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(values: list[float]) -> dict[str, float | int | None]:
+    """
+    Count, mean and p50/p95/p99 of a list of measurements.
+    """
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(name: str, config: dict, results: dict, output: str | None = None) -> Path:
+    """
+    Write a benchmark run to a JSON file together with the environment it ran in.
+    :param name: Benchmark name (used in the default file name).
+    :param config: Parameters of the run.
+    :param results: Measurements of the run.
+    :param output: Target file (default: benchmarks/results/<name>-<timestamp>.json).
+    :return: Path of the written file.
+    """
+    path = Path(output) if output else RESULTS_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "benchmark": name,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=2), encoding="utf-8")
+    return path
+
+def _process_tree(pid: int) -> list[int]:
+    """
+    Return a process and its live descendants (Linux only).
+    """
+    pids = [pid]
+    for parent in pids:
+        try:
+            tasks = Path(f"/proc/{parent}/task").iterdir()
+            for task in tasks:
+                pids.extend(int(child) for child in (task / "children").read_text(encoding="ascii").split())
+        except OSError:
+            continue
+    return pids
+
+def peak_rss_mb(pid: int) -> float | None:
+    """
+    Peak resident set size of a process and its child processes (e.g., a process validation pool) in MiB,
+    summed over the processes (Linux only; None elsewhere).
+    The sum is an upper bound, since the processes need not peak at the same time. Children that already exited
+    and processes started separately (such as app.worker processes with JOB_BACKEND=queue) are not included.
+    """
+    total = None
+    for process in _process_tree(pid):
+        try:
+            with open(f"/proc/{process}/status", encoding="ascii") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        total = (total or 0.0) + int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            pass
+    return total
@@ -7,7 +7,8 @@ setup(
     install_requires=[
         "fastapi",
         "uvicorn[standard]",
-        "openai",
+        "openai>=1.17",
+        "httpx",
         "beautifulsoup4",
     ],
     extras_require={
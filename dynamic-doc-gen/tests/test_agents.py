@@ -49,3 +49,211 @@ def test_validation_agent_sanitization():
     assert 'color:red' not in cleaned
     # A subsection title should have been added to the subsection that lacked one.
     assert '<h4 class="subsection-title">Subsection</h4>' in cleaned
+
+def test_validate_section_fragment():
+    """
+    Test that a single section fragment is sanitized without needing the surrounding template.
+    """
+    fragment = (
+        "<div class='subsection'><p style='margin:0'>Body</p></div>"
+        "<script>alert('XSS');</script>"
+    )
+    cleaned = validation_agent.validate_section(fragment)
+    assert "<script" not in cleaned and "margin:0" not in cleaned
+    assert '<h4 class="subsection-title">Subsection</h4>' in cleaned
+    assert "<html" not in cleaned
+
+@pytest.mark.asyncio
+async def test_orchestrator_fills_every_placeholder(monkeypatch):
+    """
+    Test that the orchestrator fills all template slots and never re-substitutes AI content.
+    """
+    from app.services import orchestrator
+    async def dummy_generate(system_prompt, user_prompt):
+        # AI output that happens to contain a placeholder must be inserted verbatim.
+        return "<p>See {{project_name}}</p>"
+    monkeypatch.setattr(ai_clients, "generate_content", dummy_generate)
+    req = DocumentRequest(project_name="Tower", project_type="Residential", location=None, meeting_date=date(2025, 4, 27))
+    html = await orchestrator.generate_document(req)
+    assert "<strong>Project:</strong> Tower" in html
+    assert "April 27, 2025" in html and "Not specified" in html
+    assert "No commercial-specific standards applicable." in html
+    assert html.count("See {{project_name}}") == 3
+
+@pytest.mark.parametrize("fragment", [
+    "<p>Plain paragraph with &amp; entity &lt;tag&gt;</p>",
+    "<div class='subsection'><p style='color:red'>No title</p></div><script>alert(1)</script>",
+    "<div class='subsection'><h4 class='subsection-title'>Title</h4><p>Body</p></div>",
+    "<div class='subsection'><h4 class='subsection-title'>A</h4><div class='subsection'><p>Nested</p></div></div>",
+    "<ul><li>One</li><li>Two<br>line</li></ul><p class=' a  b '>Classes</p>",
+    "<p>Unclosed <strong>tags<div>inside</p></div>",
+    "<table><tr><td colspan='2'>Cell</td></tr></table><a href='https://example.com/?a=1&b=2'>Link</a>",
+])
+def test_streaming_sanitizer_matches_reference(fragment):
+    """
+    Test that the single-pass sanitizer produces the same output as the BeautifulSoup reference mode
+    for fragments made of allow-listed tags and attributes.
+    """
+    assert validation_agent.validate_section(fragment, mode="stream") == validation_agent.validate_section(fragment, mode="reference")
+
+def test_streaming_sanitizer_allow_list():
+    """
+    Test that tags and attributes outside the allow-list are removed.
+    """
+    fragment = (
+        "<p onclick='steal()'>Text<iframe src='x'>frame</iframe></p>"
+        "<a href='javascript:alert(1)'>Link</a><custom>kept text</custom><style>p{}</style>"
+    )
+    cleaned = validation_agent.validate_section(fragment, mode="stream")
+    assert cleaned == "<p>Text</p><a>Link</a>kept text"
+
+@pytest.mark.asyncio
+async def test_validate_sections_async_uses_worker_pool(monkeypatch):
+    """
+    Test that sections are validated off the event loop and keyed by slot.
+    """
+    monkeypatch.setenv("VALIDATION_EXECUTOR", "thread")
+    result = await validation_agent.validate_sections_async({"zoning_content": "<div class='subsection'></div>"})
+    assert result == {"zoning_content": '<div class="subsection"><h4 class="subsection-title">Subsection</h4></div>'}
+
+@pytest.mark.asyncio
+async def test_consolidated_mode_uses_one_call_and_falls_back(monkeypatch):
+    """
+    Test that consolidated mode fills sections from one JSON completion and falls back per section
+    for keys that are missing or invalid.
+    """
+    import json
+    from app.services import orchestrator
+    from app.services.generation_stats import generation_stats
+    calls = []
+    async def dummy_generate(system_prompt, user_prompt, **params):
+        calls.append(params)
+        if params.get("response_format"):
+            return json.dumps({
+                "header_content": "<p>Combined intro</p>",
+                "zoning_content": "<div class='subsection'><h4 class='subsection-title'>Z</h4></div>",
+                "commercial_standards_content": 42,
+            })
+        return "<p>Fallback section</p>"
+    monkeypatch.setattr(ai_clients, "generate_content", dummy_generate)
+    generation_stats.reset()
+    req = DocumentRequest(project_name="One Call", project_type="Commercial", generation_mode="consolidated")
+    html = await orchestrator.generate_document(req)
+    assert "<p>Combined intro</p>" in html and "subsection-title" in html
+    # The invalid commercial key and the missing general key were generated by their own agents.
+    assert html.count("<p>Fallback section</p>") == 2
+    assert len(calls) == 3 and calls[0] == {"response_format": {"type": "json_object"}}
+    assert generation_stats.summary()["consolidated"]["documents"] == 1
+
+@pytest.mark.asyncio
+async def test_section_deadline_falls_back(monkeypatch):
+    """
+    Test that a stalled agent does not hold the document back: its section falls back to the stale copy,
+    a retry on the fallback model or the placeholder, and every section's status is recorded.
+    """
+    from app.services import orchestrator, section_policy
+    from app.services.section_store import section_store
+    from app.utils import metrics
+    stalled = {"zoning": False}
+    async def dummy_generate(system_prompt, user_prompt):
+        if "zoning" in system_prompt.lower() and stalled["zoning"]:
+            if ai_clients.current_model() == "fast-model":
+                return "<p>Retried zoning</p>"
+            await asyncio.sleep(10)
+        return "<p>Fresh content</p>"
+    monkeypatch.setattr(ai_clients, "generate_content", dummy_generate)
+    monkeypatch.setenv("SECTION_DEADLINE_ZONING_CONTENT", "0.05")
+    req = DocumentRequest(project_name="Deadline", project_type="Residential", location="Stall Street 1")
+    # A fresh generation keeps the zoning section as the stale fallback for the same inputs.
+    await orchestrator.generate_document(req)
+    assert section_store.load_statuses(req)["zoning_content"] == section_policy.FRESH
+    stalled["zoning"] = True
+    before = metrics.section_outcomes.value(section="zoning_content", status=section_policy.FALLBACK)
+    changed = req.model_copy(update={"project_name": "Deadline 2"})
+    html = await orchestrator.generate_document(changed)
+    assert html.count("<p>Fresh content</p>") == 3
+    assert section_store.load_statuses(changed) == {
+        "header_content": "fresh", "zoning_content": "fallback",
+        "commercial_standards_content": "fresh", "general_standards_content": "fresh",
+    }
+    assert metrics.section_outcomes.value(section="zoning_content", status=section_policy.FALLBACK) == before + 1
+    # Without a stale copy, the retry on the fallback model answers; without that, the placeholder does.
+    other = req.model_copy(update={"location": "Stall Street 2"})
+    monkeypatch.setattr(section_policy, "FALLBACK_MODEL", "fast-model")
+    assert "<p>Retried zoning</p>" in await orchestrator.generate_document(other)
+    monkeypatch.setenv("SECTION_FALLBACKS_ZONING_CONTENT", "stale,placeholder")
+    third = req.model_copy(update={"location": "Stall Street 3"})
+    assert section_policy.PLACEHOLDER_CONTENT in await orchestrator.generate_document(third)
+    # With no fallbacks the section is left empty and marked failed.
+    monkeypatch.setenv("SECTION_FALLBACKS_ZONING_CONTENT", "")
+    fourth = req.model_copy(update={"location": "Stall Street 4"})
+    await orchestrator.generate_document(fourth)
+    assert section_store.load_statuses(fourth)["zoning_content"] == section_policy.FAILED
+
+@pytest.mark.asyncio
+async def test_section_statuses_are_kept_per_document(monkeypatch):
+    """
+    Test that two documents generated for the same request keep their own section statuses.
+    """
+    from app.services import orchestrator, section_policy
+    from app.services.section_store import section_store
+    from app.utils import metrics
+    failing = {"zoning": True}
+    async def dummy_generate(system_prompt, user_prompt):
+        if "zoning" in system_prompt.lower() and failing["zoning"]:
+            raise RuntimeError("zoning agent failed")
+        return "<p>Fresh content</p>"
+    monkeypatch.setattr(ai_clients, "generate_content", dummy_generate)
+    monkeypatch.setenv("SECTION_FALLBACKS_ZONING_CONTENT", "placeholder")
+    req = DocumentRequest(project_name="Twice", project_type="Residential", location="Status Street 1")
+    with metrics.document_context("first-doc"):
+        await orchestrator.generate_document(req)
+    failing["zoning"] = False
+    with metrics.document_context("second-doc"):
+        await orchestrator.generate_document(req)
+    assert section_store.load_document_statuses("first-doc")["zoning_content"] == section_policy.FALLBACK
+    assert section_store.load_document_statuses("second-doc")["zoning_content"] == section_policy.FRESH
+
+@pytest.mark.asyncio
+async def test_section_registry_runs_dependency_graph(monkeypatch):
+    """
+    Test that the orchestrator runs only the agents the template needs, feeds dependencies to the sections
+    that declare them, and rejects dependency cycles.
+    """
+    from app.services import orchestrator
+    from app.services.section_registry import SectionRegistry, SectionSpec
+    from app.utils.template_engine import CompiledTemplate
+    calls = []
+    async def facts_agent(request, sections):
+        calls.append("facts")
+        await asyncio.sleep(0.01)
+        return f"<p>{request.project_type} facts</p>"
+    async def summary_agent(request, sections):
+        calls.append("summary")
+        return f"<p>Summary of {sections['facts']}</p>"
+    async def unused_agent(request, sections):
+        calls.append("unused")
+        return "<p>Unused</p>"
+    sections = SectionRegistry()
+    sections.register(SectionSpec("summary", summary_agent, fields=("project_name",), depends_on=("facts",)))
+    sections.register(SectionSpec("facts", facts_agent, fields=("project_type",)))
+    sections.register(SectionSpec("unused", unused_agent))
+    sections.register(SectionSpec("annex", unused_agent, applies=lambda request: False, otherwise="<p>No annex</p>"))
+    template = CompiledTemplate.compile("<h1>{{project_name}}</h1>{{summary}}{{annex}}")
+    monkeypatch.setattr(orchestrator, "registry", sections)
+    monkeypatch.setattr(orchestrator, "get_template", lambda name=None: template)
+    req = DocumentRequest(project_name="Graph", project_type="Industrial")
+    html = await orchestrator.generate_document(req)
+    assert html == "<h1>Graph</h1><p>Summary of <p>Industrial facts</p></p><p>No annex</p>"
+    # The dependency ran first; the section the template does not render never ran.
+    assert calls == ["facts", "summary"]
+    assert sections.inputs("summary") == ("project_name", "project_type")
+    assert sections.determined_by(("project_type",)) == ["facts"]
+    sections.register(SectionSpec("facts", facts_agent, depends_on=("summary",)))
+    with pytest.raises(ValueError):
+        sections.plan(req, ["summary"])
+    # The field lookups used before planning (batch sharing, PATCH) report the cycle the same way.
+    with pytest.raises(ValueError, match="cycle"):
+        sections.inputs("summary")
+    with pytest.raises(ValueError, match="cycle"):
+        sections.determined_by(("project_type",))
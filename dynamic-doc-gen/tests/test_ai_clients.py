@@ -0,0 +1,63 @@
+import pytest
+import asyncio
+import openai
+from app.utils.ai_clients import LLMClient
+
+class ScriptedClient(LLMClient):
+    """
+    LLMClient whose HTTP requests are replaced by a script of delays and failures.
+    """
+
+    def __init__(self, script, **kwargs):
+        super().__init__(api_key="test", backoff_base=0.001, backoff_max=0.002, **kwargs)
+        self.script = list(script)
+
+    async def _request(self, model, messages, params):
+        self.stats["requests"] += 1
+        delay, outcome = self.script.pop(0)
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        self.latency.record(delay)
+        return outcome
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors():
+    """
+    Test that timeouts and connection errors are retried until a response arrives.
+    """
+    client = ScriptedClient([
+        (0, openai.APITimeoutError(request=None)),
+        (0, openai.APIConnectionError(request=None)),
+        (0, "ok"),
+    ])
+    assert await client.complete("model", []) == "ok"
+    assert client.stats["retries"] == 2
+    await client.close()
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries_and_deadline():
+    """
+    Test that errors surface after max_retries and that the per-call deadline is enforced.
+    """
+    client = ScriptedClient([(0, openai.APITimeoutError(request=None))] * 2, max_retries=1)
+    with pytest.raises(openai.APITimeoutError):
+        await client.complete("model", [])
+    slow = ScriptedClient([(1.0, "late")])
+    with pytest.raises(asyncio.TimeoutError):
+        await slow.complete("model", [], deadline=0.05)
+    assert slow.stats["timeouts"] == 1
+    await client.close()
+    await slow.close()
+
+@pytest.mark.asyncio
+async def test_hedges_requests_slower_than_observed_tail():
+    """
+    Test that a call exceeding the observed p95 latency is raced against a duplicate request.
+    """
+    client = ScriptedClient([(0.5, "slow primary"), (0.01, "fast hedge")], hedge=True, hedge_min_samples=5)
+    for _ in range(5):
+        client.latency.record(0.02)
+    assert await client.complete("model", []) == "fast hedge"
+    assert client.stats["hedges"] == 1 and client.stats["hedge_wins"] == 1
+    await client.close()
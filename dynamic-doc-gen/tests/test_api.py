@@ -1,3 +1,4 @@
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -46,3 +47,430 @@ def test_get_invalid_document_id():
         resp = client.get("/document/nonexistent-id")
         assert resp.status_code == 404
         assert "not found" in resp.text.lower()
+
+def _patch_agents(monkeypatch):
+    """
+    Replace the OpenAI call with a deterministic stub that echoes the requested section.
+    """
+    from app.utils import ai_clients
+    async def dummy_generate(system_prompt, user_prompt):
+        if "Zoning" in user_prompt:
+            return "<div class='subsection'><p style='color:red'>Zoning details</p></div>"
+        if "General Standards" in user_prompt:
+            return "<p>General standards</p><script>alert(1)</script>"
+        if "commercial" in user_prompt.lower() and "standards" in user_prompt.lower():
+            return "<p>Commercial standards</p>"
+        return "<p>Introduction</p>"
+    monkeypatch.setattr(ai_clients, "generate_content", dummy_generate)
+
+def test_stream_document_html(monkeypatch):
+    """
+    Test that the chunked HTML stream starts with the static header and contains every validated section.
+    """
+    _patch_agents(monkeypatch)
+    with TestClient(app) as client:
+        payload = {"project_name": "Stream Project", "project_type": "Commercial", "location": "Test City"}
+        with client.stream("POST", "/generate/stream", json=payload) as response:
+            assert response.status_code == 200
+            doc_id = response.headers["x-document-id"]
+            chunks = list(response.iter_text())
+        body = "".join(chunks)
+        # The first chunk is the static header with the request fields filled in.
+        assert "Stream Project" in chunks[0] and "{{" not in chunks[0]
+        assert "<p>Introduction</p>" in body and "Commercial standards" in body
+        # Sections are validated before they are sent.
+        assert "<script" not in body and "color:red" not in body
+        assert '<h4 class="subsection-title">Subsection</h4>' in body
+        # The finished document is stored for later retrieval.
+        stored = client.get(f"/document/{doc_id}")
+        assert stored.status_code == 200 and stored.text == body
+
+def test_stream_document_sse(monkeypatch):
+    """
+    Test that the SSE stream sends a shell, one event per section, and a final done event.
+    """
+    import json
+    _patch_agents(monkeypatch)
+    with TestClient(app) as client:
+        payload = {"project_name": "Stream Project", "project_type": "Residential"}
+        response = client.post("/generate/stream?format=sse", json=payload)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            event_line, data_line = block.split("\n")
+            events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+        assert events[0][0] == "shell" and 'data-slot="zoning_content"' in events[0][1]["html"]
+        sections = {data["slot"]: data["html"] for name, data in events if name == "section"}
+        assert set(sections) == {"header_content", "zoning_content", "commercial_standards_content", "general_standards_content"}
+        assert "No commercial-specific standards" in sections["commercial_standards_content"]
+        assert events[-1] == ("done", {"document_id": events[0][1]["document_id"]})
+
+def test_stream_document_uses_scheduler(monkeypatch):
+    """
+    Test that streamed documents are admitted by the scheduler (429 when its queue is full) and keep their
+    section statuses like other documents.
+    """
+    import asyncio
+    from app.api import routes
+    from app.services import orchestrator
+    from app.services.scheduler import JobScheduler
+    _patch_agents(monkeypatch)
+    monkeypatch.setattr(routes, "scheduler", JobScheduler(max_concurrent=1, max_queue=1))
+    with TestClient(app) as client:
+        payload = {"project_name": "Stream Project", "project_type": "Commercial"}
+        with client.stream("POST", "/generate/stream", json=payload) as response:
+            doc_id = response.headers["x-document-id"]
+            response.read()
+        status = client.get(f"/document/{doc_id}/status").json()
+        assert status["status"] == "ready"
+        assert status["sections"] == {
+            "header_content": "fresh", "zoning_content": "fresh",
+            "commercial_standards_content": "fresh", "general_standards_content": "fresh",
+        }
+        async def slow_generate(request):
+            await asyncio.sleep(5)
+            return "<html></html>"
+        monkeypatch.setattr(orchestrator, "generate_document", slow_generate)
+        # One document runs and one fills the queue.
+        for index in range(2):
+            client.post("/generate", json={"project_name": f"Busy {index}"})
+        rejected = client.post("/generate/stream", json=payload)
+        assert rejected.status_code == 429 and int(rejected.headers["retry-after"]) >= 1
+
+def test_document_etag_and_compression():
+    """
+    Test conditional GETs with If-None-Match and gzip passthrough of the stored document.
+    """
+    import gzip
+    from app.api import routes
+    routes.results_store.put("etag-doc", "<html><body><p>Stored</p></body></html>")
+    with TestClient(app) as client:
+        first = client.get("/document/etag-doc", headers={"Accept-Encoding": "gzip"})
+        assert first.status_code == 200
+        assert first.headers["content-encoding"] == "gzip"
+        assert first.text == "<html><body><p>Stored</p></body></html>"
+        etag = first.headers["etag"]
+        # A repeat fetch with the ETag costs nothing.
+        second = client.get("/document/etag-doc", headers={"If-None-Match": etag})
+        assert second.status_code == 304 and second.content == b""
+        # Clients that do not accept gzip get plain HTML.
+        plain = client.get("/document/etag-doc", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert plain.text == "<html><body><p>Stored</p></body></html>"
+    assert gzip.decompress(routes.results_store.get("etag-doc").compressed).startswith(b"<html>")
+
+def test_generate_backpressure_and_queue_position(monkeypatch):
+    """
+    Test that a full queue answers 429 with Retry-After and that queued documents report their position.
+    """
+    import asyncio
+    from app.api import routes
+    from app.services import orchestrator
+    from app.services.scheduler import JobScheduler
+    async def slow_generate(request):
+        await asyncio.sleep(5)
+        return "<html></html>"
+    monkeypatch.setattr(orchestrator, "generate_document", slow_generate)
+    monkeypatch.setattr(routes, "scheduler", JobScheduler(max_concurrent=1, max_queue=1))
+    with TestClient(app) as client:
+        running = client.post("/generate", json={"project_name": "Busy Project 1"}).json()["document_id"]
+        queued = client.post("/generate", json={"project_name": "Busy Project 2"}).json()
+        assert queued["queue_position"] == 1
+        rejected = client.post("/generate", json={"project_name": "Busy Project 3"})
+        assert rejected.status_code == 429 and int(rejected.headers["retry-after"]) >= 1
+        status = client.get(f"/document/{queued['document_id']}/status").json()
+        assert status == {"document_id": queued["document_id"], "status": "queued", "queue_position": 1}
+        pending = client.get(f"/document/{running}")
+        assert pending.status_code == 202 and pending.json()["status"] == "running"
+
+def test_duplicate_requests_share_document(monkeypatch):
+    """
+    Test that identical in-flight submissions share one document ID and one orchestration.
+    """
+    import asyncio
+    from app.services import orchestrator
+    calls = []
+    async def slow_generate(request):
+        calls.append(request.project_name)
+        await asyncio.sleep(0.2)
+        return "<html><body>Shared</body></html>"
+    monkeypatch.setattr(orchestrator, "generate_document", slow_generate)
+    with TestClient(app) as client:
+        payload = {"project_name": "Shared Project", "meeting_date": "2025-04-27"}
+        first = client.post("/generate", json=payload).json()
+        second = client.post("/generate", json=payload).json()
+        assert second["coalesced"] and second["document_id"] == first["document_id"]
+        assert second["request_hash"] == first["request_hash"]
+        # The same content in the other orchestration mode is a different document.
+        consolidated = client.post("/generate", json={**payload, "generation_mode": "consolidated"}).json()
+        assert not consolidated["coalesced"] and consolidated["document_id"] != first["document_id"]
+        separate = client.post("/generate?coalesce=false", json=payload).json()
+        assert separate["document_id"] != first["document_id"]
+        resp = client.get(f"/document/{first['document_id']}")
+        waited = 0
+        while resp.status_code == 202 and waited < 5:
+            import time
+            time.sleep(0.05)
+            waited += 0.05
+            resp = client.get(f"/document/{first['document_id']}")
+        assert resp.status_code == 200
+    assert calls == ["Shared Project"] * 3
+
+def test_generate_batch_shares_project_type_sections(monkeypatch):
+    """
+    Test that a CSV batch streams one NDJSON line per document plus a summary,
+    and that standards sections are generated once per distinct project type.
+    """
+    import json
+    from app.utils import ai_clients
+    prompts = []
+    async def dummy_generate(system_prompt, user_prompt):
+        prompts.append(user_prompt)
+        return "<p>Generated</p>"
+    monkeypatch.setattr(ai_clients, "generate_content", dummy_generate)
+    body = (
+        "project_name,project_type,location,meeting_date\n"
+        "Tower A,Commercial,1 Main St,2025-04-01\n"
+        "Tower B,Commercial,2 Main St,2025-04-02\n"
+        "House C,Residential,,2025-04-03\n"
+        "Bad D,Residential,,not-a-date\n"
+    )
+    with TestClient(app) as client:
+        response = client.post("/generate/batch", content=body, headers={"Content-Type": "text/csv"})
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        documents = [line for line in lines if "summary" not in line]
+        summary = lines[-1]["summary"]
+        assert summary["documents"] == 4 and summary["succeeded"] == 3
+        assert summary["invalid"] == 1 and summary["failed"] == 0
+        assert summary["distinct_project_types"] == 2
+        ready = [line for line in documents if line["status"] == "ready"]
+        for line in ready:
+            assert client.get(f"/document/{line['document_id']}").status_code == 200
+    # Two commercial + one general for Commercial, one general for Residential; header and zoning per document.
+    standards_prompts = [prompt for prompt in prompts if "standards" in prompt.lower()]
+    assert len(standards_prompts) == 3
+    assert len(prompts) == 3 + 2 * 3
+
+def test_generate_batch_uses_scheduler(monkeypatch):
+    """
+    Test that batch documents are bounded by the shared scheduler and that a full queue rejects a batch with 429.
+    """
+    import asyncio
+    import json
+    from app.api import routes
+    from app.services import orchestrator
+    from app.services.scheduler import JobScheduler
+    running = []
+    peak = []
+    async def tracked_generate(request, precomputed=None):
+        running.append(request.project_name)
+        peak.append(len(running))
+        await asyncio.sleep(0.05)
+        running.remove(request.project_name)
+        return "<html></html>"
+    async def no_shared_sections(request):
+        return {}
+    monkeypatch.setattr(orchestrator, "generate_document", tracked_generate)
+    monkeypatch.setattr(orchestrator, "generate_project_type_sections", no_shared_sections)
+    monkeypatch.setattr(routes, "scheduler", JobScheduler(max_concurrent=2, max_queue=2))
+    body = "".join(json.dumps({"project_name": f"Batch {index}"}) + "\n" for index in range(6))
+    with TestClient(app) as client:
+        lines = [json.loads(line) for line in client.post("/generate/batch", content=body).text.splitlines()]
+        assert lines[-1]["summary"]["succeeded"] == 6
+        assert max(peak) == 2
+        async def slow_generate(request):
+            await asyncio.sleep(5)
+            return "<html></html>"
+        monkeypatch.setattr(orchestrator, "generate_document", slow_generate)
+        # Two documents run and two fill the queue.
+        for index in range(4):
+            client.post("/generate", json={"project_name": f"Busy {index}"})
+        rejected = client.post("/generate/batch", content=body)
+        assert rejected.status_code == 429 and int(rejected.headers["retry-after"]) >= 1
+
+def test_metrics_and_document_timings(monkeypatch):
+    """
+    Test that a generated document exposes its stage timings and that /metrics reports the stages.
+    """
+    import time
+    _patch_agents(monkeypatch)
+    with TestClient(app) as client:
+        payload = {"project_name": "Timed Project", "project_type": "Commercial", "location": "Test City"}
+        doc_id = client.post("/generate", json=payload, params={"coalesce": False}).json()["document_id"]
+        deadline = time.monotonic() + 5
+        while client.get(f"/document/{doc_id}").status_code == 202 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        status = client.get(f"/document/{doc_id}/status", params={"timings": True}).json()
+        assert status["status"] == "ready"
+        stages = {span["stage"] for span in status["timings"]}
+        assert {"queue_wait", "agent", "validation", "template_render", "document"} <= stages
+        assert {span["section"] for span in status["timings"] if span["stage"] == "agent"} >= {"header_content", "zoning_content"}
+        # Timings are only included on request.
+        assert "timings" not in client.get(f"/document/{doc_id}/status").json()
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'docgen_stage_duration_seconds_count{stage="template_render"}' in response.text
+        assert "docgen_queue_length 0.0" in response.text
+
+def test_generate_with_worker_queue(monkeypatch, tmp_path):
+    """
+    Test that with the durable job queue, POST /generate enqueues the request for the worker processes
+    and the status endpoint reports the queue position and failures.
+    """
+    from app.api import routes
+    from app.services.job_queue import SQLiteJobQueue
+    from app.services.result_store import SQLiteResultStore
+    from app.services.section_store import create_section_store, section_store
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(routes, "job_queue", queue)
+    # Workers write to a store shared between processes.
+    monkeypatch.setattr(routes, "results_store", SQLiteResultStore(str(tmp_path / "results.sqlite")))
+    # The section store must be shared too, or the API does not start.
+    with pytest.raises(RuntimeError, match="SECTION_STORE_PATH"):
+        with TestClient(app):
+            pass
+    monkeypatch.setenv("SECTION_STORE_PATH", str(tmp_path / "sections.sqlite"))
+    monkeypatch.setattr(section_store, "cache", create_section_store().cache)
+    with TestClient(app) as client:
+        payload = {"project_name": "Queued Project", "project_type": "Residential"}
+        data = client.post("/generate", json=payload).json()
+        assert data["queue_position"] == 1 and not data["coalesced"]
+        # An identical submission shares the queued job.
+        assert client.post("/generate", json=payload).json()["document_id"] == data["document_id"]
+        status = client.get(f"/document/{data['document_id']}/status").json()
+        assert status["status"] == "queued" and status["queue_position"] == 1
+        job = queue.claim("test-worker")
+        queue.fail(job.job_id, "agent failed")
+        status = client.get(f"/document/{data['document_id']}/status").json()
+        assert status["status"] == "failed" and status["error"] == "agent failed"
+
+def test_patch_document_regenerates_only_affected_sections(monkeypatch):
+    """
+    Test that changing the meeting date only re-runs the header agent, and that the other sections are reused.
+    """
+    import asyncio
+    import time
+    from app.utils import ai_clients
+    _patch_agents(monkeypatch)
+    stub = ai_clients.generate_content
+    prompts = []
+    async def counting_generate(system_prompt, user_prompt):
+        prompts.append(user_prompt)
+        if "May 15, 2025" in user_prompt:
+            # Keep the first regeneration running while a second PATCH arrives.
+            await asyncio.sleep(0.3)
+        return await stub(system_prompt, user_prompt)
+    monkeypatch.setattr(ai_clients, "generate_content", counting_generate)
+    with TestClient(app) as client:
+        payload = {"project_name": "Patch Project", "project_type": "Commercial", "meeting_date": "2025-04-01"}
+        doc_id = client.post("/generate", json=payload, params={"coalesce": False}).json()["document_id"]
+        deadline = time.monotonic() + 5
+        while client.get(f"/document/{doc_id}").status_code == 202 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        original = client.get(f"/document/{doc_id}")
+        assert len(prompts) == 4
+        response = client.patch(f"/document/{doc_id}", json={"meeting_date": "2025-05-15"})
+        assert response.status_code == 202
+        data = response.json()
+        assert data["regenerated"] == ["header_content"]
+        assert set(data["reused"]) == {"zoning_content", "commercial_standards_content", "general_standards_content"}
+        # The document is pending until the regeneration is done, and a second PATCH meanwhile is rejected.
+        assert client.patch(f"/document/{doc_id}", json={"location": "Elsewhere"}).status_code == 409
+        updated = client.get(f"/document/{doc_id}", params={"wait": 5})
+        assert "May 15, 2025" in updated.text and updated.headers["etag"] != original.headers["etag"]
+        # Only the header prompt was sent again.
+        assert len(prompts) == 5 and "May 15, 2025" in prompts[-1]
+        # Changing the project type affects every section; the commercial standards need no agent for Residential.
+        data = client.patch(f"/document/{doc_id}", json={"project_type": "Residential"}).json()
+        assert data["reused"] == []
+        assert set(data["regenerated"]) == {"header_content", "zoning_content", "general_standards_content"}
+        assert "No commercial-specific standards" in client.get(f"/document/{doc_id}", params={"wait": 5}).text
+        assert client.patch("/document/unknown", json={}).status_code == 404
+
+def test_request_fields_are_escaped(monkeypatch):
+    """
+    Test that markup in the request fields is escaped in the generated, streamed and patched documents.
+    """
+    import time
+    _patch_agents(monkeypatch)
+    with TestClient(app) as client:
+        payload = {"project_name": "<script>alert(1)</script>", "project_type": "Residential"}
+        doc_id = client.post("/generate", json=payload, params={"coalesce": False}).json()["document_id"]
+        deadline = time.monotonic() + 5
+        while client.get(f"/document/{doc_id}").status_code == 202 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        document = client.get(f"/document/{doc_id}").text
+        assert "<script" not in document and "&lt;script&gt;alert(1)&lt;/script&gt;" in document
+        with client.stream("POST", "/generate/stream", json=payload) as response:
+            assert "<script" not in "".join(response.iter_text())
+        assert client.patch(f"/document/{doc_id}", json={"location": "<img src=x onerror=alert(1)>"}).status_code == 202
+        document = client.get(f"/document/{doc_id}", params={"wait": 5}).text
+        assert "<img" not in document and "&lt;img src=x onerror=alert(1)&gt;" in document
+
+def test_long_poll_and_callback(monkeypatch):
+    """
+    Test that GET /document?wait= blocks until the document is ready and that the callback URL is notified.
+    """
+    import asyncio
+    from app.services import notifications, orchestrator
+    async def slow_generate(request):
+        await asyncio.sleep(0.3)
+        return "<html><body>Waited</body></html>"
+    delivered = []
+    async def record_webhook(url, payload, max_attempts=None):
+        delivered.append((url, payload))
+        return True
+    monkeypatch.setattr(orchestrator, "generate_document", slow_generate)
+    monkeypatch.setattr(notifications, "deliver_webhook", record_webhook)
+    monkeypatch.setattr(notifications, "WEBHOOK_ALLOWED_HOSTS", ("client.test",))
+    with TestClient(app) as client:
+        payload = {"project_name": "Long Poll Project", "callback_url": "http://client.test/hook"}
+        data = client.post("/generate", json=payload, params={"coalesce": False}).json()
+        doc_id = data["document_id"]
+        # A short wait expires while the document is still being generated.
+        assert client.get(f"/document/{doc_id}", params={"wait": 0.01}).status_code == 202
+        response = client.get(f"/document/{doc_id}", params={"wait": 5})
+        assert response.status_code == 200 and "Waited" in response.text
+        assert delivered == [("http://client.test/hook",
+                              {"document_id": doc_id, "status": "ready", "request_hash": data["request_hash"]})]
+        assert client.post("/generate", json={**payload, "callback_url": "ftp://x"}).status_code == 422
+        # Only allow-listed hosts receive webhooks.
+        assert client.post("/generate", json={**payload, "callback_url": "http://other.test/hook"}).status_code == 422
+
+def test_callback_urls_to_internal_hosts_are_rejected(monkeypatch):
+    """
+    Test that callback URLs resolving to loopback, private or link-local addresses are rejected,
+    both when the request arrives and when a webhook would be sent.
+    """
+    import asyncio
+    from app.services import notifications
+    monkeypatch.setattr(notifications, "WEBHOOK_ALLOWED_HOSTS", ())
+    internal = ["http://127.0.0.1:8000/hook", "http://localhost/hook", "http://10.0.0.5/hook",
+                "http://192.168.1.10/hook", "http://169.254.169.254/latest/meta-data", "http://[::1]/hook"]
+    with TestClient(app) as client:
+        for url in internal:
+            response = client.post("/generate", json={"project_name": "SSRF Project", "callback_url": url})
+            assert response.status_code == 422, url
+        body = '{"project_name": "SSRF Batch", "callback_url": "http://169.254.169.254/latest"}\n'
+        lines = client.post("/generate/batch", content=body).text.splitlines()
+        assert '"status": "invalid"' in lines[0] and '"invalid": 1' in lines[-1]
+    assert not asyncio.run(notifications.deliver_webhook("http://10.0.0.5/hook", {"document_id": "doc"}))
+
+def test_failed_generation_is_reported(monkeypatch):
+    """
+    Test that a document whose generation raised is marked failed instead of staying pending forever.
+    """
+    from app.services import orchestrator
+    async def failing_generate(request):
+        raise RuntimeError("template missing")
+    monkeypatch.setattr(orchestrator, "generate_document", failing_generate)
+    with TestClient(app) as client:
+        data = client.post("/generate", json={"project_name": "Failing Project"}, params={"coalesce": False}).json()
+        response = client.get(f"/document/{data['document_id']}", params={"wait": 5})
+        assert response.status_code == 500
+        assert response.json()["status"] == "failed" and response.json()["error"] == "template missing"
+        status = client.get(f"/document/{data['document_id']}/status").json()
+        assert status["status"] == "failed"
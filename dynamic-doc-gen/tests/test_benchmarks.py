@@ -0,0 +1,68 @@
+import json
+from fastapi.testclient import TestClient
+from benchmarks.fake_llm import FakeLLMConfig, create_app
+from benchmarks.results import percentile, summarize
+
+def test_fake_llm_answers_like_chat_completions():
+    """
+    Test that the fake LLM returns OpenAI-shaped completions of the configured size (capped by max_tokens),
+    including JSON mode.
+    """
+    client = TestClient(create_app(FakeLLMConfig(latency_ms=0, latency_dist="constant", response_chars=300)))
+    messages = [{"role": "system", "content": "Writer"}, {"role": "user", "content": "Write the zoning section"}]
+    response = client.post("/v1/chat/completions", json={"model": "fake", "messages": messages})
+    assert response.status_code == 200
+    data = response.json()
+    content = data["choices"][0]["message"]["content"]
+    assert content.startswith("<p>") and 290 <= len(content) <= 310
+    assert data["usage"]["total_tokens"] == data["usage"]["prompt_tokens"] + data["usage"]["completion_tokens"]
+    # max_tokens caps the output (about four characters per token).
+    response = client.post("/v1/chat/completions", json={"model": "fake", "messages": messages, "max_tokens": 25})
+    assert response.json()["usage"]["completion_tokens"] <= 25
+    # JSON mode answers with the keys listed in the consolidated prompt.
+    messages[1]["content"] = 'Return a JSON object:\n- "header_content": intro\n- "zoning_content": zoning'
+    response = client.post("/v1/chat/completions", json={
+        "model": "fake", "messages": messages, "response_format": {"type": "json_object"},
+    })
+    assert set(json.loads(response.json()["choices"][0]["message"]["content"])) == {"header_content", "zoning_content"}
+
+def test_fake_llm_injects_errors():
+    """
+    Test that the configured error rate and status are applied.
+    """
+    client = TestClient(create_app(FakeLLMConfig(latency_ms=0, error_rate=1.0, error_status=429)))
+    response = client.post("/v1/chat/completions", json={"model": "fake", "messages": []})
+    assert response.status_code == 429
+    assert client.get("/stats").json()["errors"] == 1
+
+def test_percentiles():
+    """
+    Test the interpolated percentiles used in benchmark reports.
+    """
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 0.5) == 50.5
+    assert round(percentile(values, 0.99), 2) == 99.01
+    assert percentile([], 0.5) is None
+    assert summarize([2.0, 4.0])["mean"] == 3.0
+
+def test_load_test_passes_every_fake_llm_option(monkeypatch):
+    """
+    Test that the fake LLM started by the load benchmark gets every option of the shared parser, so the saved
+    configuration describes the server that actually ran.
+    """
+    import argparse
+    from benchmarks import fake_llm, load_test
+    commands = []
+    class DummyProcess:
+        pid = 0
+        def __init__(self, command, **kwargs):
+            commands.append(command)
+    monkeypatch.setattr(load_test.subprocess, "Popen", DummyProcess)
+    monkeypatch.setattr(load_test, "_wait_until_up", lambda url, process: None)
+    parser = argparse.ArgumentParser()
+    fake_llm.add_arguments(parser)
+    args = parser.parse_args(["--latency-ms", "40", "--ms-per-token", "5", "--error-rate", "0.1", "--seed", "7"])
+    args.cache = False
+    load_test.start_servers(args)
+    llm_args = parser.parse_args(commands[0][commands[0].index("--port") + 2:])
+    assert fake_llm.config_from_args(llm_args) == fake_llm.config_from_args(args)
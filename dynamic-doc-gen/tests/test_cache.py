@@ -0,0 +1,91 @@
+import pytest
+import threading
+import time
+from types import SimpleNamespace
+from app.utils import ai_clients
+from app.utils.cache import MemoryCache, SQLiteCache, ResponseCache, make_cache_key
+
+def test_cache_key_depends_on_all_inputs():
+    """
+    Test that the cache key changes whenever the model, prompts or parameters change.
+    """
+    base = make_cache_key("m", "sys", "user", {"temperature": 0.2})
+    assert base == make_cache_key("m", "sys", "user", {"temperature": 0.2})
+    assert base != make_cache_key("other", "sys", "user", {"temperature": 0.2})
+    assert base != make_cache_key("m", "sys2", "user", {"temperature": 0.2})
+    assert base != make_cache_key("m", "sys", "user2", {"temperature": 0.2})
+    assert base != make_cache_key("m", "sys", "user", {"temperature": 0.7})
+
+def test_memory_cache_lru_and_ttl(monkeypatch):
+    """
+    Test that the memory tier evicts the least recently used entry and expires old entries.
+    """
+    cache = MemoryCache(max_entries=2, ttl=10)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    # Touch "a" so that "b" becomes the least recently used entry.
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    # Advance the clock past the TTL.
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+
+def test_persistent_tier_survives_restart(tmp_path):
+    """
+    Test that entries written to the SQLite tier are visible to a new cache instance.
+    """
+    path = str(tmp_path / "llm_cache.sqlite")
+    first = ResponseCache(MemoryCache(), SQLiteCache(path))
+    first.set("key", "<p>cached</p>")
+    first.persistent.close()
+    second = ResponseCache(MemoryCache(), SQLiteCache(path))
+    assert second.get("key") == "<p>cached</p>"
+    assert second.stats["persistent_hits"] == 1
+    # The value is promoted to memory, so the next lookup does not touch disk.
+    assert second.get("key") == "<p>cached</p>"
+    assert second.stats["memory_hits"] == 1
+
+@pytest.mark.asyncio
+async def test_async_access_keeps_disk_off_the_event_loop(tmp_path, monkeypatch):
+    """
+    Test that get_async/set_async reach the SQLite tier from a worker thread, not the event loop thread.
+    """
+    persistent = SQLiteCache(str(tmp_path / "llm_cache.sqlite"))
+    threads = []
+    for name in ("get", "set"):
+        method = getattr(persistent, name)
+        def spy(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+        monkeypatch.setattr(persistent, name, spy)
+    cache = ResponseCache(MemoryCache(max_entries=0), persistent)
+    await cache.set_async("key", "<p>cached</p>")
+    assert await cache.get_async("key") == "<p>cached</p>"
+    assert cache.stats["persistent_hits"] == 1
+    assert len(threads) == 2 and threading.get_ident() not in threads
+    persistent.close()
+
+@pytest.mark.asyncio
+async def test_generate_content_uses_cache(monkeypatch):
+    """
+    Test that identical prompts only reach the API once and that use_cache=False bypasses the cache.
+    """
+    calls = []
+    class DummyClient:
+        async def complete(self, model, messages, deadline=None, **params):
+            calls.append(messages)
+            message = SimpleNamespace(content=f"<p>answer {len(calls)}</p>\n")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+    monkeypatch.setattr(ai_clients, "get_client", lambda: DummyClient())
+    monkeypatch.setattr(ai_clients, "response_cache", ResponseCache(MemoryCache()))
+    first = await ai_clients.generate_content("sys", "user")
+    second = await ai_clients.generate_content("sys", "user")
+    assert first == second == "<p>answer 1</p>"
+    assert len(calls) == 1
+    fresh = await ai_clients.generate_content("sys", "user", use_cache=False)
+    assert fresh == "<p>answer 2</p>"
+    stats = ai_clients.response_cache.stats
+    assert stats["memory_hits"] == 1 and stats["misses"] == 1 and stats["bypassed"] == 1
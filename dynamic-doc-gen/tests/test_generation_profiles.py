@@ -0,0 +1,81 @@
+import pytest
+from app.models.request_models import DocumentRequest
+from app.services.generation_profiles import ProfileConfig
+
+def test_profile_resolution_order(monkeypatch):
+    """
+    Test that defaults, section and template assignments from the config file, and environment variables
+    override each other in that order, and that invalid configurations are rejected.
+    """
+    config = ProfileConfig({
+        "profiles": {"fast": {"model": "fast-model", "max_tokens": 200, "latency_slo": 3}},
+        "sections": {"header_content": "fast", "zoning_content": {"temperature": 0.2}},
+        "templates": {"brief": {"zoning_content": "fast"}},
+    })
+    header = config.resolve("header_content", "base_document")
+    assert (header.name, header.model, header.max_tokens, header.latency_slo) == ("fast", "fast-model", 200, 3)
+    zoning = config.resolve("zoning_content", "base_document")
+    assert (zoning.name, zoning.max_tokens, zoning.temperature) == ("zoning_content", 1000, 0.2)
+    assert config.resolve("zoning_content", "brief").name == "fast"
+    assert config.resolve("general_standards_content", "base_document").params == {"max_tokens": 1000}
+    monkeypatch.setenv("SECTION_MAX_TOKENS_HEADER_CONTENT", "120")
+    header = config.resolve("header_content", "base_document")
+    assert (header.name, header.model, header.max_tokens) == ("header_content", "fast-model", 120)
+    with pytest.raises(ValueError):
+        ProfileConfig({"sections": {"header_content": "missing"}})
+    with pytest.raises(ValueError):
+        ProfileConfig({"profiles": {"fast": {"max_token": 100}}})
+
+@pytest.mark.asyncio
+async def test_profiles_are_applied_and_measured(monkeypatch):
+    """
+    Test that each section's completion uses its profile's model and output budget, and that the realized
+    latency and tokens are reported per profile against the latency SLO.
+    """
+    from app.services import generation_profiles, orchestrator
+    from app.utils import ai_clients
+    calls = {}
+    async def fake_completion(model, system_prompt, user_prompt, deadline, params):
+        calls[system_prompt] = (model, params)
+        ai_clients._record_usage(calls=1, prompt_tokens=40, completion_tokens=10)
+        return "<p>Profiled</p>"
+    monkeypatch.setattr(ai_clients, "_request_completion", fake_completion)
+    monkeypatch.setenv("SECTION_MODEL_HEADER_CONTENT", "fast-model")
+    generation_profiles.profile_stats.reset()
+    req = DocumentRequest(project_name="Profiles", project_type="Profiled Campus", location="Budget Road")
+    await orchestrator.generate_document(req)
+    header = next(value for prompt, value in calls.items() if "introduction" in prompt)
+    zoning = next(value for prompt, value in calls.items() if "zoning" in prompt.lower())
+    assert header == ("fast-model", {"max_tokens": 300})
+    assert zoning == (ai_clients.OPENAI_MODEL, {"max_tokens": 1000})
+    summary = generation_profiles.profile_stats.summary()
+    assert summary["header_content"]["model"] == "fast-model"
+    assert summary["header_content"]["sections"] == ["header_content"]
+    assert summary["header_content"]["completion_tokens_per_generation"] == 10
+    assert summary["zoning_content"]["within_slo"] == 1.0 and summary["zoning_content"]["meets_slo"]
+
+@pytest.mark.asyncio
+async def test_sections_of_another_profile_are_not_reused(monkeypatch):
+    """
+    Test that incremental regeneration and the stale section store do not reuse sections generated
+    under different generation settings.
+    """
+    from app.services import orchestrator
+    from app.services.section_registry import registry
+    from app.services.section_store import section_store
+    from app.utils import ai_clients
+    async def fake_completion(model, system_prompt, user_prompt, deadline, params):
+        return "<p>Profiled</p>"
+    monkeypatch.setattr(ai_clients, "_request_completion", fake_completion)
+    req = DocumentRequest(project_name="Reuse", project_type="Profile Reuse Park", location="Budget Road")
+    await orchestrator.generate_document(req)
+    reused, regenerated = orchestrator.plan_regeneration(req, req)
+    assert regenerated == [] and "zoning_content" in reused
+    zoning = orchestrator.generation_profiles.resolve("zoning_content", orchestrator.DOCUMENT_TEMPLATE)
+    fields = registry.inputs("zoning_content")
+    assert section_store.load_section("zoning_content", req, fields, zoning.fingerprint) == "<p>Profiled</p>"
+    monkeypatch.setenv("SECTION_MAX_TOKENS_ZONING_CONTENT", "200")
+    reused, regenerated = orchestrator.plan_regeneration(req, req)
+    assert regenerated == ["zoning_content"] and "zoning_content" not in reused and "header_content" in reused
+    zoning = orchestrator.generation_profiles.resolve("zoning_content", orchestrator.DOCUMENT_TEMPLATE)
+    assert section_store.load_section("zoning_content", req, fields, zoning.fingerprint) is None
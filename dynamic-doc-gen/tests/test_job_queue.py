@@ -0,0 +1,144 @@
+import pytest
+import asyncio
+import time
+from app.models.request_models import DocumentRequest
+from app.services.job_queue import DONE, FAILED, SQLiteJobQueue
+from app.services.result_store import MemoryResultStore
+from app.services.scheduler import QueueFullError
+from app import worker
+
+def _request(name: str) -> DocumentRequest:
+    return DocumentRequest(project_name=name, project_type="Residential")
+
+def test_queue_orders_claims_and_survives_reopening(tmp_path):
+    """
+    Test priority ordering, queue positions and that queued jobs persist across connections.
+    """
+    path = str(tmp_path / "jobs.sqlite")
+    queue = SQLiteJobQueue(path, max_queue=2)
+    assert queue.submit("low", _request("Low")) == 1
+    assert queue.submit("high", _request("High"), priority=5) == 1
+    assert queue.position("low") == 2
+    with pytest.raises(QueueFullError):
+        queue.submit("overflow", _request("Overflow"))
+    queue.close()
+    # A second process (here: a second connection) sees the same queue.
+    queue = SQLiteJobQueue(path)
+    job = queue.claim("worker-1")
+    assert job.job_id == "high" and job.request.project_name == "High" and job.attempts == 1
+    assert queue.position("high") == 0 and queue.running_count == 1
+    assert queue.find_active(_request("Low").request_hash()) == "low"
+    assert queue.find_active(_request("Low").request_hash(), "consolidated") is None
+    queue.fail("high", "boom")
+    assert queue.status("high") == FAILED and queue.error("high") == "boom"
+    assert queue.claim("worker-1").job_id == "low"
+    assert queue.claim("worker-1") is None
+    queue.close()
+
+def test_abandoned_jobs_are_requeued_then_failed(tmp_path):
+    """
+    Test that a job whose worker disappeared is handed out again until max_attempts is reached.
+    """
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite"), lease_seconds=0, max_attempts=2)
+    queue.submit("job", _request("Crashy"))
+    queue.claim("dead-worker")
+    assert queue.requeue_stale() == (1, [])
+    assert queue.claim("worker-2").attempts == 2
+    assert queue.requeue_stale() == (0, [("job", _request("Crashy"))])
+    assert queue.status("job") == FAILED
+    queue.close()
+
+@pytest.mark.asyncio
+async def test_running_jobs_renew_their_lease(tmp_path, monkeypatch):
+    """
+    Test that a worker renews the lease of a long job, and that a worker that lost its lease
+    can no longer finish the job.
+    """
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite"), lease_seconds=0.3)
+    store = MemoryResultStore()
+    async def slow_generate(request):
+        await asyncio.sleep(0.6)
+        return "<html>Slow</html>"
+    monkeypatch.setattr(worker.orchestrator, "generate_document", slow_generate)
+    store.create("slow")
+    queue.submit("slow", _request("Slow"))
+    running = asyncio.create_task(worker.run_job(queue, store, "worker-1"))
+    await asyncio.sleep(0.45)
+    # The lease was renewed, so the running job is not considered abandoned.
+    assert queue.requeue_stale() == (0, [])
+    assert await running and queue.status("slow") == DONE and store.get("slow").ready
+    queue.submit("stolen", _request("Stolen"))
+    job = queue.claim("worker-1")
+    time.sleep(0.35)
+    queue.requeue_stale()
+    assert queue.claim("worker-2").job_id == "stolen"
+    assert not queue.renew("stolen", "worker-1") and not queue.complete("stolen", worker=job.worker)
+    assert queue.complete("stolen", worker="worker-2") and queue.status("stolen") == DONE
+    queue.close()
+
+@pytest.mark.asyncio
+async def test_worker_runs_jobs_into_the_result_store(tmp_path, monkeypatch):
+    """
+    Test that a worker claims queued jobs, stores the documents and records failures.
+    """
+    async def dummy_generate(request):
+        if request.project_name == "Broken":
+            raise RuntimeError("agent failed")
+        return f"<html>{request.project_name}</html>"
+    monkeypatch.setattr(worker.orchestrator, "generate_document", dummy_generate)
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite"))
+    store = MemoryResultStore()
+    for doc_id, name in (("a", "Alpha"), ("b", "Broken")):
+        store.create(doc_id)
+        queue.submit(doc_id, _request(name))
+    stop = asyncio.Event()
+    running = asyncio.create_task(worker.run_worker(queue, store, concurrency=2, stop=stop, poll_interval=0.01))
+    deadline = time.monotonic() + 5
+    while (queue.queue_length or queue.running_count) and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    stop.set()
+    await running
+    assert store.get("a").html == "<html>Alpha</html>" and queue.status("a") == DONE
+    assert queue.status("b") == FAILED and queue.error("b") == "agent failed"
+    queue.close()
+
+@pytest.mark.asyncio
+async def test_worker_reports_jobs_failed_by_lease_expiry(tmp_path, monkeypatch):
+    """
+    Test that a job failed for running out of attempts is failed in the result store and its callback notified.
+    """
+    finished = []
+    monkeypatch.setattr(worker.notifications, "document_finished", lambda *args: finished.append(args))
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite"), lease_seconds=0, max_attempts=1)
+    store = MemoryResultStore()
+    store.create("job")
+    request = _request("Crashy").model_copy(update={"callback_url": "https://example.com/hook"})
+    queue.submit("job", request)
+    queue.claim("dead-worker")
+    stop = asyncio.Event()
+    running = asyncio.create_task(worker.run_worker(queue, store, concurrency=1, stop=stop, poll_interval=0.01))
+    await asyncio.sleep(0.05)
+    stop.set()
+    await running
+    assert queue.status("job") == FAILED and store.get("job").failed
+    assert store.get("job").error == "Worker lease expired"
+    assert finished == [("job", request.request_hash(), "failed", "Worker lease expired", "https://example.com/hook")]
+    queue.close()
+
+def test_section_store_is_shared_between_processes(tmp_path, monkeypatch):
+    """
+    Test that with SECTION_STORE_PATH, a store sees requests and sections another process saved or updated later.
+    """
+    from app.services.section_store import create_section_store
+    monkeypatch.setenv("SECTION_STORE_PATH", str(tmp_path / "sections.sqlite"))
+    first, second = create_section_store(), create_section_store()
+    assert first.shared and second.shared
+    request = _request("Shared")
+    first.save_request("doc", request)
+    assert second.load_request("doc") == request
+    # An update made by one process must not be hidden by what the other process read before.
+    changed = request.model_copy(update={"project_name": "Changed"})
+    second.save_request("doc", changed)
+    assert first.load_request("doc") == changed
+    first.save_sections(request, {"zoning_content": "<p>Zoning</p>"}, {"zoning_content": "fresh"})
+    assert second.load_statuses(request) == {"zoning_content": "fresh"}
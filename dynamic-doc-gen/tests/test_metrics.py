@@ -0,0 +1,48 @@
+import asyncio
+from app.utils import metrics
+
+def test_histogram_renders_cumulative_buckets():
+    """
+    Test that histogram samples are cumulative and rendered in the Prometheus text format.
+    """
+    registry = metrics.Registry()
+    histogram = registry.histogram("test_duration_seconds", "Test durations", ("stage",))
+    histogram.observe(0.003, stage="llm")
+    histogram.observe(0.2, stage="llm")
+    text = registry.render()
+    assert "# TYPE test_duration_seconds histogram" in text
+    assert 'test_duration_seconds_bucket{stage="llm",le="0.001"} 0.0' in text
+    assert 'test_duration_seconds_bucket{stage="llm",le="0.005"} 1.0' in text
+    assert 'test_duration_seconds_bucket{stage="llm",le="+Inf"} 2.0' in text
+    assert 'test_duration_seconds_count{stage="llm"} 2.0' in text
+
+def test_spans_are_tagged_with_the_document():
+    """
+    Test that spans recorded in tasks started inside a document context land in that document's breakdown.
+    """
+    async def agent(slot):
+        with metrics.span("test_agent", section=slot):
+            await asyncio.sleep(0)
+
+    async def generate():
+        with metrics.document_context("doc-metrics-test"):
+            await asyncio.gather(asyncio.create_task(agent("a")), asyncio.create_task(agent("b")))
+
+    asyncio.run(generate())
+    timings = metrics.document_timings("doc-metrics-test")
+    assert sorted(span["section"] for span in timings) == ["a", "b"]
+    assert all(span["stage"] == "test_agent" and span["seconds"] >= 0 for span in timings)
+    assert metrics.stage_duration.count(stage="test_agent", section="a") >= 1
+    assert metrics.document_timings("unknown-document") == []
+
+def test_disabled_metrics_are_noops(monkeypatch):
+    """
+    Test that nothing is recorded when metrics are disabled.
+    """
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    counter = metrics.Counter("test_total", "Test counter")
+    counter.inc()
+    with metrics.span("disabled_stage"):
+        pass
+    assert counter.value() == 0
+    assert metrics.stage_duration.count(stage="disabled_stage") == 0
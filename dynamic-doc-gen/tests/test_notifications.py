@@ -0,0 +1,46 @@
+import pytest
+import asyncio
+import httpx
+from app.services import notifications
+from app.services.notifications import CompletionEvents
+
+@pytest.mark.asyncio
+async def test_waiters_share_one_event():
+    """
+    Test that all waiters of a document share one event, wake on notify, and leave nothing behind.
+    """
+    events = CompletionEvents()
+    waiters = [asyncio.create_task(events.wait("doc", timeout=5)) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert len(events) == 1
+    events.notify("doc")
+    assert await asyncio.gather(*waiters) == [True, True, True]
+    assert len(events) == 0
+    # A timed-out waiter cleans up as well.
+    assert await events.wait("other", timeout=0.01) is False
+    assert len(events) == 0
+
+@pytest.mark.asyncio
+async def test_webhook_is_retried_until_accepted(monkeypatch):
+    """
+    Test that failed webhook deliveries are retried and that client errors are not.
+    """
+    answers = [503, 500, 200]
+    received = []
+    def handler(request):
+        received.append(request.read())
+        return httpx.Response(answers.pop(0))
+    client_class = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **kwargs: client_class(transport=httpx.MockTransport(handler), **kwargs))
+    monkeypatch.setattr(notifications, "WEBHOOK_BACKOFF", 0.001)
+    monkeypatch.setattr(notifications, "WEBHOOK_ALLOWED_HOSTS", ("client.test",))
+    assert await notifications.deliver_webhook("http://client.test/hook", {"document_id": "doc"}, max_attempts=5)
+    assert len(received) == 3 and b'"document_id":"doc"' in received[0].replace(b" ", b"")
+    answers[:] = [404, 200]
+    assert not await notifications.deliver_webhook("http://client.test/hook", {"document_id": "doc"}, max_attempts=5)
+    assert answers == [200]
+    # A non-positive WEBHOOK_MAX_ATTEMPTS still makes one attempt.
+    monkeypatch.setattr(notifications, "WEBHOOK_MAX_ATTEMPTS", 0)
+    answers[:] = [503, 200]
+    assert not await notifications.deliver_webhook("http://client.test/hook", {"document_id": "doc"})
+    assert answers == [200]
@@ -0,0 +1,70 @@
+import time
+from app.services.result_store import MemoryResultStore, SQLiteResultStore
+
+def test_memory_store_lifecycle():
+    """
+    Test that a document moves from pending to ready and is stored compressed with an ETag.
+    """
+    store = MemoryResultStore()
+    store.create("doc")
+    assert "doc" in store and not store.get("doc").ready
+    html = "<html><body>" + "<p>Repeated content</p>" * 200 + "</body></html>"
+    store.put("doc", html)
+    entry = store.get("doc")
+    assert entry.ready and entry.html == html
+    assert len(entry.compressed) < len(html) // 5
+    assert entry.etag.startswith('"') and store.total_bytes == len(entry.compressed)
+    store.delete("doc")
+    assert "doc" not in store and store.total_bytes == 0
+
+def test_memory_store_evicts_by_count_and_bytes():
+    """
+    Test LRU eviction by entry count and by total compressed size, keeping pending entries.
+    """
+    store = MemoryResultStore(max_items=2)
+    store.create("pending")
+    store.put("a", "<p>a</p>")
+    store.put("b", "<p>b</p>")
+    # The pending document is never evicted; the least recently used finished one is.
+    assert "pending" in store and "a" not in store and "b" in store
+    sized = MemoryResultStore(max_items=100, max_bytes=1)
+    sized.put("x", "<p>x</p>")
+    assert "x" not in sized and sized.total_bytes == 0
+
+def test_memory_store_ttl(monkeypatch):
+    """
+    Test that documents expire after the TTL.
+    """
+    store = MemoryResultStore(ttl=60)
+    store.put("doc", "<p>doc</p>")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert store.get("doc") is None
+
+def test_sqlite_store_persists(tmp_path):
+    """
+    Test that the SQLite backend keeps documents across store instances.
+    """
+    path = str(tmp_path / "results.sqlite")
+    store = SQLiteResultStore(path)
+    store.create("doc")
+    assert not store.get("doc").ready
+    store.put("doc", "<p>persisted</p>")
+    etag = store.get("doc").etag
+    store.close()
+    reopened = SQLiteResultStore(path)
+    entry = reopened.get("doc")
+    assert entry.ready and entry.html == "<p>persisted</p>" and entry.etag == etag
+    reopened.delete("doc")
+    assert "doc" not in reopened
+
+def test_failed_documents(tmp_path):
+    """
+    Test that both backends keep failed documents with their error message.
+    """
+    for store in (MemoryResultStore(), SQLiteResultStore(str(tmp_path / "results.sqlite"))):
+        store.create("doc")
+        store.fail("doc", "agent failed")
+        entry = store.get("doc")
+        assert entry.failed and not entry.ready and entry.error == "agent failed"
+        store.close()
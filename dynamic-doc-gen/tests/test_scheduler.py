@@ -0,0 +1,59 @@
+import pytest
+import asyncio
+import time
+from app.services.scheduler import JobScheduler, QueueFullError
+from app.utils.rate_limit import LLMRateLimiter, TokenBucket
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_concurrency_and_orders_by_priority():
+    """
+    Test that at most max_concurrent jobs run at once and higher priority jobs start first.
+    """
+    scheduler = JobScheduler(max_concurrent=1, max_queue=10)
+    release = asyncio.Event()
+    started = []
+    def job(name):
+        async def run():
+            started.append(name)
+            await release.wait()
+        return run
+    scheduler.submit("blocker", job("blocker"))
+    await asyncio.sleep(0)
+    assert scheduler.status("blocker") == "running"
+    scheduler.submit("low", job("low"), priority=0)
+    scheduler.submit("high", job("high"), priority=5)
+    # The high priority job is first in line even though it was submitted last.
+    assert scheduler.position("high") == 1 and scheduler.position("low") == 2
+    release.set()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert started == ["blocker", "high", "low"]
+    await scheduler.stop()
+
+@pytest.mark.asyncio
+async def test_scheduler_rejects_when_queue_full():
+    """
+    Test that submissions beyond the queue capacity raise QueueFullError with a Retry-After hint.
+    """
+    scheduler = JobScheduler(max_concurrent=1, max_queue=1)
+    never = asyncio.Event()
+    scheduler.submit("running", never.wait)
+    await asyncio.sleep(0)
+    scheduler.submit("queued", never.wait)
+    with pytest.raises(QueueFullError) as excinfo:
+        scheduler.submit("rejected", never.wait)
+    assert excinfo.value.retry_after >= 1
+    await scheduler.stop()
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill(monkeypatch):
+    """
+    Test that the token bucket blocks once its capacity is used and refills over time.
+    """
+    bucket = TokenBucket(rate_per_minute=600)  # 10 tokens per second, capacity 600
+    assert await bucket.acquire(600) == 0
+    start = time.monotonic()
+    waited = await bucket.acquire(1)
+    assert waited > 0 and time.monotonic() - start >= 0.09
+    limiter = LLMRateLimiter(requests_per_minute=0, tokens_per_minute=0)
+    assert not limiter.enabled and await limiter.acquire(10_000) == 0
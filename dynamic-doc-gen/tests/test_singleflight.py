@@ -0,0 +1,67 @@
+import pytest
+import asyncio
+from datetime import date
+from app.models.request_models import DocumentRequest
+from app.utils.singleflight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    """
+    Test that concurrent calls with the same key run the work once and all receive its result.
+    """
+    flights = SingleFlight()
+    runs = []
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+    results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+    assert results == ["result"] * 5 and len(runs) == 1
+    assert flights.stats == {"leaders": 1, "coalesced": 4}
+    assert not flights.in_flight("key")
+    # Once finished, the next call runs the work again.
+    await flights.do("key", work)
+    assert len(runs) == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_work():
+    """
+    Test that cancelling one waiter leaves the shared call running for the others.
+    """
+    flights = SingleFlight()
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+    first = asyncio.create_task(flights.do("key", work))
+    second = asyncio.create_task(flights.do("key", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done"
+
+def test_request_hash_is_canonical():
+    """
+    Test that the request hash only depends on the content fields.
+    """
+    a = DocumentRequest(project_name="P", project_type="Commercial", location="L", meeting_date=date(2025, 1, 2))
+    b = DocumentRequest(meeting_date=date(2025, 1, 2), location="L", project_type="Commercial", project_name="P")
+    c = DocumentRequest(project_name="P", project_type="Commercial", location="L", meeting_date=date(2025, 1, 3))
+    assert a.request_hash() == b.request_hash() != c.request_hash()
+
+@pytest.mark.asyncio
+async def test_identical_llm_calls_are_coalesced(monkeypatch):
+    """
+    Test that concurrent identical completions issue a single API request, even with the cache disabled.
+    """
+    from types import SimpleNamespace
+    from app.utils import ai_clients
+    calls = []
+    class DummyClient:
+        async def complete(self, model, messages, deadline=None, **params):
+            calls.append(messages)
+            await asyncio.sleep(0.01)
+            message = SimpleNamespace(content="<p>standards</p>")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+    monkeypatch.setattr(ai_clients, "get_client", lambda: DummyClient())
+    monkeypatch.setattr(ai_clients, "LLM_CACHE_ENABLED", False)
+    results = await asyncio.gather(*(ai_clients.generate_content("sys", "same prompt") for _ in range(3)))
+    assert results == ["<p>standards</p>"] * 3 and len(calls) == 1
@@ -0,0 +1,47 @@
+import os
+from app.utils.template_engine import CompiledTemplate, TemplateRegistry, get_template
+
+def test_render_is_single_pass():
+    """
+    Test that substituted content containing placeholders is not substituted again.
+    """
+    template = CompiledTemplate.compile("<h1>{{title}}</h1><div>{{body}}</div>")
+    assert template.slots == ["title", "body"]
+    rendered = template.render({"title": "{{body}}", "body": "<p>Body</p>"})
+    assert rendered == "<h1>{{body}}</h1><div><p>Body</p></div>"
+    # Missing values leave the placeholder untouched.
+    assert template.render({"title": "T"}) == "<h1>T</h1><div>{{body}}</div>"
+
+def test_partial_render_keeps_remaining_slots():
+    """
+    Test that a partial render substitutes known fields and keeps the other slots.
+    """
+    template = CompiledTemplate.compile("a{{x}}b{{y}}c{{x}}d")
+    partial = template.partial({"x": "X"})
+    assert partial.slots == ["y"]
+    assert partial.render({"y": "Y"}) == template.render({"x": "X", "y": "Y"}) == "aXbYcXd"
+
+def test_registry_reloads_changed_file(tmp_path):
+    """
+    Test that the registry recompiles a template when its file changes on disk.
+    """
+    path = tmp_path / "doc.html"
+    path.write_text("<p>{{a}}</p>", encoding="utf-8")
+    registry = TemplateRegistry(check_interval=0)
+    registry.register_directory(tmp_path)
+    assert registry.names == ["doc"]
+    first = registry.get("doc")
+    assert registry.get("doc") is first
+    path.write_text("<div>{{b}}</div>", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert registry.get("doc").render({"b": "B"}) == "<div>B</div>"
+
+def test_base_document_slots():
+    """
+    Test that the bundled template exposes the request fields and the dynamic sections.
+    """
+    assert get_template().slot_names == {
+        "project_name", "project_type", "location", "meeting_date",
+        "header_content", "zoning_content", "commercial_standards_content", "general_standards_content",
+    }